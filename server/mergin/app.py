@@ -10,7 +10,6 @@ import wtforms_json
 import gevent
 from marshmallow import fields
 from sqlalchemy.schema import MetaData
-from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask import json, jsonify, request, abort, current_app, Flask, Request, Response
 from flask_login import current_user, LoginManager
@@ -30,6 +29,16 @@ from typing import List, Dict, Optional
 from .sync.utils import get_blacklisted_dirs, get_blacklisted_files
 from .config import Configuration
 from .commands import add_commands
+from .replicas import (
+    RoutingSQLAlchemy,
+    use_replica,
+    replica_binds,
+    pop_written,
+    primary_lsn,
+    set_watermark,
+    LSN_COOKIE,
+    LSN_HEADER,
+)
 
 convention = {
     "ix": "ix_%(column_0_label)s",
@@ -41,7 +50,9 @@ convention = {
 
 wtforms_json.init()
 metadata = MetaData(naming_convention=convention)
-db = SQLAlchemy(metadata=metadata, engine_options={"json_serializer": json.dumps})
+db = RoutingSQLAlchemy(
+    metadata=metadata, engine_options={"json_serializer": json.dumps}
+)
 ma = Marshmallow()
 mail = Mail()
 csrf = CSRFProtect()
@@ -226,6 +237,29 @@ def create_app(public_keys: List[str] = None) -> Flask:
         ):
             abort(503, "Service unavailable due to maintenance, please try later")
 
+    @app.app.before_request
+    def route_to_replica():
+        """Read only requests are served from replica unless it lags behind client's last write"""
+        if request.method not in ["GET", "HEAD"] or not request.endpoint:
+            return
+        view = current_app.view_functions.get(request.endpoint)
+        if view is None or getattr(view, "primary_only", False):
+            return
+        use_replica(request.headers.get(LSN_HEADER) or request.cookies.get(LSN_COOKIE))
+
+    @app.app.after_request
+    def set_write_watermark(response):
+        """Pass primary WAL position after write to client, its next reads wait for replica to catch up"""
+        if (
+            not pop_written()
+            or request.method in ["GET", "HEAD", "OPTIONS"]
+            or response.status_code >= 400
+            or not replica_binds()
+        ):
+            return response
+        set_watermark(response, primary_lsn())
+        return response
+
     # Adjust CSRF policy for API
     def custom_protect():
         if request.path.startswith("/v1/") and "session" not in request.cookies:
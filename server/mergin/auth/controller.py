@@ -37,6 +37,7 @@ from .forms import (
 from ..app import db
 from ..sync.models import Project
 from ..sync.utils import files_size
+from ..utils import paginate
 
 
 EMAIL_CONFIRMATION_EXPIRATION = 12 * 3600
@@ -485,8 +486,7 @@ def get_paginated_users(
     elif not descending and order_by:
         users = users.order_by(asc(User.__table__.c[order_by]))
 
-    result = users.paginate(page, per_page).items
-    total = users.paginate(page, per_page).total
+    result, total = paginate(users, page, per_page)
 
     result_users = UserSchema(many=True).dump(result)
 
@@ -209,3 +209,17 @@ def add_commands(app: Flask):
     def check():
         """Check server configuration."""
         _check_server()
+
+    @server.command("reconcile-usage")
+    def reconcile_usage():  # pylint: disable=W0612
+        """Recalculate storage usage counters of workspaces."""
+        from .sync.models import WorkspaceStorageUsage
+
+        out_of_sync = WorkspaceStorageUsage.reconcile()
+        if out_of_sync:
+            click.secho(
+                f"Usage of workspaces {', '.join(map(str, out_of_sync))} was out of sync and has been updated.",
+                fg="yellow",
+            )
+        else:
+            click.secho("Storage usage is in sync.", fg="green")
@@ -39,6 +39,13 @@ class Configuration(object):
         "SQLALCHEMY_DATABASE_URI",
         f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}?application_name={DB_APPLICATION_NAME}",
     )
+    # optional read replicas (SQLAlchemy URIs) used for read only requests, writes always go to primary
+    DB_REPLICA_URIS = config("DB_REPLICA_URIS", default="", cast=Csv())
+    SQLALCHEMY_BINDS = {f"replica_{i}": uri for i, uri in enumerate(DB_REPLICA_URIS)}
+    # for how long (seconds) client's reads after its write are checked against replica lag
+    DB_REPLICA_WATERMARK_EXPIRATION = config(
+        "DB_REPLICA_WATERMARK_EXPIRATION", default=3600, cast=int
+    )
 
     # for flask mail
     MAIL_SERVER = config("MAIL_SERVER", default="localhost")
@@ -0,0 +1,142 @@
+# Copyright (C) Lutra Consulting Limited
+#
+# SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+
+"""Routing of read only database queries to replicas"""
+
+import logging
+import random
+from typing import List, Optional
+from flask import current_app
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import Select
+
+# session info key with bind key of replica used by session
+REPLICA_KEY = "replica"
+# session info key set once session has written to primary
+WRITE_KEY = "written"
+# watermark of primary database (WAL position) after the last write of client
+LSN_COOKIE = "db_lsn"
+LSN_HEADER = "X-Db-Lsn"
+
+
+class RoutingSession(SignallingSession):
+    """Session which can execute plain SELECT statements on replica.
+
+    Replica is used only if it is set in session info (see use_replica). Flushes, SELECT FOR UPDATE,
+    text statements and bare connections go to primary and the session then stays on primary until it is
+    removed, so that it reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.info.get(REPLICA_KEY)
+        if replica:
+            if (
+                not self._flushing
+                and isinstance(clause, Select)
+                and clause._for_update_arg is None
+            ):
+                return current_app.extensions["sqlalchemy"].db.get_engine(
+                    self.app, bind=replica
+                )
+            self.info.pop(REPLICA_KEY, None)
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def mark_written(session, flush_context):
+    """Remember session has written to primary, so that write watermark is passed to client"""
+    session.info[WRITE_KEY] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def mark_executed(orm_execute_state):
+    """Statements executed directly (e.g. bulk updates) may write to primary as well"""
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[WRITE_KEY] = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy extension using RoutingSession"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def primary_only(f):
+    """Mark view to always read from primary, e.g. when it polls state changed by other processes"""
+    f.primary_only = True
+    return f
+
+
+def replica_binds() -> List[str]:
+    """Bind keys of configured replicas"""
+    return [
+        key
+        for key in current_app.config.get("SQLALCHEMY_BINDS") or {}
+        if key.startswith("replica_")
+    ]
+
+
+def use_replica(lsn: Optional[str] = None) -> bool:
+    """Route read only queries of current session to randomly picked replica.
+
+    If watermark of client's last write is provided, replica is used only if it has already replayed
+    primary WAL up to that position, otherwise queries stay on primary.
+
+    :param lsn: primary WAL position (pg_lsn) the replica needs to have replayed
+    :returns: whether replica is used
+    """
+    db = current_app.extensions["sqlalchemy"].db
+    db.session.info.pop(REPLICA_KEY, None)
+    binds = replica_binds()
+    if not binds:
+        return False
+
+    bind = random.choice(binds)
+    if lsn:
+        try:
+            with db.get_engine(bind=bind).connect() as conn:
+                caught_up = conn.execute(
+                    text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"),
+                    {"lsn": lsn},
+                ).scalar()
+        except SQLAlchemyError as e:
+            logging.warning(f"Unable to check replica {bind} replay position: {e}")
+            caught_up = False
+        if not caught_up:
+            return False
+
+    db.session.info[REPLICA_KEY] = bind
+    return True
+
+
+def pop_written() -> bool:
+    """Whether current session has written to primary since the last call"""
+    db = current_app.extensions["sqlalchemy"].db
+    return db.session.info.pop(WRITE_KEY, False)
+
+
+def set_watermark(response, lsn: str):
+    """Pass primary WAL position of client's write in response, its next reads wait for replica to catch up
+
+    :param response: flask response
+    :param lsn: primary WAL position (pg_lsn)
+    """
+    response.headers[LSN_HEADER] = lsn
+    response.set_cookie(
+        LSN_COOKIE,
+        lsn,
+        max_age=current_app.config["DB_REPLICA_WATERMARK_EXPIRATION"],
+        httponly=True,
+        samesite="Lax",
+    )
+
+
+def primary_lsn() -> str:
+    """Current WAL position of primary database"""
+    db = current_app.extensions["sqlalchemy"].db
+    with db.engine.connect() as conn:
+        return conn.execute(text("SELECT pg_current_wal_lsn()")).scalar()
@@ -11,7 +11,15 @@ from flask import Flask, current_app
 
 from .files import UploadChanges
 from ..app import db
-from .models import Project, ProjectVersion
+from .models import (
+    Project,
+    ProjectVersion,
+    FileHistory,
+    ProjectFilePath,
+    PushChangeType,
+    ProjectVersionManifest,
+)
+from .storages.disk import BlobStore
 from .utils import split_project_path
 from ..auth.models import User
 
@@ -45,7 +53,7 @@ def add_commands(app: Flask):
             name=name,
             workspace=workspace,
             storage_params={
-                "type": "local",
+                "type": current_app.config["STORAGE_TYPE"],
                 "location": os.path.join(secrets.token_hex(1), secrets.token_hex(16)),
             },
         )
@@ -117,3 +125,132 @@ def add_commands(app: Flask):
         project.removed_by = None
         db.session.commit()
         print("Project removed successfully")
+
+    @project.command("migrate-to-blobs")
+    @click.option("--project-name", help="Migrate only single project")
+    def migrate_to_blobs(project_name):  # pylint: disable=W0612
+        """Share files of existing projects through content addressable blob store"""
+        query = Project.query.filter(Project.storage_params.isnot(None))
+        if project_name:
+            ws, name = split_project_path(project_name)
+            workspace = current_app.ws_handler.get_by_name(ws)
+            if not workspace:
+                print("ERROR: Workspace does not exist")
+                return
+            query = query.filter_by(workspace_id=workspace.id, name=name)
+
+        blob_store = BlobStore()
+        shared = 0
+        for project in query.all():
+            history = (
+                db.session.query(FileHistory.location, FileHistory.checksum)
+                .join(ProjectFilePath)
+                .filter(
+                    ProjectFilePath.project_id == project.id,
+                    FileHistory.change != "delete",
+                )
+                .yield_per(1000)
+            )
+            for location, checksum in history:
+                path = os.path.join(project.storage.project_dir, location)
+                if blob_store.add(path, checksum):
+                    shared += 1
+        print(f"Migration finished, {shared} files are shared through blob store")
+
+    @project.command("backfill-diff-summaries")
+    @click.option("--project-name", help="Backfill only single project")
+    def backfill_diff_summaries(project_name):  # pylint: disable=W0612
+        """Calculate geodiff summaries for diff updates in history where they are missing"""
+        query = (
+            db.session.query(FileHistory.id)
+            .join(ProjectFilePath)
+            .join(Project)
+            .filter(
+                Project.storage_params.isnot(None),
+                FileHistory.change == PushChangeType.UPDATE_DIFF.value,
+                FileHistory.diff_summary.is_(None),
+            )
+        )
+        if project_name:
+            ws, name = split_project_path(project_name)
+            workspace = current_app.ws_handler.get_by_name(ws)
+            if not workspace:
+                print("ERROR: Workspace does not exist")
+                return
+            query = query.filter(
+                Project.workspace_id == workspace.id, Project.name == name
+            )
+
+        ids = [row.id for row in query.all()]
+        batch_size = 100
+        for i in range(0, len(ids), batch_size):
+            for item in FileHistory.query.filter(
+                FileHistory.id.in_(ids[i : i + batch_size])
+            ):
+                item.diff_summary = item.calculate_diff_summary()
+            db.session.commit()
+        print(f"Backfill finished, {len(ids)} diff summaries calculated")
+
+    @project.command("backfill-manifests")
+    @click.option("--project-name", help="Backfill only single project")
+    def backfill_manifests(project_name):  # pylint: disable=W0612
+        """Create files manifests for project versions where they are missing"""
+        query = Project.query.filter(Project.storage_params.isnot(None))
+        if project_name:
+            ws, name = split_project_path(project_name)
+            workspace = current_app.ws_handler.get_by_name(ws)
+            if not workspace:
+                print("ERROR: Workspace does not exist")
+                return
+            query = query.filter_by(workspace_id=workspace.id, name=name)
+
+        created = 0
+        for project in query.all():
+            existing = {
+                row.version_id
+                for row in db.session.query(ProjectVersionManifest.version_id)
+                .join(ProjectVersion)
+                .filter(ProjectVersion.project_id == project.id)
+            }
+            versions = (
+                db.session.query(ProjectVersion.id, ProjectVersion.name)
+                .filter_by(project_id=project.id)
+                .order_by(ProjectVersion.name)
+                .all()
+            )
+            if all(v.id in existing for v in versions):
+                continue
+
+            history = (
+                db.session.query(
+                    FileHistory.id,
+                    FileHistory.file_path_id,
+                    FileHistory.change,
+                    FileHistory.project_version_name,
+                )
+                .join(ProjectFilePath)
+                .filter(ProjectFilePath.project_id == project.id)
+                .order_by(FileHistory.project_version_name)
+                .all()
+            )
+            # replay history to get files present in each version
+            files = {}
+            i = 0
+            for version in versions:
+                while (
+                    i < len(history) and history[i].project_version_name <= version.name
+                ):
+                    item = history[i]
+                    if item.change == PushChangeType.DELETE.value:
+                        files.pop(item.file_path_id, None)
+                    else:
+                        files[item.file_path_id] = item.id
+                    i += 1
+                if version.id in existing:
+                    continue
+                manifest = ProjectVersionManifest(list(files.values()))
+                manifest.version_id = version.id
+                db.session.add(manifest)
+                created += 1
+            db.session.commit()
+        print(f"Backfill finished, {created} manifests created")
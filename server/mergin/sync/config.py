@@ -47,8 +47,50 @@ class Configuration(object):
     )
     # trash dir for temp files being cleaned regularly
     TEMP_DIR = config("TEMP_DIR", default=gettempdir())
+    # content addressable store of project files, must be on the same filesystem as LOCAL_PROJECTS
+    BLOB_STORE_DIR = config(
+        "BLOB_STORE_DIR", default=os.path.join(LOCAL_PROJECTS, "blobs")
+    )
+    # cache of versioned files reconstructed from diffs history and its size limit in bytes (0 disables cache),
+    # must be on the same filesystem as LOCAL_PROJECTS to avoid copies
+    RESTORE_CACHE_DIR = config(
+        "RESTORE_CACHE_DIR", default=os.path.join(LOCAL_PROJECTS, "restore_cache")
+    )
+    RESTORE_CACHE_SIZE = config(
+        "RESTORE_CACHE_SIZE", default=10 * 1024 * 1024 * 1024, cast=int
+    )
+    # full copies of versioned files (keyframes) are kept after given number of diffs or their total size
+    # (in bytes) since the last full copy, to bound time needed to restore file history, 0 disables the limit
+    KEYFRAME_DIFFS_COUNT = config("KEYFRAME_DIFFS_COUNT", default=50, cast=int)
+    KEYFRAME_DIFFS_SIZE = config(
+        "KEYFRAME_DIFFS_SIZE", default=50 * 1024 * 1024, cast=int
+    )
+    # storage backend for new projects, either 'local' or 's3' (requires boto3)
+    STORAGE_TYPE = config("STORAGE_TYPE", default="local")
+    # S3 compatible object storage, LOCAL_PROJECTS is then used as local cache and staging area for pushes
+    # (hence it still needs to be shared by app nodes handling pushes)
+    S3_BUCKET = config("S3_BUCKET", default="")
+    S3_ENDPOINT_URL = config("S3_ENDPOINT_URL", default=None)
+    S3_ACCESS_KEY_ID = config("S3_ACCESS_KEY_ID", default=None)
+    S3_SECRET_ACCESS_KEY = config("S3_SECRET_ACCESS_KEY", default=None)
+    S3_REGION = config("S3_REGION", default=None)
+    # size of byte range requested from object storage when file is streamed
+    S3_RANGE_SIZE = config("S3_RANGE_SIZE", default=8 * 1024 * 1024, cast=int)
+    # node local read-through cache of bucket objects and its size limit in bytes (0 for no limit),
+    # must be on the same filesystem as LOCAL_PROJECTS
+    S3_CACHE_DIR = config(
+        "S3_CACHE_DIR", default=os.path.join(LOCAL_PROJECTS, "s3_cache")
+    )
+    S3_CACHE_SIZE = config("S3_CACHE_SIZE", default=10 * 1024 * 1024 * 1024, cast=int)
     # working directory for geodiff actions - should be a fast local storage
     GEODIFF_WORKING_DIR = config(
         "GEODIFF_WORKING_DIR",
         default=os.path.join(LOCAL_PROJECTS, "geodiff_tmp"),
     )
+    # max number of geodiff operations running concurrently in worker processes (per app worker),
+    # 0 runs geodiff directly in app worker
+    GEODIFF_WORKERS = config("GEODIFF_WORKERS", default=2, cast=int)
+    # time limit for single geodiff operation in seconds, 0 for no limit
+    GEODIFF_TIMEOUT = config("GEODIFF_TIMEOUT", default=1800, cast=int)
+    # max number of updated files processed concurrently on push finish, effectively limited by GEODIFF_WORKERS
+    PUSH_GEODIFF_CONCURRENCY = config("PUSH_GEODIFF_CONCURRENCY", default=4, cast=int)
@@ -4,9 +4,16 @@
 
 import os
 from flask import current_app, abort
-from sqlalchemy import event
+from sqlalchemy import event, inspect
 
 from ..app import db
+from .models import (
+    LatestProjectFiles,
+    Project,
+    WorkspaceStorageUsage,
+    latest_files_cache,
+    pending_workspace_usage,
+)
 
 
 def check(session):
@@ -14,9 +21,84 @@ def check(session):
         abort(503, "Service unavailable due to maintenance, please try later")
 
 
+def clear_latest_files_cache(session, *args):
+    latest_files_cache(session).clear()
+
+
+def apply_workspace_usage(session):
+    """Apply collected changes of workspace usage counters as late as possible, right before commit"""
+    # make sure changes of projects in pending flush are collected as well
+    session.flush()
+    WorkspaceStorageUsage.apply_pending(session)
+
+
+def discard_workspace_usage(session, *args):
+    pending_workspace_usage(session).clear()
+
+
+def invalidate_latest_files(target, value, oldvalue, initiator):
+    cache = latest_files_cache(db.session)
+    for key in [k for k in cache if k[0] == target.project_id]:
+        del cache[key]
+
+
+def _active_disk_usage(project, previous=False):
+    """Disk usage of project counted in workspace usage, either current or before the change"""
+    state = inspect(project)
+    values = {}
+    for attr in ("disk_usage", "removed_at"):
+        history = state.attrs[attr].history
+        if previous and history.has_changes():
+            values[attr] = history.deleted[0] if history.deleted else None
+        else:
+            values[attr] = getattr(project, attr)
+    return (values["disk_usage"] or 0) if values["removed_at"] is None else 0
+
+
+def update_workspace_usage(session, flush_context, instances):
+    """Reflect changes of projects disk usage and their removal in workspace usage counters"""
+    for obj in session.new:
+        if isinstance(obj, Project):
+            WorkspaceStorageUsage.update(
+                obj.workspace_id, disk_usage=_active_disk_usage(obj)
+            )
+    for obj in session.dirty:
+        if not isinstance(obj, Project):
+            continue
+        state = inspect(obj)
+        if any(
+            state.attrs[attr].history.has_changes()
+            for attr in ("disk_usage", "removed_at")
+        ):
+            WorkspaceStorageUsage.update(
+                obj.workspace_id,
+                disk_usage=_active_disk_usage(obj)
+                - _active_disk_usage(obj, previous=True),
+            )
+    for obj in session.deleted:
+        if isinstance(obj, Project):
+            WorkspaceStorageUsage.update(
+                obj.workspace_id,
+                disk_usage=-_active_disk_usage(obj, previous=True),
+                files_size=-WorkspaceStorageUsage.project_files_size(obj.id),
+            )
+
+
 def register_events():
     event.listen(db.session, "before_commit", check)
+    event.listen(db.session, "before_commit", apply_workspace_usage)
+    event.listen(db.session, "after_commit", clear_latest_files_cache)
+    event.listen(db.session, "after_soft_rollback", clear_latest_files_cache)
+    event.listen(db.session, "after_soft_rollback", discard_workspace_usage)
+    event.listen(db.session, "before_flush", update_workspace_usage)
+    event.listen(LatestProjectFiles.file_history_ids, "set", invalidate_latest_files)
 
 
 def remove_events():
     event.remove(db.session, "before_commit", check)
+    event.remove(db.session, "before_commit", apply_workspace_usage)
+    event.remove(db.session, "after_commit", clear_latest_files_cache)
+    event.remove(db.session, "after_soft_rollback", clear_latest_files_cache)
+    event.remove(db.session, "after_soft_rollback", discard_workspace_usage)
+    event.remove(db.session, "before_flush", update_workspace_usage)
+    event.remove(LatestProjectFiles.file_history_ids, "set", invalidate_latest_files)
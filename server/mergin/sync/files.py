@@ -3,12 +3,19 @@
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 import datetime
 import os
+import uuid
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from marshmallow import fields, EXCLUDE, pre_load, post_load, post_dump
 from pathvalidate import sanitize_filename
 
 from ..app import DateTimeWithZ, ma
+from .utils import (
+    is_file_name_blacklisted,
+    is_supported_extension,
+    is_valid_path,
+    is_versioned_file,
+)
 
 
 def mergin_secure_filename(filename: str) -> str:
@@ -62,6 +69,134 @@ class UploadChanges:
     removed: List[UploadFile]
 
 
+class InvalidChangesError(ValueError):
+    pass
+
+
+class PushPlan:
+    """Push changes matched with project files at latest version.
+
+    Project files are indexed by path once, so that all checks and lookups run in linear time
+    with respect to number of changes regardless of project size.
+    """
+
+    def __init__(self, changes: UploadChanges, project_files: Dict[str, ProjectFile]):
+        """
+        :param changes: changes to be pushed
+        :param project_files: project files at latest version by their path
+        """
+        self.changes = changes
+        self.project_files = project_files
+        self.removed = {f.path for f in changes.removed}
+
+    @property
+    def all_changes(self) -> List[UploadFile]:
+        return self.changes.added + self.changes.updated + self.changes.removed
+
+    def validate(self) -> None:
+        """Check that changes can be applied to project files.
+
+        :raises InvalidChangesError: on first invalid change found
+        """
+        for item in self.changes.added:
+            # check if same file is not already uploaded
+            if item.path in self.project_files:
+                raise InvalidChangesError(f"File {item.path} has been already uploaded")
+            if not is_valid_path(item.path):
+                raise InvalidChangesError(
+                    f"Unsupported file name detected: {item.path}. Please remove the invalid characters."
+                )
+            if not is_supported_extension(item.path):
+                raise InvalidChangesError(
+                    f"Unsupported file type detected: {item.path}. "
+                    f"Please remove the file or try compressing it into a ZIP file before uploading"
+                )
+
+        # changes' files must be unique
+        changes_files = [f.path for f in self.all_changes]
+        if len(set(changes_files)) != len(changes_files):
+            raise InvalidChangesError("Not unique changes")
+
+        for f in self.all_changes:
+            # check if .gpkg file is valid
+            if is_versioned_file(f.path) and not f.is_valid_gpkg():
+                raise InvalidChangesError(f"File {f.path} is not valid")
+
+    def sanitize_locations(self) -> None:
+        """Make locations of uploaded files unique after their names were sanitized"""
+        locations = set()
+
+        def _unique(location):
+            if location in locations:
+                filename, file_extension = os.path.splitext(location)
+                location = filename + f".{str(uuid.uuid4())}" + file_extension
+            locations.add(location)
+            return location
+
+        for f in self.all_changes:
+            f.location = _unique(f.location)
+            if f.diff:
+                f.diff.location = _unique(f.diff.location)
+
+    def remove_blacklisted(self, blacklist: List[str]) -> List[str]:
+        """Remove changes of files matching blacklist
+
+        :param blacklist: blacklisted files and directories (with trailing slash)
+        :returns: paths of removed changes
+        """
+        blacklisted = {
+            f.path
+            for f in self.all_changes
+            if is_file_name_blacklisted(f.path, blacklist)
+        }
+        for key in self.changes.__dict__.keys():
+            new_value = [
+                f for f in getattr(self.changes, key) if f.path not in blacklisted
+            ]
+            setattr(self.changes, key, new_value)
+        self.removed -= blacklisted
+        return list(blacklisted)
+
+    def disk_usage_delta(self) -> int:
+        """Change of project disk usage if changes are applied"""
+        updated_files = [
+            self.project_files[f.path]
+            for f in self.changes.updated
+            if f.path in self.project_files
+        ]
+        return (
+            sum(f.size for f in self.changes.added + self.changes.updated)
+            - sum(f.size for f in updated_files)
+            - sum(f.size for f in self.changes.removed)
+        )
+
+    def current_file(self, path: str) -> Optional[ProjectFile]:
+        """Project file which is about to be changed, unless it is being removed"""
+        if path in self.removed:
+            return None
+        return self.project_files.get(path)
+
+    def geodiff_updates(
+        self,
+    ) -> Tuple[List[Tuple[UploadFile, ProjectFile]], List[str]]:
+        """Split updated files to those to be processed with geodiff and those missing in project.
+
+        Update is processed with geodiff either to apply uploaded diff or to construct diff for versioned file
+        uploaded in full. Other updates need no processing.
+
+        :returns: pairs of (updated file, current file) and paths of updated files not found in project
+        """
+        updates = []
+        missing = []
+        for updated_file in self.changes.updated:
+            current_file = self.current_file(updated_file.path)
+            if not current_file:
+                missing.append(updated_file.path)
+            elif updated_file.diff or is_versioned_file(updated_file.path):
+                updates.append((updated_file, current_file))
+        return updates, missing
+
+
 class FileSchema(ma.Schema):
     path = fields.String()
     size = fields.Integer()
@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 from __future__ import annotations
 import json
+import logging
 import os
 import time
 import uuid
@@ -14,9 +15,10 @@ from dataclasses import dataclass, asdict
 from blinker import signal
 from flask_login import current_user
 from pygeodiff import GeoDiff
-from sqlalchemy import text, null, desc, nullslast
-from sqlalchemy.dialects.postgresql import ARRAY, BIGINT, UUID, JSONB, ENUM
-from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy import text, null, desc, nullslast, bindparam, func, and_, or_
+from sqlalchemy.dialects.postgresql import ARRAY, BIGINT, UUID, JSONB, ENUM, insert
+from sqlalchemy.orm import column_property, contains_eager
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
 from sqlalchemy.types import String
 from sqlalchemy.ext.hybrid import hybrid_property
 from pygeodiff.geodifflib import GeoDiffLibError
@@ -27,17 +29,34 @@ from .files import (
     UploadChanges,
     ChangesSchema,
     ProjectFile,
+    mergin_secure_filename,
 )
 from .interfaces import WorkspaceRole
 from .storages.disk import move_to_tmp
 from ..app import db
-from .storages import DiskStorage
-from .utils import is_versioned_file, is_qgis
+from ..replicas import replica_binds
+from .storages import DiskStorage, S3Storage, FileNotFound
+from .utils import (
+    is_versioned_file,
+    qgis_files_count,
+    is_conflict_file,
+    CONFLICT_FILE_REGEX,
+)
 
-Storages = {"local": DiskStorage}
+Storages = {"local": DiskStorage, "s3": S3Storage}
 project_deleted = signal("project_deleted")
 
 
+def latest_files_cache(session) -> Dict[Tuple[uuid.UUID, int], Dict[str, ProjectFile]]:
+    """Transaction scoped cache of project files at latest version"""
+    return session.info.setdefault("latest_files", {})
+
+
+def pending_workspace_usage(session) -> Dict[int, List[int]]:
+    """Transaction scoped changes of workspace usage counters (disk usage, files size) to be applied on commit"""
+    return session.info.setdefault("workspace_usage", {})
+
+
 class PushChangeType(Enum):
     CREATE = "create"
     UPDATE = "update"
@@ -60,14 +79,24 @@ class Project(db.Model):
     updated = db.Column(db.DateTime, onupdate=datetime.utcnow)
     tags = db.Column(ARRAY(String), server_default="{}")
     # disk_usage & latest_version are cached properties to keep even if versions are deleted
-    disk_usage = db.Column(BIGINT, nullable=False, default=0)
+    # previous values of disk_usage and removed_at are loaded on change to update workspace usage
+    disk_usage = column_property(
+        db.Column(BIGINT, nullable=False, default=0), active_history=True
+    )
     latest_version = db.Column(db.Integer, index=True)
     workspace_id = db.Column(db.Integer, index=True, nullable=False)
-    removed_at = db.Column(db.DateTime, index=True)
+    removed_at = column_property(
+        db.Column(db.DateTime, index=True), active_history=True
+    )
     removed_by = db.Column(
         db.Integer, db.ForeignKey("user.id"), nullable=True, index=True
     )
     public = db.Column(db.Boolean, default=False, index=True, nullable=False)
+    # facts derived from files at latest version, cached for project listings
+    has_conflict = db.Column(
+        db.Boolean, nullable=False, default=False, server_default="false"
+    )
+    qgis_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     creator = db.relationship(
         "User", uselist=False, backref=db.backref("projects"), foreign_keys=[creator_id]
@@ -87,6 +116,8 @@ class Project(db.Model):
         self.workspace_id = workspace.id
         self.creator = creator
         self.latest_version = 0
+        self.has_conflict = False
+        self.qgis_count = 0
         self.public = kwargs.get("public", False)
         latest_files = LatestProjectFiles(project=self)
         db.session.add(latest_files)
@@ -108,7 +139,10 @@ class Project(db.Model):
         return project_workspace
 
     def cache_latest_files(self) -> None:
-        """Get project files from changes (FileHistory) and save them for later use."""
+        """Get project files from changes (FileHistory) and save them for later use.
+
+        Facts derived from files (see update_files_summary) are recalculated as well.
+        """
         if self.latest_version is None:
             return
 
@@ -134,19 +168,46 @@ class Project(db.Model):
                 FROM latest_changes ch
                 LEFT OUTER JOIN file_history fh ON (fh.file_path_id = ch.id AND fh.project_version_name = ch.version)
                 GROUP BY project_id
+            ), files_cache AS (
+                UPDATE latest_project_files pf
+                SET file_history_ids = a.files_ids
+                FROM aggregates a
+                WHERE a.project_id = pf.project_id
+                RETURNING pf.project_id, pf.file_history_ids
+            ), summary AS (
+                SELECT
+                    fc.project_id,
+                    COALESCE(bool_or(fp.path ~ :conflict_regex), FALSE) AS has_conflict,
+                    count(fp.id) FILTER (WHERE lower(fp.path) LIKE '%.qgs' OR lower(fp.path) LIKE '%.qgz') AS qgis_count
+                FROM files_cache fc
+                LEFT OUTER JOIN LATERAL unnest(fc.file_history_ids) AS files_ids(fh_id) ON TRUE
+                LEFT OUTER JOIN file_history fh ON fh.id = files_ids.fh_id
+                LEFT OUTER JOIN project_file_path fp ON fp.id = fh.file_path_id
+                GROUP BY fc.project_id
             )
-            UPDATE latest_project_files pf
-            SET file_history_ids = a.files_ids
-            FROM aggregates a
-            WHERE a.project_id = pf.project_id;
+            UPDATE project p
+            SET
+                has_conflict = s.has_conflict,
+                qgis_count = s.qgis_count
+            FROM summary s
+            WHERE s.project_id = p.id;
         """
-        params = {"project_id": self.id, "latest_version": self.latest_version}
+        params = {
+            "project_id": self.id,
+            "latest_version": self.latest_version,
+            "conflict_regex": CONFLICT_FILE_REGEX,
+        }
         db.session.execute(query, params)
         db.session.commit()
 
-    @property
-    def files(self) -> List[ProjectFile]:
-        """Return project files at latest version"""
+    def update_files_summary(self) -> None:
+        """Update facts derived from files at latest version, those are served in project listings"""
+        files = self.files
+        self.has_conflict = any(is_conflict_file(f.path) for f in files)
+        self.qgis_count = qgis_files_count(files)
+
+    def _query_files(self) -> List[ProjectFile]:
+        """Query project files at latest version"""
         # cache file history ids if needed
         if self.latest_project_files.file_history_ids is None:
             self.cache_latest_files()
@@ -187,6 +248,29 @@ class Project(db.Model):
         ]
         return files
 
+    @property
+    def files_map(self) -> Dict[str, ProjectFile]:
+        """Project files at latest version by their path.
+
+        Files are memoized within db session transaction under project id and latest version,
+        cache is dropped on commit, rollback or when latest files ids of project are modified.
+        Returned dict is shared and must not be modified.
+        """
+        cache = latest_files_cache(db.session)
+        key = (self.id, self.latest_version)
+        if key not in cache:
+            cache[key] = {f.path: f for f in self._query_files()}
+        return cache[key]
+
+    @property
+    def files(self) -> List[ProjectFile]:
+        """Return project files at latest version"""
+        return list(self.files_map.values())
+
+    def get_file(self, path: str) -> Optional[ProjectFile]:
+        """Return project file at latest version by its path"""
+        return self.files_map.get(path)
+
     def sync_failed(self, client, error_type, error_details, user_id):
         """Commit failed attempt to sync failure history table"""
         new_failure = SyncFailuresHistory(
@@ -233,6 +317,10 @@ class Project(db.Model):
         # Null in storage params serves as permanent deletion flag
         self.storage.delete()
         self.storage_params = null()
+        WorkspaceStorageUsage.update(
+            self.workspace_id,
+            files_size=-WorkspaceStorageUsage.project_files_size(self.id),
+        )
         # remove file records and their history (cascade)
         files_path_table = ProjectFilePath.__table__
         db.session.execute(
@@ -392,6 +480,40 @@ class ProjectFilePath(db.Model):
         self.project_id = project_id
         self.path = path
 
+    @staticmethod
+    def bulk_get_or_create(project_id: str, paths: List[str]) -> Dict[str, int]:
+        """Get ids of project file paths, missing ones are created with single INSERT ... ON CONFLICT.
+
+        :param project_id: project id
+        :param paths: list of file paths
+        :returns: map of file path to its id
+        """
+        paths = list(dict.fromkeys(paths))
+        if not paths:
+            return {}
+        result = db.session.execute(
+            insert(ProjectFilePath.__table__)
+            .on_conflict_do_nothing(index_elements=["project_id", "path"])
+            .returning(ProjectFilePath.id, ProjectFilePath.path),
+            [{"project_id": project_id, "path": path} for path in paths],
+        )
+        paths_map = {path: path_id for path_id, path in result}
+        # conflicting rows are not returned, those are paths which already exist
+        missing = [path for path in paths if path not in paths_map]
+        if missing:
+            paths_map.update(
+                {
+                    path: path_id
+                    for path_id, path in db.session.query(
+                        ProjectFilePath.id, ProjectFilePath.path
+                    ).filter(
+                        ProjectFilePath.project_id == project_id,
+                        ProjectFilePath.path.in_(missing),
+                    )
+                }
+            )
+        return paths_map
+
 
 class LatestProjectFiles(db.Model):
     """Store project latest version files history ids"""
@@ -421,6 +543,181 @@ class LatestProjectFiles(db.Model):
         self.file_history_ids = []
 
 
+class WorkspaceStorageUsage(db.Model):
+    """Storage usage of workspace maintained incrementally along with changes in projects.
+
+    Counters are updated in the same transaction as the change itself, so that usage can be read
+    from a single row. They can be recalculated from projects data with reconcile method.
+    Changes are collected during transaction and applied just before commit, so that workspace row
+    is locked only for a short time and concurrent pushes to the same workspace are not serialized.
+    """
+
+    workspace_id = db.Column(db.Integer, primary_key=True)
+    # size of active projects at their latest versions
+    disk_usage = db.Column(BIGINT, nullable=False, default=0)
+    # size of all stored files of projects including history and diffs
+    files_size = db.Column(BIGINT, nullable=False, default=0)
+
+    # size of file history rows (full files or diffs), full files of latest versions of diff updates are added
+    files_size_query = """
+        WITH history AS (
+            SELECT
+                p.workspace_id,
+                SUM(
+                    CASE fh.change
+                        WHEN 'update_diff' THEN COALESCE((fh.diff ->> 'size')::bigint, 0)
+                        WHEN 'delete' THEN 0
+                        ELSE fh.size
+                    END
+                ) AS size
+            FROM file_history fh
+            INNER JOIN project_file_path fp ON fp.id = fh.file_path_id
+            INNER JOIN project p ON p.id = fp.project_id
+            WHERE {condition}
+            GROUP BY p.workspace_id
+        ), latest AS (
+            SELECT
+                p.workspace_id,
+                SUM(fh.size) AS size
+            FROM latest_project_files lpf
+            INNER JOIN project p ON p.id = lpf.project_id
+            CROSS JOIN unnest(lpf.file_history_ids) AS files_ids(fh_id)
+            INNER JOIN file_history fh ON fh.id = files_ids.fh_id
+            WHERE fh.change = 'update_diff' AND {condition}
+            GROUP BY p.workspace_id
+        )
+    """
+
+    @classmethod
+    def update(cls, workspace_id: int, disk_usage: int = 0, files_size: int = 0):
+        """Increment usage counters of workspace by given amount of bytes on transaction commit
+
+        :param workspace_id: workspace id
+        :param disk_usage: change of size of active projects
+        :param files_size: change of size of all stored files
+        """
+        if not (disk_usage or files_size):
+            return
+        usage = pending_workspace_usage(db.session).setdefault(workspace_id, [0, 0])
+        usage[0] += disk_usage
+        usage[1] += files_size
+
+    @classmethod
+    def apply_pending(cls, session) -> None:
+        """Write usage changes collected in session transaction to counters"""
+        pending = session.info.pop("workspace_usage", {})
+        # rows are locked in the same order to avoid deadlocks
+        for workspace_id, (disk_usage, files_size) in sorted(pending.items()):
+            if not (disk_usage or files_size):
+                continue
+            stmt = insert(cls.__table__).values(
+                workspace_id=workspace_id, disk_usage=disk_usage, files_size=files_size
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.workspace_id],
+                set_={
+                    "disk_usage": cls.disk_usage + stmt.excluded.disk_usage,
+                    "files_size": cls.files_size + stmt.excluded.files_size,
+                },
+            )
+            session.connection().execute(stmt)
+
+    @classmethod
+    def project_files_size(cls, project_id: uuid.UUID) -> int:
+        """Calculate size of all stored files of project"""
+        query = (
+            cls.files_size_query.format(condition="p.id = :project_id")
+            + """
+            SELECT COALESCE((SELECT SUM(size) FROM history), 0) + COALESCE((SELECT SUM(size) FROM latest), 0);
+            """
+        )
+        return db.session.execute(query, {"project_id": project_id}).scalar()
+
+    @classmethod
+    def reconcile(cls) -> List[int]:
+        """Recalculate usage counters of all workspaces from projects data
+
+        :returns: ids of workspaces which counters were out of sync
+        """
+        # wait for running transactions which modify counters and block new ones until recalculation is done
+        db.session.execute(
+            "LOCK TABLE workspace_storage_usage IN SHARE ROW EXCLUSIVE MODE"
+        )
+        previous = {
+            row.workspace_id: (row.disk_usage, row.files_size)
+            for row in cls.query.all()
+        }
+        query = (
+            cls.files_size_query.format(condition="TRUE")
+            + """
+            , projects AS (
+                SELECT
+                    workspace_id,
+                    COALESCE(SUM(disk_usage) FILTER (WHERE removed_at IS NULL), 0) AS disk_usage
+                FROM project
+                GROUP BY workspace_id
+            )
+            SELECT
+                p.workspace_id,
+                p.disk_usage,
+                COALESCE(h.size, 0) + COALESCE(l.size, 0) AS files_size
+            FROM projects p
+            LEFT OUTER JOIN history h USING (workspace_id)
+            LEFT OUTER JOIN latest l USING (workspace_id);
+            """
+        )
+        current = {
+            row.workspace_id: (row.disk_usage, row.files_size)
+            for row in db.session.execute(query)
+        }
+        out_of_sync = []
+        for workspace_id in set(previous) | set(current):
+            usage = current.get(workspace_id, (0, 0))
+            if previous.get(workspace_id, (0, 0)) == usage:
+                continue
+            out_of_sync.append(workspace_id)
+            db.session.execute(
+                insert(cls.__table__)
+                .values(
+                    workspace_id=workspace_id,
+                    disk_usage=usage[0],
+                    files_size=usage[1],
+                )
+                .on_conflict_do_update(
+                    index_elements=[cls.workspace_id],
+                    set_={"disk_usage": usage[0], "files_size": usage[1]},
+                )
+            )
+        db.session.commit()
+        return sorted(out_of_sync)
+
+
+class ProjectVersionManifest(db.Model):
+    """Store history ids of files present in project version"""
+
+    version_id = db.Column(
+        db.Integer,
+        db.ForeignKey("project_version.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    file_history_ids = db.Column(ARRAY(BIGINT), nullable=False)
+
+    version = db.relationship(
+        "ProjectVersion",
+        uselist=False,
+        backref=db.backref(
+            "manifest",
+            single_parent=True,
+            uselist=False,
+            cascade="all,delete",
+            lazy="select",
+        ),
+    )
+
+    def __init__(self, file_history_ids: List[int]):
+        self.file_history_ids = file_history_ids
+
+
 class FileHistory(db.Model):
     """Changes for ProjectFilePath objects which happened in ProjectVersion"""
 
@@ -451,6 +748,10 @@ class FileHistory(db.Model):
     )
     # cache name of project version for more efficient queries
     project_version_name = db.Column(db.Integer, nullable=False)
+    # full file is kept for diff update to shorten the diffs chain needed to restore other file versions
+    keyframe = db.Column(db.Boolean, default=False, nullable=False)
+    # geodiff summary of diff update, calculated after push
+    diff_summary = db.Column(JSONB, nullable=True)
 
     version = db.relationship(
         "ProjectVersion",
@@ -517,7 +818,7 @@ class FileHistory(db.Model):
 
     @property
     def expiration(self) -> Optional[datetime]:
-        if not self.diff:
+        if not self.diff or self.keyframe:
             return
 
         if os.path.exists(self.abs_path):
@@ -525,6 +826,61 @@ class FileHistory(db.Model):
                 os.path.getmtime(self.abs_path) + current_app.config["FILE_EXPIRATION"]
             )
 
+    def calculate_diff_summary(self) -> Optional[Dict]:
+        """Summary of changes in diff file per table as listed by geodiff, together with diff size.
+        Summary files cached on disk by older versions are reused if present.
+
+        :Example:
+
+        >>> self.calculate_diff_summary()
+        {
+          'summary': [
+            {'table': 'gpkg_contents', 'insert': 0, 'update': 1, 'delete': 0},
+            {'table': 'simple', 'insert': 2, 'update': 0, 'delete': 0}
+          ],
+          'size': 278
+        }
+
+        :return: diff summary, geodiff error or None for change without diff or if diff file is not available
+        """
+        if not self.diff:
+            return None
+
+        storage = self.version.project.storage
+        diff_file = self.diff_file
+        json_file = os.path.join(storage.project_dir, self.location + "-diff-summary")
+        tmp_file = None
+        if not os.path.exists(json_file):
+            tmp_file = json_file = os.path.join(
+                storage.geodiff_working_dir, str(uuid.uuid4())
+            )
+            os.makedirs(storage.geodiff_working_dir, exist_ok=True)
+            storage.flush_geodiff_logger()
+            try:
+                changeset = storage.file_path(diff_file.location)
+            except FileNotFound:
+                # might be transient (e.g. storage not available), summary is calculated next time
+                logging.warning(f"Diff file {diff_file.location} not found")
+                return None
+            try:
+                storage.geodiff.list_changes_summary(changeset, json_file)
+            except GeoDiffLibError as e:
+                move_to_tmp(json_file)
+                return {
+                    "error": storage.gediff_log.getvalue() or str(e),
+                    "size": diff_file.size,
+                }
+
+        try:
+            with open(json_file, "r") as jf:
+                content = json.load(jf)
+        finally:
+            if tmp_file:
+                move_to_tmp(tmp_file)
+        if "geodiff_summary" not in content:
+            return {}
+        return {"summary": content["geodiff_summary"], "size": diff_file.size}
+
     @classmethod
     def changes(
         cls, project_id: str, file: str, since: int, to: int, diffable: bool = False
@@ -539,38 +895,125 @@ class FileHistory(db.Model):
         if not (is_versioned_file(file) and since is not None and to is not None):
             return []
 
-        history = []
-        full_history = (
-            FileHistory.query.join(ProjectFilePath)
+        file_path_id = cls._file_path_id(project_id, file)
+        # the newest boundary of changes chain in versions range, history is cut by index lookup
+        chain_start = (
+            db.session.query(func.max(FileHistory.project_version_name))
             .filter(
-                ProjectFilePath.project_id == project_id,
+                FileHistory.file_path_id == file_path_id,
                 FileHistory.project_version_name <= to,
                 FileHistory.project_version_name >= since,
-                ProjectFilePath.path == file,
+                cls._chain_boundary(diffable),
+            )
+            .scalar_subquery()
+        )
+        return (
+            cls._with_file_and_version()
+            .filter(
+                FileHistory.file_path_id == file_path_id,
+                FileHistory.project_version_name <= to,
+                FileHistory.project_version_name >= func.coalesce(chain_start, since),
             )
             .order_by(desc(FileHistory.project_version_name))
             .all()
         )
 
-        for item in full_history:
-            history.append(item)
+    @staticmethod
+    def _chain_boundary(diffable: bool = False):
+        """Condition for change which starts changes chain - create, delete or forced update if diffable"""
+        boundary = FileHistory.change.in_(
+            [PushChangeType.CREATE.value, PushChangeType.DELETE.value]
+        )
+        if diffable:
+            boundary = or_(
+                boundary,
+                and_(
+                    FileHistory.change == PushChangeType.UPDATE.value,
+                    FileHistory.diff.is_(None),
+                ),
+            )
+        return boundary
 
-            # end of file history
-            if item.change in [
-                PushChangeType.CREATE.value,
-                PushChangeType.DELETE.value,
-            ]:
-                break
+    @staticmethod
+    def _file_path_id(project_id: str, file: str):
+        """Scalar subquery for id of project file path"""
+        return (
+            db.session.query(ProjectFilePath.id)
+            .filter(
+                ProjectFilePath.project_id == project_id,
+                ProjectFilePath.path == file,
+            )
+            .scalar_subquery()
+        )
 
-            # if we are interested only in 'diffable' history (not broken with forced update)
-            if (
-                diffable
-                and item.change == PushChangeType.UPDATE.value
-                and not item.diff
-            ):
-                break
+    @staticmethod
+    def _with_file_and_version():
+        """File history query with file path and project version loaded eagerly"""
+        return (
+            FileHistory.query.join(FileHistory.file)
+            .join(FileHistory.version)
+            .options(
+                contains_eager(FileHistory.file), contains_eager(FileHistory.version)
+            )
+        )
+
+    @classmethod
+    def files_changes(
+        cls,
+        project_id: str,
+        files: List[str],
+        since: int,
+        to: int,
+        diffable: bool = False,
+    ) -> Dict[str, List[FileHistory]]:
+        """
+        Returns history (changes) of multiple files between two versions in a single query, as FileHistory.changes
+        does for a single file. Changes of each file are ordered from the newest one, files without changes are
+        not present in result. Related file path and project version are loaded together with history.
 
-        return history
+        Chains are cut in the database: for each history item the number of newer chain boundaries (create, delete
+        or forced update if diffable=True) is counted by window function and only items without any are returned.
+        """
+        files = [f for f in files if is_versioned_file(f)]
+        if not files or since is None or to is None:
+            return {}
+
+        boundary = cls._chain_boundary(diffable)
+        # boundaries in preceding rows, that is strictly newer changes of the same file
+        newer_boundaries = (
+            func.count()
+            .filter(boundary)
+            .over(
+                partition_by=FileHistory.file_path_id,
+                order_by=desc(FileHistory.project_version_name),
+                rows=(None, -1),
+            )
+        )
+        history = (
+            db.session.query(
+                FileHistory.id.label("id"),
+                newer_boundaries.label("newer_boundaries"),
+            )
+            .join(ProjectFilePath)
+            .filter(
+                ProjectFilePath.project_id == project_id,
+                ProjectFilePath.path.in_(files),
+                FileHistory.project_version_name <= to,
+                FileHistory.project_version_name >= since,
+            )
+            .subquery()
+        )
+        query = (
+            cls._with_file_and_version()
+            .join(history, history.c.id == FileHistory.id)
+            .filter(history.c.newer_boundaries == 0)
+            .order_by(ProjectFilePath.path, desc(FileHistory.project_version_name))
+        )
+
+        result = {}
+        for item in query.all():
+            result.setdefault(item.path, []).append(item)
+        return result
 
     @classmethod
     def diffs_chain(
@@ -578,93 +1021,235 @@ class FileHistory(db.Model):
     ) -> Tuple[Optional[FileHistory], List[Optional[File]]]:
         """Find chain of diffs from the closest basefile that leads to a given file at certain project version.
 
+        Basefile is a full file stored on disk - either file without diff (create or forced update), keyframe or
+        the latest version of file. The closest basefile is searched in both directions, if basefile is newer
+        than the version of interest, diffs need to be applied backward (inverted).
+
         Returns basefile and list of diffs for gpkg that needs to be applied to reconstruct file.
         List of diffs can be empty if basefile was eventually asked. Basefile can be empty if file cannot be
         reconstructed (removed/renamed).
         """
-        diffs = []
-        basefile = None
-        v_x = version  # the version of interest
-        v_last = project.latest_version
-
-        # we ask for the latest version which is always a basefile if the file has not been removed
-        if v_x == v_last:
-            latest_change = (
-                FileHistory.query.join(ProjectFilePath)
-                .join(FileHistory.version)
-                .filter(
-                    ProjectFilePath.path == file,
-                    ProjectVersion.project_id == project.id,
-                )
-                .order_by(desc(ProjectVersion.created))
-                .first()
+        if not is_versioned_file(file):
+            return None, []
+
+        file_path_id = cls._file_path_id(project.id, file)
+        # basefile search in both directions stops at the nearest change without diff,
+        # hence older and newer history is not needed
+        chain_start = (
+            db.session.query(func.max(FileHistory.project_version_name))
+            .filter(
+                FileHistory.file_path_id == file_path_id,
+                FileHistory.project_version_name <= version,
+                FileHistory.diff.is_(None),
             )
-            if latest_change.change != PushChangeType.DELETE.value:
-                return latest_change, []
-            else:
-                # file is actually not in the latest project version
-                return None, []
-
-        # check if it would not be faster to look up from the latest version
-        backward = (v_last - v_x) < v_x
-
-        if backward:
-            # get list of file history changes starting with the latest version (v_last, ..., v_x+n, (..., v_x))
-            history = FileHistory.changes(project.id, file, v_x, v_last, diffable=True)
-            if history:
-                first_change = history[-1]
-                # we have either full history of changes or v_x = v_x+n => no basefile in way, it is 'diffable' from the end
-                if first_change.diff:
-                    # omit diff for target version as it would lead to previous version if reconstructed backward
-                    diffs = [
-                        value.diff_file
-                        for value in reversed(history)
-                        if value.version.name != v_x
-                    ]
-                    basefile = history[0]
-                    return basefile, diffs
-                # there was either breaking change or v_x is a basefile itself
-                else:
-                    # we asked for basefile
-                    if v_x == first_change.version.name and first_change.change in [
-                        PushChangeType.CREATE.value,
-                        PushChangeType.UPDATE.value,
-                    ]:
-                        return first_change, []
-                    # file was removed (or renamed for backward compatibility)
-                    elif v_x == first_change.version.name:
-                        return basefile, diffs
-                    # there was a breaking change in v_x+n, and we need to search from start
-                    else:
-                        pass
-
-        # we haven't found anything so far, search from v1
-        if not (basefile and diffs):
-            # get ordered dict of file history starting with version of interest (v_x, ..., v_x-n, (..., v_1))
-            history = FileHistory.changes(project.id, file, 1, v_x, diffable=True)
-            if history:
-                first_change = history[-1]
-                # we found basefile
-                if first_change.change in [
-                    PushChangeType.CREATE.value,
-                    PushChangeType.UPDATE.value,
-                ]:
-                    basefile = first_change
-                    if v_x == first_change.version.name:
-                        # we asked for basefile
-                        diffs = []
-                    else:
-                        # basefile has no diff
-                        diffs = [
-                            value.diff_file for value in list(reversed(history))[1:]
-                        ]
-                # file was removed (or renamed for backward compatibility)
-                else:
-                    pass
+            .scalar_subquery()
+        )
+        chain_end = (
+            db.session.query(func.min(FileHistory.project_version_name))
+            .filter(
+                FileHistory.file_path_id == file_path_id,
+                FileHistory.project_version_name > version,
+                FileHistory.project_version_name <= project.latest_version,
+                FileHistory.diff.is_(None),
+            )
+            .scalar_subquery()
+        )
+        history = (
+            cls._with_file_and_version()
+            .filter(
+                FileHistory.file_path_id == file_path_id,
+                FileHistory.project_version_name >= func.coalesce(chain_start, 0),
+                FileHistory.project_version_name
+                <= func.coalesce(chain_end, project.latest_version),
+            )
+            .order_by(FileHistory.project_version_name)
+            .all()
+        )
+        # the last change of file up to the version of interest
+        idx = next(
+            (
+                i
+                for i in range(len(history) - 1, -1, -1)
+                if history[i].project_version_name <= version
+            ),
+            None,
+        )
+        if idx is None or history[idx].change == PushChangeType.DELETE.value:
+            # file is not present in the version of interest (removed/renamed)
+            return None, []
+
+        def is_basefile(i: int) -> bool:
+            item = history[i]
+            if item.change == PushChangeType.DELETE.value:
+                return False
+            return not item.diff or item.keyframe or i == len(history) - 1
+
+        # search for the closest older basefile, the chain is broken by any change without diff
+        forward = None
+        for i in range(idx, -1, -1):
+            if is_basefile(i):
+                forward = i
+                break
+            if not history[i].diff:
+                break
+
+        # search for the closest newer basefile, diffs from the chain would be inverted
+        backward = None
+        for i in range(idx + 1, len(history)):
+            if not history[i].diff:
+                break
+            if is_basefile(i):
+                backward = i
+                break
+
+        if forward is None and backward is None:
+            return None, []
 
+        squashes = {
+            (squash.start, squash.end): squash
+            for squash in FileDiffSquash.query.filter(
+                FileDiffSquash.file_path_id == history[idx].file_path_id,
+                FileDiffSquash.end <= project.latest_version,
+            )
+        }
+        if forward is not None and (backward is None or idx - forward < backward - idx):
+            basefile = history[forward]
+            diffs = FileDiffSquash.compact_chain(
+                history[forward + 1 : idx + 1],
+                squashes,
+                basefile.project_version_name,
+                version,
+            )
+        else:
+            # omit diff for target version as it would lead to previous version if reconstructed backward
+            basefile = history[backward]
+            diffs = FileDiffSquash.compact_chain(
+                history[idx + 1 : backward + 1],
+                squashes,
+                version,
+                basefile.project_version_name,
+            )
         return basefile, diffs
 
 
+class FileDiffSquash(db.Model):
+    """Diffs of versioned file concatenated over aligned power-of-two range of project versions
+    (v1-v2, v1-v4, v5-v8, ...). Together they form a skip index, so that file can be reconstructed
+    with logarithmic number of diffs.
+
+    Only ranges with all file changes being diff updates are squashed, hence they do not depend on
+    basefiles (forced updates, keyframes) and stay valid when full files are removed by storage optimization.
+    """
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    file_path_id = db.Column(
+        db.BigInteger,
+        db.ForeignKey("project_file_path.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # range of project versions (both inclusive)
+    start = db.Column(db.Integer, nullable=False)
+    end = db.Column(db.Integer, nullable=False)
+    # path on FS relative to project directory
+    location = db.Column(db.String, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    checksum = db.Column(db.String, nullable=False)
+
+    file = db.relationship("ProjectFilePath", uselist=False)
+
+    __table_args__ = (db.UniqueConstraint("file_path_id", "start", "end"),)
+
+    def __init__(
+        self,
+        file: ProjectFilePath,
+        start: int,
+        end: int,
+        location: str,
+        size: int,
+        checksum: str,
+    ):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.location = location
+        self.size = size
+        self.checksum = checksum
+
+    @property
+    def diff_file(self) -> File:
+        return File(
+            path=os.path.basename(self.location),
+            checksum=self.checksum,
+            size=self.size,
+            location=self.location,
+        )
+
+    @staticmethod
+    def generate_location(file: str, start: int, end: int) -> str:
+        return os.path.join(
+            "squashed",
+            f"{ProjectVersion.to_v_name(start)}-{ProjectVersion.to_v_name(end)}",
+            mergin_secure_filename(file) + "-diff",
+        )
+
+    @staticmethod
+    def ranges(start: int, to: int) -> List[Tuple[int, int]]:
+        """Aligned ranges of at least two versions beginning with start version and ending not later than
+        given version, ordered from the largest one.
+        """
+        size = 1
+        while not (start - 1) % (size * 2) and start + size * 2 - 1 <= to:
+            size *= 2
+        ranges = []
+        while size > 1:
+            ranges.append((start, start + size - 1))
+            size //= 2
+        return ranges
+
+    @classmethod
+    def compact_chain(
+        cls,
+        history: List[FileHistory],
+        squashes: Dict[Tuple[int, int], FileDiffSquash],
+        since: int,
+        to: int,
+    ) -> List[File]:
+        """Replace diffs chain with squashed diffs where possible.
+
+        :param history: diff updates of file between versions, ordered from the oldest one
+        :param squashes: available squashed diffs of file by their versions range
+        :param since: version the chain starts from (exclusive)
+        :param to: version the chain leads to (inclusive)
+        :returns: list of diff files to apply
+        """
+        diffs = []
+        start = since + 1
+        i = 0
+        while i < len(history):
+            squash = next(
+                (squashes[r] for r in cls.ranges(start, to) if r in squashes), None
+            )
+            if not squash and start < history[i].project_version_name:
+                # no changes in between, try ranges starting with the next change
+                start = history[i].project_version_name
+                squash = next(
+                    (squashes[r] for r in cls.ranges(start, to) if r in squashes),
+                    None,
+                )
+
+            if squash:
+                diffs.append(squash.diff_file)
+                start = squash.end + 1
+                while i < len(history) and history[i].project_version_name < start:
+                    i += 1
+            else:
+                diffs.append(history[i].diff_file)
+                start = history[i].project_version_name + 1
+                i += 1
+        return diffs
+
+
 class ProjectVersion(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.Integer, index=True)
@@ -717,23 +1302,21 @@ class ProjectVersion(db.Model):
         self.ip_address = ip
         self.device_id = device_id
 
-        latest_files_map = {
-            fh.path: fh.id
-            for fh in FileHistory.query.filter(
-                FileHistory.id.in_(self.project.latest_project_files.file_history_ids)
-            ).all()
-        }
+        # version row is needed upfront as file history rows are inserted in bulk and reference it
+        db.session.add(self)
+        db.session.flush()
 
-        changed_files_paths = [
-            f.path for f in changes.updated + changes.removed + changes.added
-        ]
-        existing_files_map = {
-            f.path: f
-            for f in ProjectFilePath.query.filter_by(project_id=self.project_id)
-            .filter(ProjectFilePath.path.in_(changed_files_paths))
+        latest_files_map = dict(
+            db.session.query(ProjectFilePath.path, FileHistory.id)
+            .select_from(FileHistory)
+            .join(FileHistory.file)
+            .filter(
+                FileHistory.id.in_(self.project.latest_project_files.file_history_ids)
+            )
             .all()
-        }
+        )
 
+        rows = []
         for key in (
             ("added", PushChangeType.CREATE),
             ("updated", PushChangeType.UPDATE),
@@ -747,45 +1330,90 @@ class ProjectVersion(db.Model):
                     change_type is PushChangeType.UPDATE
                     and upload_file.diff is not None
                 )
-
-                file = existing_files_map.get(
-                    upload_file.path, ProjectFilePath(self.project_id, upload_file.path)
-                )
-                fh = FileHistory(
-                    file=file,
-                    size=upload_file.size,
-                    checksum=upload_file.checksum,
-                    location=upload_file.location,
-                    diff=(
-                        asdict(upload_file.diff)
-                        if (is_diff_change and upload_file.diff)
-                        else null()
-                    ),
-                    change=(
-                        PushChangeType.UPDATE_DIFF if is_diff_change else change_type
-                    ),
+                rows.append(
+                    {
+                        "path": upload_file.path,
+                        "size": upload_file.size,
+                        "checksum": upload_file.checksum,
+                        "location": upload_file.location,
+                        "diff": (
+                            asdict(upload_file.diff)
+                            if (is_diff_change and upload_file.diff)
+                            else None
+                        ),
+                        "change": (
+                            PushChangeType.UPDATE_DIFF
+                            if is_diff_change
+                            else change_type
+                        ).value,
+                        "version_id": self.id,
+                        "project_version_name": self.name,
+                        "keyframe": False,
+                    }
                 )
-                fh.version = self
-                fh.project_version_name = self.name
-                db.session.add(fh)
-                db.session.flush()
 
-                if change_type is PushChangeType.DELETE:
-                    latest_files_map.pop(fh.path, None)
+        if rows:
+            file_paths_map = ProjectFilePath.bulk_get_or_create(
+                self.project_id, [row["path"] for row in rows]
+            )
+            for row in rows:
+                row["file_path_id"] = file_paths_map[row["path"]]
+            # executemany is run with psycopg2 execute_values, hence RETURNING is available
+            result = db.session.execute(
+                insert(FileHistory.__table__)
+                .values(diff=bindparam("diff", type_=JSONB(none_as_null=True)))
+                .returning(FileHistory.id, FileHistory.file_path_id),
+                rows,
+            )
+            inserted = {file_path_id: fh_id for fh_id, file_path_id in result}
+            self._update_workspace_usage(rows, latest_files_map)
+            for row in rows:
+                if row["change"] == PushChangeType.DELETE.value:
+                    latest_files_map.pop(row["path"], None)
                 else:
-                    latest_files_map[fh.path] = fh.id
+                    latest_files_map[row["path"]] = inserted[row["file_path_id"]]
 
         # update cached values in project and push to transaction buffer so that self.files is up-to-date
         self.project.latest_project_files.file_history_ids = latest_files_map.values()
+        # manifest of files is derived from the previous version, so it is kept also for later versions
+        self.manifest = ProjectVersionManifest(list(latest_files_map.values()))
         db.session.flush()
-        self.project.disk_usage = (
-            sum(f.size for f in self.project.files) if self.project.files else 0
-        )
         self.project.latest_version = self.name
+        self.project.disk_usage = sum(f.size for f in self.project.files)
+        self.project.update_files_summary()
         self.project.tags = self.resolve_tags()
         self.project_size = self.project.disk_usage
         db.session.flush()
 
+    def _update_workspace_usage(
+        self, rows: List[Dict], latest_files_map: Dict[str, int]
+    ) -> None:
+        """Add size of new files history to workspace usage.
+
+        Full files of diff updates are counted only while they are in the latest version.
+        """
+        size = 0
+        for row in rows:
+            if row["change"] == PushChangeType.UPDATE_DIFF.value:
+                size += row["diff"]["size"] + row["size"]
+            elif row["change"] != PushChangeType.DELETE.value:
+                size += row["size"]
+        replaced_ids = [
+            latest_files_map[row["path"]]
+            for row in rows
+            if row["path"] in latest_files_map
+        ]
+        if replaced_ids:
+            size -= (
+                db.session.query(func.coalesce(func.sum(FileHistory.size), 0))
+                .filter(
+                    FileHistory.id.in_(replaced_ids),
+                    FileHistory.change == PushChangeType.UPDATE_DIFF.value,
+                )
+                .scalar()
+            )
+        WorkspaceStorageUsage.update(self.project.workspace_id, files_size=size)
+
     @staticmethod
     def from_v_name(name: str) -> int:
         """Parsed version name as integer (v5 -> 5)"""
@@ -798,6 +1426,27 @@ class ProjectVersion(db.Model):
         """
         return "v" + str(name)
 
+    def _files_from_manifest(self):
+        """Get version files using materialized manifest of file history ids"""
+        query = f"""
+            SELECT
+                fp.path,
+                fh.size,
+                fh.diff,
+                fh.location,
+                fh.checksum,
+                pv.created AS mtime
+            FROM project_version_manifest m
+            CROSS JOIN unnest(m.file_history_ids) AS files_ids(fh_id)
+            INNER JOIN file_history fh ON fh.id = files_ids.fh_id
+            INNER JOIN project_file_path fp ON fp.id = fh.file_path_id
+            INNER JOIN project_version pv ON pv.id = fh.version_id
+            WHERE m.version_id = :version_id
+            ORDER BY fp.path;
+        """
+        params = {"version_id": self.id}
+        return db.session.execute(query, params).fetchall()
+
     def _files_from_start(self):
         """Calculate version files using lookup from the first version
         Strategy: From all project files get the latest file change before or at the specific version.
@@ -897,7 +1546,10 @@ class ProjectVersion(db.Model):
         if self.name == self.project.latest_version:
             return self.project.files
 
-        if self.name < self.project.latest_version / 2:
+        if self.manifest is not None:
+            result = self._files_from_manifest()
+        # versions created before manifests were introduced
+        elif self.name < self.project.latest_version / 2:
             result = self._files_from_start()
         else:
             result = self._files_from_end()
@@ -915,17 +1567,19 @@ class ProjectVersion(db.Model):
         return files
 
     def resolve_tags(self) -> List[str]:
+        """Resolve tags of version from number of QGIS projects, latest version uses count stored on project"""
         tags = []
-        qgis_count = 0
-        for f in self.files:
-            if is_qgis(f.path):
-                qgis_count += 1
+        if self.name == self.project.latest_version:
+            qgis_count = self.project.qgis_count
+        else:
+            qgis_count = qgis_files_count(self.files)
         if qgis_count == 1:
             tags.extend(["valid_qgis", "input_use"])
         return tags
 
     def diff_summary(self):
-        """Calculate diff summary for versioned files updated with geodiff
+        """Diff summaries for versioned files updated with geodiff, as precomputed by create_diff_summaries task
+        (summaries which are not calculated yet are omitted)
 
         :Example:
 
@@ -948,38 +1602,12 @@ class ProjectVersion(db.Model):
         :rtype: dict
         """
         output = {}
-        self.project.storage.flush_geodiff_logger()
-        for f in self.changes.all():
-            if f.change != PushChangeType.UPDATE_DIFF.value:
-                continue
-
-            json_file = os.path.join(
-                self.project.storage.project_dir, f.location + "-diff-summary"
-            )
-            changeset = os.path.join(
-                self.project.storage.project_dir, f.diff_file.location
-            )
-            if not os.path.exists(json_file):
-                try:
-                    self.project.storage.geodiff.list_changes_summary(
-                        changeset, json_file
-                    )
-                except GeoDiffLibError:
-                    output[f.path] = {
-                        "error": self.project.storage.gediff_log.getvalue(),
-                        "size": f.diff_file.size,
-                    }
-                    continue
-            with open(json_file, "r") as jf:
-                content = json.load(jf)
-                if "geodiff_summary" not in content:
-                    continue
-
-                output[f.path] = {
-                    "summary": content["geodiff_summary"],
-                    "size": f.diff_file.size,
-                }
-
+        for f in self.changes.filter(
+            FileHistory.change == PushChangeType.UPDATE_DIFF.value,
+            FileHistory.diff_summary.isnot(None),
+        ):
+            if f.diff_summary:
+                output[f.path] = f.diff_summary
         return output
 
     def changes_count(self) -> Dict:
@@ -1031,11 +1659,19 @@ class Upload(db.Model):
         return os.path.join(self.upload_dir, "lockfile")
 
     def is_active(self):
-        """Check if upload is still active because there was a ping (lockfile update) from underlying process"""
-        return os.path.exists(self.lockfile) and (
+        """Check if upload is still active because there was a ping (lockfile update) from underlying process
+        or it is waiting in queue for background finalization (running job keeps lockfile updated)
+        """
+        if os.path.exists(self.lockfile) and (
             time.time() - os.path.getmtime(self.lockfile)
             < current_app.config["LOCKFILE_EXPIRATION"]
-        )
+        ):
+            return True
+        return db.session.query(
+            PushJob.query.filter_by(
+                upload_id=self.id, status=PushJobStatus.QUEUED.value
+            ).exists()
+        ).scalar()
 
     def clear(self):
         """Clean up pending upload.
@@ -1046,6 +1682,85 @@ class Upload(db.Model):
         db.session.commit()
 
 
+class PushJobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+    @classmethod
+    def values(cls):
+        return [member.value for member in cls.__members__.values()]
+
+
+class PushJob(db.Model):
+    """Asynchronous finalization of upload transaction"""
+
+    id = db.Column(db.String, primary_key=True)
+    # upload is removed once job is done, hence no foreign key
+    upload_id = db.Column(db.String, nullable=False, index=True)
+    project_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("project.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=True
+    )
+    status = db.Column(
+        ENUM(*PushJobStatus.values(), name="push_job_status"),
+        nullable=False,
+        default=PushJobStatus.QUEUED.value,
+    )
+    # progress of finalization per file path
+    files = db.Column(JSONB, nullable=False, default={})
+    # created project version
+    version = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.String, nullable=True)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    finished = db.Column(db.DateTime, nullable=True)
+    # primary WAL position once the new version is committed, a watermark for client's reads from replicas
+    lsn = db.Column(db.String, nullable=True)
+
+    project = db.relationship("Project", uselist=False)
+
+    def __init__(self, upload: Upload, files: List[str]):
+        self.id = str(uuid.uuid4())
+        self.upload_id = upload.id
+        self.project_id = upload.project_id
+        self.user_id = upload.user_id
+        self.status = PushJobStatus.QUEUED.value
+        self.files = {path: "queued" for path in files}
+
+    def update(self, **kwargs):
+        """Update job state outside of ongoing db session transaction, so that progress is
+        immediately visible to other processes while finalization is running.
+        Finished job records primary WAL position, which covers the new project version.
+        """
+        with db.engine.begin() as conn:
+            if kwargs.get("status") == PushJobStatus.FINISHED.value and replica_binds():
+                kwargs["lsn"] = conn.execute(
+                    text("SELECT pg_current_wal_lsn()")
+                ).scalar()
+            conn.execute(
+                PushJob.__table__.update()
+                .where(PushJob.__table__.c.id == self.id)
+                .values(**kwargs)
+            )
+        for key, value in kwargs.items():
+            set_committed_value(self, key, value)
+
+    def set_progress(self, path: str, state: str):
+        self.update(files={**self.files, path: state})
+
+    def is_pending(self) -> bool:
+        return self.status in (
+            PushJobStatus.QUEUED.value,
+            PushJobStatus.RUNNING.value,
+        )
+
+
 class RequestStatus(Enum):
     ACCEPTED = "accepted"
     DECLINED = "declined"
@@ -1170,6 +1885,7 @@ class GeodiffActionHistory(db.Model):
         target_version: str,
         action: str,
         diff_path: str,
+        geodiff=None,
     ):
         self.project_id = project_id
         self.base_version = base_version
@@ -1180,7 +1896,9 @@ class GeodiffActionHistory(db.Model):
 
         if os.path.exists(diff_path):
             self.diff_size = os.path.getsize(diff_path)
-            self.changes = GeoDiff().changes_count(diff_path)
+            # storage geodiff service is used to not block gevent hub with reading the whole diff
+            geodiff = geodiff or GeoDiff()
+            self.changes = geodiff.changes_count(diff_path)
 
 
 class ProjectUser(db.Model):
@@ -4,7 +4,7 @@
 
 import os
 from functools import wraps
-from typing import Optional
+from typing import Callable, Optional, List, Dict
 from flask import abort, current_app
 from flask_login import current_user
 from sqlalchemy import or_
@@ -32,7 +32,33 @@ class ProjectPermissions:
     class Base:
         @classmethod
         def check(cls, project: Project, user: User) -> bool:
-            """Basic check for any permission"""
+            """Check permission of user for project"""
+            project_role = project.get_role(user.id) if user.is_authenticated else None
+            return cls.resolve(
+                project,
+                user,
+                project_role,
+                lambda permission: check_project_workspace_permissions(
+                    project, user, permission
+                ),
+            )
+
+        @classmethod
+        def resolve(
+            cls,
+            project: Project,
+            user: User,
+            project_role: Optional[ProjectRole],
+            workspace_permission: Callable[[str], bool],
+        ) -> bool:
+            """Evaluate permission rules with project role and workspace permissions of user already known.
+
+            :param project: project to check
+            :param user: user to check
+            :param project_role: role of user in project members, if any
+            :param workspace_permission: callback checking user permission (e.g. 'read') in project workspace
+            :returns: whether user has permission
+            """
             # this means project was permanently 'removed'
             if project.storage_params is None:
                 return False
@@ -47,15 +73,16 @@ class ProjectPermissions:
     class Read(Base):
         @classmethod
         @_is_superuser
-        def check(cls, project, user):
+        def resolve(cls, project, user, project_role, workspace_permission):
             # public active projects can be access by anyone
             if project.public and not project.removed_at:
                 return True
 
-            project_role = project.get_role(user.id) if user.is_authenticated else None
-            return super().check(project, user) and (
+            return super().resolve(
+                project, user, project_role, workspace_permission
+            ) and (
                 (project_role and project_role >= ProjectRole.READER)
-                or (check_project_workspace_permissions(project, user, "read"))
+                or workspace_permission("read")
             )
 
         @classmethod
@@ -103,62 +130,48 @@ class ProjectPermissions:
     class Edit(Base):
         @classmethod
         @_is_superuser
-        def check(self, project, user):
-            project_role = project.get_role(user.id) if user.is_authenticated else None
-            return super().check(project, user) and (
-                (
-                    (project_role and project_role >= ProjectRole.EDITOR)
-                    or check_project_workspace_permissions(project, user, "edit")
-                )
+        def resolve(cls, project, user, project_role, workspace_permission):
+            return super().resolve(
+                project, user, project_role, workspace_permission
+            ) and (
+                (project_role and project_role >= ProjectRole.EDITOR)
+                or workspace_permission("edit")
             )
 
     class Upload(Base):
         @classmethod
         @_is_superuser
-        def check(cls, project, user):
-            project_role = project.get_role(user.id) if user.is_authenticated else None
-            return super().check(project, user) and (
-                (
-                    (project_role and project_role >= ProjectRole.WRITER)
-                    or check_project_workspace_permissions(project, user, "write")
-                )
+        def resolve(cls, project, user, project_role, workspace_permission):
+            return super().resolve(
+                project, user, project_role, workspace_permission
+            ) and (
+                (project_role and project_role >= ProjectRole.WRITER)
+                or workspace_permission("write")
             )
 
     class Update(Base):
         @classmethod
         @_is_superuser
-        def check(cls, project, user):
-            project_role = project.get_role(user.id) if user.is_authenticated else None
-            return super().check(project, user) and (
-                (
-                    project_role is ProjectRole.OWNER
-                    or check_project_workspace_permissions(project, user, "admin")
-                )
-            )
+        def resolve(cls, project, user, project_role, workspace_permission):
+            return super().resolve(
+                project, user, project_role, workspace_permission
+            ) and (project_role is ProjectRole.OWNER or workspace_permission("admin"))
 
     class Delete(Base):
         @classmethod
         @_is_superuser
-        def check(cls, project, user):
-            project_role = project.get_role(user.id) if user.is_authenticated else None
-            return super().check(project, user) and (
-                (
-                    project_role is ProjectRole.OWNER
-                    or check_project_workspace_permissions(project, user, "admin")
-                )
-            )
+        def resolve(cls, project, user, project_role, workspace_permission):
+            return super().resolve(
+                project, user, project_role, workspace_permission
+            ) and (project_role is ProjectRole.OWNER or workspace_permission("admin"))
 
     class All(Base):
         @classmethod
         @_is_superuser
-        def check(cls, project, user):
-            project_role = project.get_role(user.id) if user.is_authenticated else None
-            return super().check(project, user) and (
-                (
-                    project_role is ProjectRole.OWNER
-                    or check_project_workspace_permissions(project, user, "admin")
-                )
-            )
+        def resolve(cls, project, user, project_role, workspace_permission):
+            return super().resolve(
+                project, user, project_role, workspace_permission
+            ) and (project_role is ProjectRole.OWNER or workspace_permission("admin"))
 
     @classmethod
     def get_user_project_role(
@@ -167,13 +180,33 @@ class ProjectPermissions:
         """Get the highest role of user for given project.
         It can be based on local project settings or some global workspace settings.
         """
-        if self.All.check(project, user):
+        project_role = project.get_role(user.id) if user.is_authenticated else None
+        return self.resolve_user_project_role(
+            project,
+            user,
+            project_role,
+            lambda permission: check_project_workspace_permissions(
+                project, user, permission
+            ),
+        )
+
+    @classmethod
+    def resolve_user_project_role(
+        self,
+        project: Project,
+        user: User,
+        project_role: Optional[ProjectRole],
+        workspace_permission: Callable[[str], bool],
+    ) -> Optional[ProjectRole]:
+        """Get the highest role of user for given project with project role and workspace permissions already known"""
+        args = (project, user, project_role, workspace_permission)
+        if self.All.resolve(*args):
             return ProjectRole.OWNER
-        if self.Upload.check(project, user):
+        if self.Upload.resolve(*args):
             return ProjectRole.WRITER
-        if self.Edit.check(project, user):
+        if self.Edit.resolve(*args):
             return ProjectRole.EDITOR
-        if self.Read.check(project, user):
+        if self.Read.resolve(*args):
             return ProjectRole.READER
         return None
 
@@ -246,6 +279,73 @@ def projects_query(permission, as_admin=True, public=True):
     return permission.query(current_user, as_admin, public)
 
 
+def resolve_projects_access(projects: List[Project], user: User) -> Dict:
+    """Resolve members of projects and permissions of user for them in a fixed number of queries.
+
+    Rules of ProjectPermissions are evaluated with memberships loaded for all projects at once
+    and workspace permissions of user resolved once per workspace. Result is meant to be passed
+    as context to project schemas.
+
+    :param projects: projects to resolve, e.g. page of projects list
+    :param user: user to resolve permissions for
+    :returns: context with users_map, workspaces_map, members_map, roles_map and permissions_map
+    """
+    projects_ids = [p.id for p in projects]
+    members_map = {p.id: {} for p in projects}
+    users_map = {}
+    if projects_ids:
+        members = (
+            db.session.query(ProjectUser.project_id, ProjectUser.role, User)
+            .join(User, User.id == ProjectUser.user_id)
+            .filter(ProjectUser.project_id.in_(projects_ids))
+            .all()
+        )
+        for project_id, role, member in members:
+            members_map[project_id][member.id] = ProjectRole(role)
+            if member.active:
+                users_map[member.id] = member.username
+
+    workspaces = current_app.ws_handler.get_by_ids({p.workspace_id for p in projects})
+    workspaces_map = {ws.id: ws.name for ws in workspaces}
+    workspaces_permissions = {}
+    if user.is_authenticated and user.active:
+        workspaces_permissions = {
+            ws.id: {
+                perm: ws.user_has_permissions(user, perm)
+                for perm in ("read", "edit", "write", "admin")
+            }
+            for ws in workspaces
+        }
+
+    roles_map = {}
+    permissions_map = {}
+    for project in projects:
+        project_role = (
+            members_map[project.id].get(user.id) if user.is_authenticated else None
+        )
+        ws_permissions = workspaces_permissions.get(project.workspace_id, {})
+        args = (
+            project,
+            user,
+            project_role,
+            lambda perm: ws_permissions.get(perm, False),
+        )
+        roles_map[project.id] = ProjectPermissions.resolve_user_project_role(*args)
+        permissions_map[project.id] = {
+            "upload": ProjectPermissions.Edit.resolve(*args),
+            "update": ProjectPermissions.Update.resolve(*args),
+            "delete": ProjectPermissions.Delete.resolve(*args),
+        }
+
+    return {
+        "users_map": users_map,
+        "workspaces_map": workspaces_map,
+        "members_map": members_map,
+        "roles_map": roles_map,
+        "permissions_map": permissions_map,
+    }
+
+
 def check_project_workspace_permissions(project, user, permissions):
     """check if user has permission to workspace
     :param project: project
@@ -32,7 +32,12 @@ from .permissions import (
     ProjectPermissions,
     check_workspace_permissions,
 )
-from ..utils import parse_order_params, split_order_param, get_order_param
+from ..utils import (
+    parse_order_params,
+    split_order_param,
+    get_order_param,
+    paginate,
+)
 
 project_access_granted = signal("project_access_granted")
 
@@ -159,8 +164,7 @@ def get_project_access_requests(page, per_page, order_params=None, project_name=
         order_by_params = parse_order_params(AccessRequest, order_params)
         access_requests = access_requests.order_by(*order_by_params)
 
-    result = access_requests.paginate(page, per_page).items
-    total = access_requests.paginate(page, per_page).total
+    result, total = paginate(access_requests, page, per_page)
     data = ProjectAccessRequestSchema(many=True).dump(result)
     data = {"items": data, "count": total}
     return data, 200
@@ -187,8 +191,7 @@ def list_namespace_project_access_requests(
         order_by_params = parse_order_params(AccessRequest, order_params)
         access_requests = access_requests.order_by(*order_by_params)
 
-    result = access_requests.paginate(page, per_page).items
-    total = access_requests.paginate(page, per_page).total
+    result, total = paginate(access_requests, page, per_page)
     data = ProjectAccessRequestSchema(many=True).dump(result)
     data = {"items": data, "count": total}
     return data, 200
@@ -216,8 +219,7 @@ def list_projects(page, per_page, order_params=None, like=None):  # noqa: E501
                 order_by_params.append(get_order_param(Project, order_param))
         projects = projects.order_by(*order_by_params)
 
-    result = projects.paginate(page, per_page).items
-    total = projects.paginate(page, per_page).total
+    result, total = paginate(projects, page, per_page)
     data = AdminProjectSchema(many=True).dump(result)
     data = {"items": data, "count": total}
     return data, 200
@@ -3,14 +3,17 @@
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
 import binascii
+import hashlib
 import functools
 import json
 import os
 import logging
+import time
 from dataclasses import asdict
-from typing import Dict
+from typing import Callable, Dict, List
 from urllib.parse import quote
 import uuid
+from contextvars import copy_context
 from datetime import datetime
 
 import psycopg2
@@ -19,7 +22,6 @@ from connexion import NoContent, request
 from flask import (
     abort,
     current_app,
-    send_from_directory,
     jsonify,
     make_response,
 )
@@ -27,8 +29,8 @@ from pygeodiff import GeoDiffLibError
 from flask_login import current_user
 from sqlalchemy import and_, desc, asc
 from sqlalchemy.exc import IntegrityError
-from binaryornot.check import is_binary
-from gevent import sleep
+from gevent import iwait, sleep
+from gevent.pool import Pool
 import base64
 
 from werkzeug.exceptions import HTTPException
@@ -39,6 +41,7 @@ from .interfaces import WorkspaceRole
 from ..app import db
 from ..auth import auth_required
 from ..auth.models import User
+from ..replicas import primary_only, set_watermark
 from .models import (
     Project,
     ProjectVersion,
@@ -46,8 +49,9 @@ from .models import (
     PushChangeType,
     FileHistory,
     ProjectFilePath,
-    ProjectUser,
     ProjectRole,
+    PushJob,
+    FileDiffSquash,
 )
 from .files import (
     UploadChanges,
@@ -55,6 +59,8 @@ from .files import (
     UploadFileSchema,
     ProjectFileSchema,
     FileSchema,
+    PushPlan,
+    InvalidChangesError,
 )
 from .schemas import (
     ProjectSchema,
@@ -64,20 +70,32 @@ from .schemas import (
     UserWorkspaceSchema,
     FileHistorySchema,
     ProjectVersionListSchema,
+    PushJobSchema,
+)
+from .storages.storage import (
+    FileNotFound,
+    DataSyncError,
+    InitializationError,
+    files_manifest,
+    ranged_response,
+)
+from .storages.disk import (
+    save_to_file,
+    move_to_tmp,
+    assemble_chunks,
+    save_chunk_digest,
+    read_chunk_digest,
 )
-from .storages.storage import FileNotFound, DataSyncError, InitializationError
-from .storages.disk import save_to_file, move_to_tmp
 from .permissions import (
     require_project,
     projects_query,
     ProjectPermissions,
     get_upload,
     require_project_by_uuid,
+    resolve_projects_access,
 )
 from .utils import (
-    generate_checksum,
     Toucher,
-    is_file_name_blacklisted,
     get_ip,
     get_user_agent,
     generate_location,
@@ -86,13 +104,11 @@ from .utils import (
     is_versioned_file,
     get_project_path,
     get_device_id,
-    is_valid_path,
     is_supported_type,
-    is_supported_extension,
-    get_mimetype,
 )
 from .errors import StorageLimitHit
-from ..utils import format_time_delta
+from ..utils import format_time_delta, paginate, keyset_filter, encode_cursor
+from .workspace import projects_order_by
 
 push_finished = signal("push_finished")
 # TODO: Move to database events to handle all commits to project versions
@@ -218,7 +234,7 @@ def add_project(namespace):  # noqa: E501
             abort(409, msg)
 
         request.json["storage_params"] = {
-            "type": "local",
+            "type": current_app.config["STORAGE_TYPE"],
             "location": generate_location(),
         }
 
@@ -300,7 +316,7 @@ def download_project(
     :type project_name: str
     :param namespace: Workspace for project to look into.
     :type namespace: str
-    :param format: Output format (only zip available).
+    :param format: Output format (zip or raw stream of concatenated files described by manifest).
     :type format: str
     :param version: Particular version to download
     :type version: str
@@ -315,7 +331,12 @@ def download_project(
         project_id=project.id, name=lookup_version
     ).first_or_404("Project version does not exist")
 
-    if project_version.project_size > current_app.config["MAX_DOWNLOAD_ARCHIVE_SIZE"]:
+    # raw stream can be resumed hence it is not limited
+    if (
+        format != "raw"
+        and project_version.project_size
+        > current_app.config["MAX_DOWNLOAD_ARCHIVE_SIZE"]
+    ):
         abort(
             400,
             "The total size of requested files is too large to download as a single zip, "
@@ -331,6 +352,36 @@ def download_project(
         abort(404, str(e))
 
 
+def get_project_manifest(namespace, project_name, version=None):  # noqa: E501
+    """Get manifest of project version files
+
+    Describe files in project version as parts of raw project download stream. # noqa: E501
+
+    :param project_name: Name of project.
+    :type project_name: str
+    :param namespace: Workspace for project to look into.
+    :type namespace: str
+    :param version: Particular version
+    :type version: str
+
+    :rtype: Dict
+    """
+    project = require_project(namespace, project_name, ProjectPermissions.Read)
+    lookup_version = (
+        ProjectVersion.from_v_name(version) if version else project.latest_version
+    )
+    project_version = ProjectVersion.query.filter_by(
+        project_id=project.id, name=lookup_version
+    ).first_or_404("Project version does not exist")
+    manifest = files_manifest(project_version.files)
+    return (
+        jsonify(
+            {"version": ProjectVersion.to_v_name(project_version.name), **manifest}
+        ),
+        200,
+    )
+
+
 def download_project_file(
     project_name, namespace, file, version=None, diff=None
 ):  # noqa: E501
@@ -378,17 +429,21 @@ def download_project_file(
         if not fh.diff:
             abort(404, f"No diff in particular file {file} version")
         file_path = fh.diff_file.location
+        checksum = fh.diff_file.checksum
     else:
         file_path = fh.location
+        checksum = fh.checksum
 
     if version and not diff:
         project.storage.restore_versioned_file(
             file, ProjectVersion.from_v_name(version)
         )
 
-    abs_path = os.path.join(project.storage.project_dir, file_path)
     # check file exists (e.g. there might have been issue with restore)
-    if not os.path.exists(abs_path):
+    try:
+        size = project.storage.file_size(file_path)
+        mime_type = project.storage.file_mimetype(file_path)
+    except FileNotFound:
         logging.error(f"Missing file {namespace}/{project_name}/{file_path}")
         abort(404)
 
@@ -402,14 +457,14 @@ def download_project_file(
         resp.headers["X-Accel-Buffering"] = True
         resp.headers["X-Accel-Expires"] = "off"
     else:
-        resp = send_from_directory(
-            os.path.dirname(abs_path), os.path.basename(abs_path)
+        resp = ranged_response(
+            lambda offset, length: project.storage.read_file(
+                file_path, offset=offset, length=length
+            ),
+            size,
+            etag=checksum,
         )
 
-    if not is_binary(abs_path):
-        mime_type = "text/plain"
-    else:
-        mime_type = get_mimetype(abs_path)
     resp.headers["Content-Type"] = mime_type
     resp.headers["Content-Disposition"] = "attachment; filename={}".format(
         quote(os.path.basename(file).encode("utf-8"))
@@ -418,6 +473,94 @@ def download_project_file(
     return resp
 
 
+def download_file_delta(project_name, namespace, file, since, to=None):  # noqa: E501
+    """Download changeset of versioned file between two project versions
+
+    All diffs of file are concatenated into single changeset so that client can update file at once. # noqa: E501
+
+    :param project_name: Project name.
+    :type project_name: str
+    :param namespace: Workspace for project to look into.
+    :type namespace: str
+    :param file: Path to file.
+    :type file: str
+    :param since: Version the changeset starts from.
+    :type since: str
+    :param to: Version the changeset leads to, defaults to the latest version.
+    :type to: str
+
+    :rtype: file
+    """
+    project = require_project(namespace, project_name, ProjectPermissions.Read)
+    if not is_versioned_file(file):
+        abort(400, f"File {file} is not versioned")
+    if not since:
+        abort(400, "Version to start from is missing")
+    since = ProjectVersion.from_v_name(since)
+    to = ProjectVersion.from_v_name(to) if to else project.latest_version
+    if not 0 < since < to <= project.latest_version:
+        abort(400, "Invalid versions range")
+
+    history = FileHistory.changes(project.id, file, since + 1, to, diffable=True)
+    if not history:
+        return NoContent, 204
+    if any(not item.diff for item in history):
+        abort(
+            422,
+            f"File {file} was overwritten or removed in between, changeset is not available",
+        )
+
+    history.reverse()
+    squashes = {
+        (squash.start, squash.end): squash
+        for squash in FileDiffSquash.query.filter(
+            FileDiffSquash.file_path_id == history[0].file_path_id,
+            FileDiffSquash.end <= to,
+        )
+    }
+    diffs = FileDiffSquash.compact_chain(history, squashes, since, to)
+    # changeset is identified by diffs it is built from
+    etag = hashlib.sha1("".join(d.checksum for d in diffs).encode()).hexdigest()
+    v_since = ProjectVersion.to_v_name(since)
+    v_to = ProjectVersion.to_v_name(to)
+    cache_key = os.path.join(
+        project.storage_params["location"],
+        "delta",
+        str(history[0].file_path_id),
+        f"{v_since}-{v_to}-{etag}",
+    )
+    dest = os.path.join(project.storage.geodiff_working_dir, str(uuid.uuid4()))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    result = project.storage.create_delta(diffs, cache_key, dest)
+    if not result.ok():
+        logging.error(
+            f"Failed to create changeset of {file} in {namespace}/{project_name} between {v_since} and {v_to}: {result.value}"
+        )
+        abort(422, "Failed to create changeset")
+
+    size = os.path.getsize(dest)
+
+    def _reader(offset, length):
+        remaining = length
+        with open(dest, "rb") as fp:
+            fp.seek(offset)
+            while remaining > 0:
+                data = fp.read(min(4096, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                sleep(0)
+                yield data
+
+    resp = ranged_response(_reader, size, etag=etag)
+    # temporary changeset is removed once response is closed, even if it was not read at all (e.g. HEAD or 416)
+    resp.call_on_close(functools.partial(os.remove, dest))
+    resp.headers["Content-Disposition"] = "attachment; filename={}".format(
+        quote(f"{os.path.basename(file)}-diff-{v_since}-{v_to}".encode("utf-8"))
+    )
+    return resp
+
+
 def get_project(project_name, namespace, since="", version=None):  # noqa: E501
     """Find project by name.
 
@@ -442,17 +585,18 @@ def get_project(project_name, namespace, since="", version=None):  # noqa: E501
         data = ProjectSchema(exclude=["storage_params"]).dump(project)
         # append history for versioned files
         files = []
+        history = FileHistory.files_changes(
+            project.id,
+            [f.path for f in project.files],
+            ProjectVersion.from_v_name(since),
+            project.latest_version,
+        )
+        history_schema = FileHistorySchema(exclude=("mtime",))
         for f in project.files:
-            history_field = {}
-            for item in FileHistory.changes(
-                project.id,
-                f.path,
-                ProjectVersion.from_v_name(since),
-                project.latest_version,
-            ):
-                history_field[ProjectVersion.to_v_name(item.version.name)] = (
-                    FileHistorySchema(exclude=("mtime",)).dump(item)
-                )
+            history_field = {
+                ProjectVersion.to_v_name(item.version.name): history_schema.dump(item)
+                for item in history.get(f.path, [])
+            }
             files.append({**asdict(f), "history": history_field})
         data["files"] = files
     elif version:
@@ -495,8 +639,7 @@ def get_paginated_project_versions(
         if descending
         else query.order_by(asc(ProjectVersion.name))
     )
-    result = query.paginate(page, per_page).items
-    total = query.paginate(page, per_page).total
+    result, total = paginate(query, page, per_page)
     versions = ProjectVersionListSchema(many=True).dump(result)
     data = {"versions": versions, "count": total}
     return data, 200
@@ -529,15 +672,7 @@ def get_projects_by_names():  # noqa: E501
             Project.workspace_id == workspace.id, Project.name == name
         ).first()
         if result:
-            users_map = {
-                u.id: u.username
-                for u in User.query.select_from(ProjectUser)
-                .join(User)
-                .filter(ProjectUser.project_id == result.id)
-                .all()
-            }
-            workspaces_map = {workspace.id: workspace.name}
-            ctx = {"users_map": users_map, "workspaces_map": workspaces_map}
+            ctx = resolve_projects_access([result], current_user)
             results[project] = ProjectListSchema(context=ctx).dump(result)
         else:
             if not current_user or not current_user.is_authenticated:
@@ -566,25 +701,16 @@ def get_projects_by_uuids(uuids):  # noqa: E501
         .filter(Project.id.in_(proj_ids))
         .all()
     )
-    ws_ids = set([p.workspace_id for p in projects])
-    projects_ids = [p.id for p in projects]
-    users_map = {
-        u.id: u.username
-        for u in User.query.select_from(ProjectUser)
-        .join(User)
-        .filter(ProjectUser.project_id.in_(projects_ids))
-        .all()
-    }
-    workspaces_map = {w.id: w.name for w in current_app.ws_handler.get_by_ids(ws_ids)}
-    ctx = {"users_map": users_map, "workspaces_map": workspaces_map}
+    ctx = resolve_projects_access(projects, current_user)
     data = ProjectListSchema(many=True, context=ctx).dump(projects)
     projects_map = {item["id"]: item for item in data}
     return projects_map, 200
 
 
 def get_paginated_projects(
-    page,
     per_page,
+    page=1,
+    cursor=None,
     order_params=None,
     order_by=None,
     descending=False,
@@ -602,10 +728,12 @@ def get_paginated_projects(
 
     Returns paginated list of projects, optionally filtered by tags, search query, username. # noqa: E501
 
-    :param page: page number
-    :type page: int
     :param per_page: Number of results per page
     :type per_page: int
+    :param page: page number
+    :type page: int
+    :param cursor: Cursor of keyset pagination returned with previous page
+    :type cursor: str
     :param order_params: Sorting fields e.g. name_asc,updated_desc
     :type order_params: str
     :param order_by: Order by field - DEPRECATED
@@ -631,7 +759,7 @@ def get_paginated_projects(
     :param only_public: Return only public projects
     :type only_public: bool
 
-    :rtype: Dict[str: List[ProjectListItem], str: Integer]
+    :rtype: Dict[str: List[ProjectListItem], str: Integer, str: str]
     """
     projects = current_app.ws_handler.filter_projects(
         order_params,
@@ -647,26 +775,36 @@ def get_paginated_projects(
         public,
         only_public,
     )
-    result = projects.paginate(page, per_page).items
-    total = projects.paginate().total
-
-    # create user map id:username passed to project schema to minimize queries to db
-    projects_ids = [p.id for p in result]
-    users_map = {
-        u.id: u.username
-        for u in User.query.select_from(ProjectUser)
-        .join(User)
-        .filter(ProjectUser.project_id.in_(projects_ids))
-        .all()
-    }
-    ws_ids = [p.workspace_id for p in projects]
-    workspaces_map = {w.id: w.name for w in current_app.ws_handler.get_by_ids(ws_ids)}
-    ctx = {"users_map": users_map, "workspaces_map": workspaces_map}
+    if cursor is None:
+        result, total = paginate(projects, page, per_page)
+        order_by_params = None
+    else:
+        # creation time and id make the order unique, hence stable for keyset pagination
+        order_by_params = projects_order_by(order_params, order_by, descending) + [
+            Project.__table__.c.created.asc(),
+            Project.__table__.c.id.asc(),
+        ]
+        projects = projects.order_by(None).order_by(*order_by_params)
+        if cursor:
+            try:
+                projects = keyset_filter(projects, order_by_params, cursor)
+            except ValueError as e:
+                abort(400, str(e))
+        result = projects.limit(per_page).all()
+        total = None
+
+    # resolve members and permissions of the whole page at once to minimize queries to db
+    ctx = resolve_projects_access(result, current_user)
     sleep(
         0
     )  # temporary yield to gevent hub until serialization is fully resolved (#317)
     data = ProjectListSchema(many=True, context=ctx).dump(result)
-    data = {"projects": data, "count": total}
+    next_cursor = (
+        encode_cursor(order_by_params, result[-1])
+        if order_by_params and len(result) == per_page
+        else None
+    )
+    data = {"projects": data, "count": total, "next_cursor": next_cursor}
     return data, 200
 
 
@@ -810,67 +948,16 @@ def project_push(namespace, project_name):
         abort(400, "Another process is running. Please try later.")
 
     upload_changes = ChangesSchema(context={"version": version + 1}).load(changes)
-
-    for item in upload_changes.added:
-        # check if same file is not already uploaded
-        if not all(ele.path != item.path for ele in project.files):
-            abort(400, f"File {item.path} has been already uploaded")
-        if not is_valid_path(item.path):
-            abort(
-                400,
-                f"Unsupported file name detected: {item.path}. Please remove the invalid characters.",
-            )
-        if not is_supported_extension(item.path):
-            abort(
-                400,
-                f"Unsupported file type detected: {item.path}. "
-                f"Please remove the file or try compressing it into a ZIP file before uploading",
-            )
-
-    # changes' files must be unique
-    changes_files = [
-        f.path
-        for f in upload_changes.added + upload_changes.updated + upload_changes.removed
-    ]
-    if len(set(changes_files)) != len(changes_files):
-        abort(400, "Not unique changes")
-
-    sanitized_files = []
-    blacklisted_files = []
-    for f in upload_changes.added + upload_changes.updated + upload_changes.removed:
-        # check if .gpkg file is valid
-        if is_versioned_file(f.path):
-            if not f.is_valid_gpkg():
-                abort(400, f"File {f.path} is not valid")
-        if is_file_name_blacklisted(f.path, current_app.config["BLACKLIST"]):
-            blacklisted_files.append(f.path)
-        # all file need to be unique after sanitized
-        if f.location in sanitized_files:
-            filename, file_extension = os.path.splitext(f.location)
-            f.location = filename + f".{str(uuid.uuid4())}" + file_extension
-        sanitized_files.append(f.location)
-        if f.diff:
-            if f.diff.location in sanitized_files:
-                filename, file_extension = os.path.splitext(f.diff.location)
-                f.diff.location = filename + f".{str(uuid.uuid4())}" + file_extension
-            sanitized_files.append(f.diff.location)
-
-    # remove blacklisted files from changes
-    for key in upload_changes.__dict__.keys():
-        new_value = [
-            f for f in getattr(upload_changes, key) if f.path not in blacklisted_files
-        ]
-        setattr(upload_changes, key, new_value)
+    push_plan = PushPlan(upload_changes, project.files_map)
+    try:
+        push_plan.validate()
+    except InvalidChangesError as e:
+        abort(400, str(e))
+    push_plan.sanitize_locations()
+    push_plan.remove_blacklisted(current_app.config["BLACKLIST"])
 
     # Check user data limit
-    updates = [f.path for f in upload_changes.updated]
-    updated_files = list(filter(lambda i: i.path in updates, project.files))
-    additional_disk_usage = (
-        sum(file.size for file in upload_changes.added + upload_changes.updated)
-        - sum(file.size for file in updated_files)
-        - sum(file.size for file in upload_changes.removed)
-    )
-
+    additional_disk_usage = push_plan.disk_usage_delta()
     current_usage = ws.disk_usage()
     requested_storage = current_usage + additional_disk_usage
     if requested_storage > ws.storage:
@@ -981,52 +1068,91 @@ def chunk_upload(transaction_id, chunk_id):
             dest = os.path.join(upload_dir, "chunks", chunk_id)
             lockfile = os.path.join(upload_dir, "lockfile")
             with Toucher(lockfile, 30):
+                # checksum is calculated as data are streamed to disk to avoid reading chunk again
+                checksum = hashlib.sha1()
                 try:
                     # we could have used request.data here, but it could eventually cause OOM issue
                     save_to_file(
-                        request.stream, dest, current_app.config["MAX_CHUNK_SIZE"]
+                        request.stream,
+                        dest,
+                        current_app.config["MAX_CHUNK_SIZE"],
+                        checksum,
                     )
                 except IOError:
                     move_to_tmp(dest, transaction_id)
                     abort(400, "Too big chunk")
                 if os.path.exists(dest):
-                    checksum = generate_checksum(dest)
                     size = os.path.getsize(dest)
-                    return jsonify({"checksum": checksum, "size": size}), 200
+                    save_chunk_digest(dest, checksum.hexdigest(), size)
+                    return (
+                        jsonify({"checksum": checksum.hexdigest(), "size": size}),
+                        200,
+                    )
                 else:
                     abort(400, "Upload was probably canceled")
     abort(404)
 
 
-@auth_required
-@catch_sync_failure
-def push_finish(transaction_id):
-    """Finalize project data upload.
+def get_incomplete_files(changes: UploadChanges, upload_dir: str) -> List[str]:
+    """Find uploaded files with chunks not matching expected file size or checksum.
 
-    Steps involved in finalization:
-     - merge chunks together (if there are some)
-     - do integrity check comparing uploaded file sizes with what was expected
-     - move uploaded files to new version dir and applying sync changes (e.g. geodiff apply_changeset)
-     - bump up version in database
-     - remove artifacts (chunks, lockfile) by moving them to tmp directory
-
-    :param transaction_id: Transaction id.
-    :type transaction_id: str
-
-    :rtype: None
+    Only digests recorded on chunk upload are used, so that incomplete files are rejected without touching their data.
+    Checksum is verified for files uploaded in a single chunk where chunk digest is the digest of the whole file.
+    """
+    incomplete = []
+    for f in changes.added + changes.updated:
+        expected = f.diff if f.diff is not None else f
+        chunks = [os.path.join(upload_dir, "chunks", chunk_id) for chunk_id in f.chunks]
+        digests = [read_chunk_digest(chunk) for chunk in chunks]
+        if not all(digests):
+            continue
+        if sum(d["size"] for d in digests) != expected.size or (
+            len(digests) == 1 and digests[0]["checksum"] != expected.checksum
+        ):
+            logging.error(
+                "Data integrity check has failed on file %s in upload %s"
+                % (f.path, upload_dir)
+            )
+            incomplete.append(f.path)
+    return incomplete
+
+
+def finish_upload(
+    upload: Upload,
+    author_id: int,
+    ip: str,
+    user_agent: str,
+    device_id: str,
+    progress: Callable[[str, str], None] = None,
+) -> ProjectVersion:
+    """Finalize upload transaction and create new project version.
+
+    Does not depend on request context, so it can run either in push_finish endpoint or in background job.
+    Failures are raised as HTTP exceptions, upload is cleared in any case.
+
+    :param upload: upload transaction to finalize
+    :param author_id: id of user who pushed changes
+    :param ip: ip address of client
+    :param user_agent: client user agent
+    :param device_id: client device id
+    :param progress: optional callback to report state of processing of particular file
+    :returns: created project version
     """
-    from .tasks import optimize_storage
+    from .tasks import optimize_storage, create_diff_squashes, create_diff_summaries
 
-    upload, upload_dir = get_upload(transaction_id)
-    request.view_args["project"] = upload.project
+    progress = progress or (lambda path, state: None)
+    transaction_id = upload.id
+    upload_dir = upload.upload_dir
     changes = ChangesSchema(context={"version": upload.version + 1}).load(
         upload.changes
     )
     project = upload.project
     project_path = get_project_path(project)
-    corrupted_files = []
+    corrupted_files = get_incomplete_files(changes, upload_dir)
 
     for f in changes.added + changes.updated:
+        if f.path in corrupted_files:
+            continue
         if f.diff is not None:
             dest_file = os.path.join(upload_dir, "files", f.diff.location)
             expected_size = f.diff.size
@@ -1035,30 +1161,25 @@ def push_finish(transaction_id):
             expected_size = f.size
 
         # Concatenate chunks into single file
-        # TODO we need to move this elsewhere since it can fail for large files (and slow FS)
-        os.makedirs(os.path.dirname(dest_file), exist_ok=True)
-        with open(dest_file, "wb") as dest:
-            try:
-                for chunk_id in f.chunks:
-                    sleep(0)  # to unblock greenlet
-                    chunk_file = os.path.join(upload_dir, "chunks", chunk_id)
-                    with open(chunk_file, "rb") as src:
-                        data = src.read(8192)
-                        while data:
-                            dest.write(data)
-                            data = src.read(8192)
-            except IOError:
-                logging.exception(
-                    "Failed to process chunk: %s in project %s"
-                    % (chunk_id, project_path)
-                )
-                corrupted_files.append(f.path)
-                continue
+        chunks = [os.path.join(upload_dir, "chunks", chunk_id) for chunk_id in f.chunks]
+        try:
+            start = time.time()
+            size = assemble_chunks(chunks, dest_file)
+            logging.info(
+                f"Chunks of file {f.path} in project {project_path} assembled in {time.time() - start} s"
+            )
+        except IOError:
+            logging.exception(
+                "Failed to process chunks of file: %s in project %s"
+                % (f.path, project_path)
+            )
+            corrupted_files.append(f.path)
+            continue
         if not is_supported_type(dest_file):
             logging.info(f"Rejecting blacklisted file: {dest_file}")
             abort(400, f"Unsupported file type detected: {f.path}")
 
-        if expected_size != os.path.getsize(dest_file):
+        if expected_size != size:
             logging.error(
                 "Data integrity check has failed on file %s in project %s"
                 % (f.path, project_path),
@@ -1069,6 +1190,8 @@ def push_finish(transaction_id):
                 if not f.is_valid_gpkg():
                     corrupted_files.append(f.path)
             corrupted_files.append(f.path)
+        else:
+            progress(f.path, "assembled")
 
     if corrupted_files:
         move_to_tmp(upload_dir)
@@ -1096,42 +1219,57 @@ def push_finish(transaction_id):
     try:
         # let's move uploaded files where they are expected to be
         os.renames(files_dir, target_dir)
-        # apply gpkg updates
-        sync_errors = {}
-        to_remove = [i.path for i in changes.removed]
-        current_files = [f for f in project.files if f.path not in to_remove]
-        for updated_file in changes.updated:
-            # yield to gevent hub since geodiff action can take some time to prevent worker timeout
-            sleep(0)
-            current_file = next(
-                (i for i in current_files if i.path == updated_file.path), None
+        uploaded_files = {
+            f.path: f.diff.location if f.diff else f.location
+            for f in changes.added + changes.updated
+        }
+        new_files = [
+            (
+                uploaded_files[f.path],
+                [os.path.join(upload_dir, "chunks", c) for c in f.chunks],
             )
-            if not current_file:
-                sync_errors[updated_file.path] = "file not found on server "
-                continue
-
+            for f in changes.added + changes.updated
+        ]
+        # apply gpkg updates, files are processed concurrently each with own geodiff instance and working dir
+        updates, missing = PushPlan(changes, project.files_map).geodiff_updates()
+        sync_errors = {path: "file not found on server " for path in missing}
+        pool = Pool(max(1, current_app.config["PUSH_GEODIFF_CONCURRENCY"]))
+        jobs = {}
+        for updated_file, current_file in updates:
             if updated_file.diff:
-                result = project.storage.apply_diff(
-                    current_file, updated_file, next_version
-                )
-                if result.ok():
-                    checksum, size = result.value
-                    updated_file.checksum = checksum
-                    updated_file.size = size
-                else:
-                    sync_errors[updated_file.path] = (
-                        f"project: {project.workspace.name}/{project.name}, {result.value}"
-                    )
+                action = project.storage.clone().apply_diff
+            else:
+                action = project.storage.clone().construct_diff
+            # greenlet does not inherit app context, run it in the copy of the current one
+            greenlet = pool.spawn(
+                copy_context().run, action, current_file, updated_file, next_version
+            )
+            jobs[greenlet] = updated_file
 
-            elif is_versioned_file(updated_file.path):
-                result = project.storage.construct_diff(
-                    current_file, updated_file, next_version
-                )
-                if result.ok():
+        try:
+            for greenlet in iwait(list(jobs)):
+                updated_file = jobs[greenlet]
+                result = greenlet.get()
+                if updated_file.diff:
+                    if result.ok():
+                        checksum, size, gh = result.value
+                        updated_file.checksum = checksum
+                        updated_file.size = size
+                        # db session is bound to greenlet, hence action record is persisted here
+                        db.session.add(gh)
+                        progress(updated_file.path, "applied")
+                    else:
+                        sync_errors[updated_file.path] = (
+                            f"project: {project.workspace.name}/{project.name}, {result.value}"
+                        )
+                elif result.ok():
                     updated_file.diff = result.value
+                    progress(updated_file.path, "applied")
                 else:
                     # if diff cannot be constructed it would be force update
                     logging.warning(f"Geodiff: create changeset error {result.value}")
+        finally:
+            pool.kill()
 
         if sync_errors:
             msg = ""
@@ -1139,14 +1277,21 @@ def push_finish(transaction_id):
                 msg += key + " error=" + value + "\n"
             raise DataSyncError(msg)
 
-        user_agent = get_user_agent(request)
-        device_id = get_device_id(request)
+        # persist new files in project storage, uploaded chunks can be reused
+        for f in changes.updated:
+            # files generated on server, either patched file from uploaded diff or constructed diff
+            if uploaded_files[f.path] != f.location:
+                new_files.append((f.location, None))
+            elif f.diff:
+                new_files.append((f.diff.location, None))
+        project.storage.commit_files(new_files)
+
         pv = ProjectVersion(
             project,
             next_version,
-            current_user.id,
+            author_id,
             changes,
-            get_ip(request),
+            ip,
             user_agent,
             device_id,
         )
@@ -1169,10 +1314,94 @@ def push_finish(transaction_id):
         # remove artifacts
         upload.clear()
 
+    if any(f.diff for f in changes.updated):
+        create_diff_summaries.delay(pv.id)
     # do not optimize on every version, every 10th is just fine
     if not project.latest_version % 10:
         optimize_storage.delay(project.id)
-    return jsonify(ProjectSchema().dump(project)), 200
+    # squashed diffs ranges are completed with even versions
+    if not project.latest_version % 2:
+        create_diff_squashes.delay(project.id)
+    return pv
+
+
+@auth_required
+@catch_sync_failure
+def push_finish(transaction_id, background=False):
+    """Finalize project data upload.
+
+    Steps involved in finalization:
+     - merge chunks together (if there are some)
+     - do integrity check comparing uploaded file sizes with what was expected
+     - move uploaded files to new version dir and applying sync changes (e.g. geodiff apply_changeset)
+     - bump up version in database
+     - remove artifacts (chunks, lockfile) by moving them to tmp directory
+
+    In background mode only cheap checks are done here and finalization is delegated to celery job.
+    Its progress can be polled with push_job_status endpoint.
+
+    :param transaction_id: Transaction id.
+    :type transaction_id: str
+    :param background: Finalize upload asynchronously
+    :type background: bool
+
+    :rtype: None
+    """
+    from .tasks import finish_push
+
+    upload, upload_dir = get_upload(transaction_id)
+    request.view_args["project"] = upload.project
+    if not background:
+        finish_upload(
+            upload,
+            current_user.id,
+            get_ip(request),
+            get_user_agent(request),
+            get_device_id(request),
+        )
+        return jsonify(ProjectSchema().dump(upload.project)), 200
+
+    if PushJob.query.filter_by(upload_id=upload.id).count():
+        abort(400, "Upload is already being finalized")
+
+    changes = ChangesSchema(context={"version": upload.version + 1}).load(
+        upload.changes
+    )
+    corrupted_files = get_incomplete_files(changes, upload_dir)
+    if corrupted_files:
+        move_to_tmp(upload_dir)
+        abort(422, {"corrupted_files": corrupted_files})
+
+    job = PushJob(upload, [f.path for f in changes.added + changes.updated])
+    db.session.add(job)
+    db.session.commit()
+    # refresh lock, so that upload stays active until the job picks it up
+    with open(upload.lockfile, "a"):
+        os.utime(upload.lockfile, None)
+    finish_push.delay(
+        job.id, get_ip(request), get_user_agent(request), get_device_id(request)
+    )
+    return jsonify(PushJobSchema().dump(job)), 202
+
+
+@primary_only
+@auth_required
+def push_job_status(job_id):
+    """Get progress of asynchronous upload finalization
+
+    :param job_id: Job id.
+    :type job_id: str
+
+    :rtype: PushJob
+    """
+    job = PushJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403, "You do not have permissions for this job")
+    response = jsonify(PushJobSchema().dump(job))
+    # new version was committed by the job, so that client needs to read it from up to date replica
+    if job.lsn:
+        set_watermark(response, job.lsn)
+    return response, 200
 
 
 @auth_required
@@ -1187,6 +1416,9 @@ def push_cancel(transaction_id):
     :rtype: None
     """
     upload, upload_dir = get_upload(transaction_id)
+    job = PushJob.query.filter_by(upload_id=upload.id).first()
+    if job and job.is_pending():
+        abort(400, "Upload is being finalized and cannot be canceled")
     db.session.delete(upload)
     db.session.commit()
     move_to_tmp(upload_dir)
@@ -1254,7 +1486,10 @@ def clone_project(namespace, project_name):  # noqa: E501
 
     p = Project(
         name=dest_project,
-        storage_params={"type": "local", "location": generate_location()},
+        storage_params={
+            "type": current_app.config["STORAGE_TYPE"],
+            "location": generate_location(),
+        },
         creator=current_user,
         workspace=ws,
     )
@@ -1320,7 +1555,8 @@ def get_resource_history(project_name, namespace, path):  # noqa: E501
 
     data = ProjectFileSchema().dump(fh)
     history_field = {}
-    for item in FileHistory.changes(project.id, path, 1, project.latest_version):
+    history = FileHistory.files_changes(project.id, [path], 1, project.latest_version)
+    for item in history.get(path, []):
         history_field[ProjectVersion.to_v_name(item.version.name)] = FileHistorySchema(
             exclude=("mtime",)
         ).dump(item)
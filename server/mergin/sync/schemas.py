@@ -2,7 +2,6 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
-import re
 from marshmallow import fields, ValidationError, Schema, post_dump
 from flask_login import current_user
 from flask import current_app
@@ -17,6 +16,7 @@ from .models import (
     PushChangeType,
     ProjectRole,
     ProjectUser,
+    PushJob,
 )
 from .workspace import WorkspaceRole
 from ..app import DateTimeWithZ, ma
@@ -26,10 +26,18 @@ from ..auth.models import User
 class ProjectAccessSchema(ma.SQLAlchemyAutoSchema):
     """Schema for legacy response with user arrays"""
 
-    owners = fields.Function(lambda obj: obj.members_by_role(ProjectRole.OWNER))
-    writers = fields.Function(lambda obj: obj.members_by_role(ProjectRole.WRITER))
-    editors = fields.Function(lambda obj: obj.members_by_role(ProjectRole.EDITOR))
-    readers = fields.Function(lambda obj: obj.members_by_role(ProjectRole.READER))
+    owners = fields.Function(
+        lambda obj, ctx: members_by_role(obj, ProjectRole.OWNER, ctx)
+    )
+    writers = fields.Function(
+        lambda obj, ctx: members_by_role(obj, ProjectRole.WRITER, ctx)
+    )
+    editors = fields.Function(
+        lambda obj, ctx: members_by_role(obj, ProjectRole.EDITOR, ctx)
+    )
+    readers = fields.Function(
+        lambda obj, ctx: members_by_role(obj, ProjectRole.READER, ctx)
+    )
     public = fields.Boolean()
 
     @post_dump
@@ -64,7 +72,20 @@ class ProjectAccessSchema(ma.SQLAlchemyAutoSchema):
         return data
 
 
-def project_user_permissions(project):
+def members_by_role(project, role, context):
+    """Project members' ids with at least required role, members_map can be passed in context to save db query"""
+    if "members_map" in context:
+        members = context["members_map"][project.id]
+        return [
+            user_id for user_id, member_role in members.items() if member_role >= role
+        ]
+    return project.members_by_role(role)
+
+
+def project_user_permissions(project, context=None):
+    if context and "permissions_map" in context:
+        # permissions resolved in batch for multiple projects can be passed as context
+        return context["permissions_map"][project.id]
     return {
         # This mapping (upload) is used by mobile and mergin client to check if it is possible to make push to server.
         # We can rename it in future upload -> Edit and add new Write key.
@@ -161,10 +182,34 @@ class ProjectAccessRequestSchema(ma.SQLAlchemyAutoSchema):
         exclude = ("resolved_by", "resolved_at", "status", "requested_at")
 
 
+class PushJobSchema(ma.SQLAlchemyAutoSchema):
+    transaction = fields.String(attribute="upload_id")
+    version = fields.Function(
+        lambda obj: ProjectVersion.to_v_name(obj.version) if obj.version else None
+    )
+    created = DateTimeWithZ()
+    finished = DateTimeWithZ()
+
+    class Meta:
+        model = PushJob
+        fields = (
+            "id",
+            "transaction",
+            "status",
+            "files",
+            "version",
+            "error",
+            "created",
+            "finished",
+        )
+
+
 class ProjectSchema(ma.SQLAlchemyAutoSchema):
     id = fields.UUID()
     files = fields.Nested(ProjectFileSchema(), many=True)
-    access = fields.Function(lambda obj: ProjectAccessSchema().dump(obj))
+    access = fields.Function(
+        lambda obj, ctx: ProjectAccessSchema(context=ctx).dump(obj)
+    )
     permissions = fields.Function(project_user_permissions)
     version = fields.Function(lambda obj: ProjectVersion.to_v_name(obj.latest_version))
     namespace = fields.Function(lambda obj: obj.workspace.name)
@@ -175,7 +220,10 @@ class ProjectSchema(ma.SQLAlchemyAutoSchema):
     role = fields.Method("_role")
 
     def _role(self, obj):
-        role = ProjectPermissions.get_user_project_role(obj, current_user)
+        if "roles_map" in self.context:
+            role = self.context["roles_map"][obj.id]
+        else:
+            role = ProjectPermissions.get_user_project_role(obj, current_user)
         if not role:
             return None
         return role.value
@@ -185,7 +233,7 @@ class ProjectSchema(ma.SQLAlchemyAutoSchema):
 
     class Meta:
         model = Project
-        exclude = ["latest_version", "storage_params"]
+        exclude = ["latest_version", "storage_params", "has_conflict", "qgis_count"]
         load_instance = True
 
 
@@ -193,7 +241,9 @@ class ProjectListSchema(ma.SQLAlchemyAutoSchema):
     id = fields.UUID()
     name = fields.Str()
     namespace = fields.Method("get_workspace_name")
-    access = fields.Function(lambda obj: ProjectAccessSchema().dump(obj))
+    access = fields.Function(
+        lambda obj, ctx: ProjectAccessSchema(context=ctx).dump(obj)
+    )
     permissions = fields.Function(project_user_permissions)
     version = fields.Function(lambda obj: ProjectVersion.to_v_name(obj.latest_version))
     updated = fields.Method("get_updated")
@@ -201,22 +251,11 @@ class ProjectListSchema(ma.SQLAlchemyAutoSchema):
     creator = fields.Integer(attribute="creator_id")
     disk_usage = fields.Integer()
     tags = fields.List(fields.Str())
-    has_conflict = fields.Method("get_has_conflict")
+    has_conflict = fields.Boolean()
 
     def get_updated(self, obj):
         return obj.updated if obj.updated else obj.created
 
-    def get_has_conflict(self, obj):
-        """Check if there is any conflict file in project generated by client
-        Patterns to check:
-        - file.[gpkg|qgs|qgz]_conflict_copy (older convention)
-        - file.gpkg_rebase_conflicts (older convention)
-        - file (conflicted copy, user vx).*
-        - file (edit conflict, user vx).json
-        """
-        regex = r"(\.gpkg|\.qgs|.qgz)(.*conflict.*)|( \(.*conflict.*)"
-        return any(re.search(regex, file.path) for file in obj.files)
-
     def get_workspace_name(self, obj):
         """Discover ProjectListSchema workspace name"""
         try:
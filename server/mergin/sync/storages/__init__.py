@@ -3,4 +3,5 @@
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
 from .disk import DiskStorage
+from .s3 import S3Storage
 from .storage import InvalidProject, FileNotFound
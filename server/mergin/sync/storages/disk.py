@@ -1,35 +1,48 @@
 # Copyright (C) Lutra Consulting Limited
 #
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+import copy
+import errno
 import os
 import io
+import json
 import tempfile
 import time
 import uuid
 import logging
 from contextlib import contextmanager
+from typing import List
 
+from binaryornot.check import is_binary
 from flask import current_app
 from pygeodiff import GeoDiff, GeoDiffLibError
 from pygeodiff.geodifflib import GeoDiffLibConflictError
-from gevent import sleep
+from gevent import sleep, get_hub
 from result import Err, Ok, Result
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
 from .storage import ProjectStorage, FileNotFound, InitializationError
+from .geodiff_service import GeoDiffService
 from ...app import db
 from ..utils import (
     generate_checksum,
+    get_mimetype,
     is_versioned_file,
 )
 from ..files import mergin_secure_filename, ProjectFile, UploadFile, File
 
 
-def save_to_file(stream, path, max_size=None):
+def save_to_file(stream, path, max_size=None, checksum=None):
     """Save readable object in file while yielding to gevent hub.
 
     :param stream: object implementing readable interface
     :param path: destination file path
     :param max_size: limit for file size
+    :param checksum: optional hashlib object updated with data as they are written
     """
     directory = os.path.abspath(os.path.dirname(path))
     os.makedirs(directory, exist_ok=True)
@@ -43,6 +56,8 @@ def save_to_file(stream, path, max_size=None):
                 size += len(part)
                 if max_size and size > max_size:
                     raise IOError()
+                if checksum is not None:
+                    checksum.update(part)
                 writer.write(part)
             else:
                 writer.flush()
@@ -67,6 +82,128 @@ def copy_file(src, dest):
         save_to_file(input, dest)
 
 
+CHUNK_DIGEST_SUFFIX = ".sha1"
+
+
+def save_chunk_digest(chunk, checksum, size):
+    """Store digest of uploaded chunk next to it so it does not need to be read again for verification.
+
+    :params chunk: abs path to chunk file
+    :type chunk: str
+    :params checksum: sha1 hex digest of chunk data
+    :type checksum: str
+    :params size: size of chunk in bytes
+    :type size: int
+    """
+    with open(chunk + CHUNK_DIGEST_SUFFIX, "w") as f:
+        json.dump({"checksum": checksum, "size": size}, f)
+
+
+def read_chunk_digest(chunk):
+    """Read digest stored by save_chunk_digest.
+
+    :params chunk: abs path to chunk file
+    :type chunk: str
+    :returns: stored checksum and size or None if chunk has no (valid) digest
+    :rtype: Optional[Dict]
+    """
+    try:
+        with open(chunk + CHUNK_DIGEST_SUFFIX, "r") as f:
+            digest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(digest, dict) or not {"checksum", "size"} <= digest.keys():
+        return None
+    return digest
+
+
+def _copy_range(src_fd, dest_fd, size):
+    """Append size bytes from src_fd to current position of dest_fd.
+
+    Kernel-side copy (copy_file_range, sendfile) is preferred, buffered copy is used as a fallback
+    if none is supported for given pair of files (e.g. cross-device copy on older kernels).
+    Source offsets are passed explicitly so that any method can take over from where previous one stopped.
+    """
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                sent = os.copy_file_range(src_fd, dest_fd, size - copied, copied)
+                if not sent:
+                    break
+                copied += sent
+            if copied == size:
+                return copied
+        except OSError as e:
+            if e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+            ):
+                raise
+
+    if hasattr(os, "sendfile"):
+        try:
+            while copied < size:
+                sent = os.sendfile(dest_fd, src_fd, copied, size - copied)
+                if not sent:
+                    break
+                copied += sent
+            if copied == size:
+                return copied
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+
+    while copied < size:
+        data = os.pread(src_fd, min(1024 * 1024, size - copied), copied)
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.write(dest_fd, view)
+            view = view[written:]
+        copied += len(data)
+    return copied
+
+
+def _assemble_chunks(chunks, dest):
+    """Blocking implementation of assemble_chunks, to be run outside of gevent hub."""
+    size = 0
+    with open(dest, "wb") as output:
+        dest_fd = output.fileno()
+        for chunk in chunks:
+            digest = read_chunk_digest(chunk)
+            with open(chunk, "rb") as src:
+                chunk_size = os.fstat(src.fileno()).st_size
+                if digest and digest["size"] != chunk_size:
+                    raise IOError(f"Chunk {chunk} does not match its recorded digest")
+                if _copy_range(src.fileno(), dest_fd, chunk_size) != chunk_size:
+                    raise IOError(f"Chunk {chunk} was not copied completely")
+                size += chunk_size
+    return size
+
+
+def assemble_chunks(chunks, dest):
+    """Concatenate uploaded chunks into single file.
+
+    Copying is done by kernel (with buffered fallback) in native thread from gevent threadpool,
+    therefore gevent hub is not blocked even for very large files.
+    Chunks with digest recorded on upload are checked against it without reading their data.
+
+    :params chunks: ordered list of abs paths to chunk files
+    :type chunks: List[str]
+    :params dest: abs path to destination file
+    :type dest: str, path-like object
+    :returns: size of assembled file
+    :rtype: int
+    """
+    directory = os.path.abspath(os.path.dirname(dest))
+    os.makedirs(directory, exist_ok=True)
+    return get_hub().threadpool.apply(_assemble_chunks, (chunks, dest))
+
+
 def copy_dir(src, dest):
     """Custom implementation of recursive copy of directory with yielding to gevent hub.
 
@@ -84,6 +221,383 @@ def copy_dir(src, dest):
             copy_file(abs_path, os.path.join(dest, rel_path))
 
 
+def link_file(src, dest):
+    """Hardlink file to destination as a cheap replacement of copy for files which are never modified in place.
+
+    :params src: abs path to file
+    :type src: str, path-like object
+    :params dest: abs path to new file
+    :type dest: str, path-like object
+    :returns: whether link was created, False if it is not supported (e.g. cross-device link)
+    :rtype: bool
+    """
+    if not os.path.isfile(src):
+        raise FileNotFoundError(src)
+    directory = os.path.abspath(os.path.dirname(dest))
+    os.makedirs(directory, exist_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        if e.errno in (
+            errno.EXDEV,
+            errno.EPERM,
+            errno.EMLINK,
+            errno.EOPNOTSUPP,
+            errno.ENOTSUP,
+        ):
+            return False
+        raise
+    return True
+
+
+# ioctl request to share file extents with copy-on-write semantics (linux/fs.h)
+FICLONE = 0x40049409
+
+
+def reflink_file(src, dest):
+    """Create copy-on-write clone of file. Supported only by some filesystems (e.g. XFS, Btrfs).
+
+    :params src: abs path to file
+    :type src: str, path-like object
+    :params dest: abs path to new file
+    :type dest: str, path-like object
+    :returns: whether clone was created
+    :rtype: bool
+    """
+    if fcntl is None:
+        return False
+    directory = os.path.abspath(os.path.dirname(dest))
+    os.makedirs(directory, exist_ok=True)
+    with open(src, "rb") as input, open(dest, "wb") as output:
+        try:
+            fcntl.ioctl(output.fileno(), FICLONE, input.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in (
+                errno.EOPNOTSUPP,
+                errno.ENOTSUP,
+                errno.ENOTTY,
+                errno.EXDEV,
+                errno.EINVAL,
+            ):
+                raise
+    os.remove(dest)
+    return False
+
+
+def _copy_file(src, dest):
+    """Copy file by kernel (with buffered fallback), blocking"""
+    directory = os.path.abspath(os.path.dirname(dest))
+    os.makedirs(directory, exist_ok=True)
+    with open(src, "rb") as input, open(dest, "wb") as output:
+        size = os.fstat(input.fileno()).st_size
+        if _copy_range(input.fileno(), output.fileno(), size) != size:
+            raise IOError(f"File {src} was not copied completely")
+
+
+def _clone_file(src, dest):
+    """Blocking implementation of clone_files for single file, returns method used"""
+    if reflink_file(src, dest):
+        return "reflink"
+    if link_file(src, dest):
+        return "hardlink"
+    _copy_file(src, dest)
+    return "copy"
+
+
+def clone_files(files):
+    """Clone files which are never modified in place (e.g. project version files).
+
+    Copy-on-write reflink is tried first, then hardlink and finally full copy.
+    Files are processed concurrently in native threads from gevent threadpool.
+
+    :params files: list of (source, destination) abs paths
+    :type files: List[Tuple[str, str]]
+    :returns: method used for each file (reflink, hardlink or copy)
+    :rtype: List[str]
+    """
+    pool = get_hub().threadpool
+    jobs = [pool.spawn(_clone_file, src, dest) for src, dest in files]
+    return [job.get() for job in jobs]
+
+
+class BlobStore:
+    """Content addressable store of project files keyed by their sha1 checksum.
+
+    Blobs are shared with project version directories (and other projects) through hardlinks,
+    hence number of links to blob inode serves as its reference count. Blob which is not linked
+    from anywhere else than from the store is garbage and can be removed.
+    Store needs to be on the same filesystem as projects directory.
+    Files which were verified but could not be shared are recorded by markers (keyed by file inode,
+    size and mtime), so that they are not read again on next attempt.
+    """
+
+    UNSHARED_DIR = "unshared"
+
+    def __init__(self, root=None):
+        self.root = root or current_app.config["BLOB_STORE_DIR"]
+
+    def blob_path(self, checksum):
+        return os.path.join(self.root, checksum[:2], checksum[2:4], checksum)
+
+    def refcount(self, checksum):
+        """Number of files linked to blob"""
+        try:
+            return os.stat(self.blob_path(checksum)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def add(self, path, checksum):
+        """Add project file to blob store.
+        If there is a blob with the same content file is replaced by link to it,
+        otherwise file becomes a new blob. File content is verified before it is shared.
+
+        :params path: abs path to project file
+        :type path: str
+        :params checksum: expected sha1 checksum of file
+        :type checksum: str
+        :returns: whether file is shared through blob store
+        :rtype: bool
+        """
+        try:
+            file_stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        marker = self._unshared_marker(checksum, file_stat)
+        if os.path.exists(marker):
+            return False
+        blob = self.blob_path(checksum)
+        try:
+            blob_stat = os.stat(blob)
+        except FileNotFoundError:
+            blob_stat = None
+        if blob_stat:
+            if (blob_stat.st_dev, blob_stat.st_ino) == (
+                file_stat.st_dev,
+                file_stat.st_ino,
+            ):
+                return True
+            if blob_stat.st_size != file_stat.st_size:
+                return False
+
+        if generate_checksum(path) != checksum:
+            logging.warning(f"File {path} does not match its checksum {checksum}")
+            shared = False
+        elif blob_stat:
+            tmp_link = f"{path}-{uuid.uuid4()}"
+            try:
+                shared = link_file(blob, tmp_link)
+                if shared:
+                    os.replace(tmp_link, path)
+            except FileNotFoundError:
+                # blob was garbage collected in the meantime
+                shared = self._link_blob(path, blob)
+        else:
+            shared = self._link_blob(path, blob)
+
+        # blob created concurrently (None) is worth another attempt later
+        if shared is False:
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            with open(marker, "w") as f:
+                f.write(path)
+        return bool(shared)
+
+    def _link_blob(self, path, blob):
+        try:
+            return link_file(path, blob)
+        except FileExistsError:
+            # blob was created concurrently, it has the same content so we just keep the file
+            return None
+
+    def _unshared_marker(self, checksum, file_stat):
+        key = f"{checksum}-{file_stat.st_dev}-{file_stat.st_ino}-{file_stat.st_size}-{file_stat.st_mtime_ns}"
+        return os.path.join(self.root, self.UNSHARED_DIR, key)
+
+    def _is_stale_marker(self, marker):
+        """Marker of file which was removed or modified since it was recorded"""
+        try:
+            with open(marker, "r") as f:
+                path = f.read()
+            checksum = os.path.basename(marker).split("-")[0]
+            return marker != self._unshared_marker(checksum, os.stat(path))
+        except FileNotFoundError:
+            return True
+
+    def remove_unreferenced(self):
+        """Remove blobs which are not linked from any project file.
+
+        :returns: number of removed blobs and freed disk space
+        :rtype: Tuple[int, int]
+        """
+        removed = freed = 0
+        for root, dirs, files in os.walk(self.root):
+            if root == self.root and self.UNSHARED_DIR in dirs:
+                dirs.remove(self.UNSHARED_DIR)
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    blob_stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if blob_stat.st_nlink > 1:
+                    continue
+                os.remove(path)
+                removed += 1
+                freed += blob_stat.st_size
+            sleep(0)
+
+        markers_dir = os.path.join(self.root, self.UNSHARED_DIR)
+        if os.path.isdir(markers_dir):
+            for marker in os.scandir(markers_dir):
+                if self._is_stale_marker(marker.path):
+                    os.remove(marker.path)
+        return removed, freed
+
+
+class RestoreCache:
+    """Size bounded cache of versioned files reconstructed from diffs history.
+
+    Entries are hardlinks (or copies) of restored files, therefore they outlive removal of expired files
+    from project directory by storage optimization. Last access time is tracked by entry mtime and
+    the least recently used entries are evicted when total size exceeds the budget.
+    Total size is kept as a running sum in usage file, so that cache is walked only when it is over budget.
+    """
+
+    USAGE_FILE = ".usage"
+
+    def __init__(self, root=None, max_size=None):
+        self.root = root or current_app.config["RESTORE_CACHE_DIR"]
+        self.max_size = (
+            current_app.config["RESTORE_CACHE_SIZE"] if max_size is None else max_size
+        )
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def entry_path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key, dest):
+        """Place cached file to destination.
+
+        :params key: cache key, relative path
+        :type key: str
+        :params dest: abs path to destination file
+        :type dest: str
+        :returns: whether file was found in cache
+        :rtype: bool
+        """
+        if not self.enabled:
+            return False
+        entry = self.entry_path(key)
+        try:
+            if not link_file(entry, dest):
+                _copy_file(entry, dest)
+            # mark entry as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            # missing or evicted in the meantime
+            return False
+        except FileExistsError:
+            # restored concurrently
+            pass
+        return True
+
+    def put(self, key, path):
+        """Add file to cache and evict least recently used entries if needed.
+
+        :params key: cache key, relative path
+        :type key: str
+        :params path: abs path to file
+        :type path: str
+        """
+        if not self.enabled or os.path.getsize(path) > self.max_size:
+            return
+        entry = self.entry_path(key)
+        tmp_entry = f"{entry}-{uuid.uuid4()}"
+        if not link_file(path, tmp_entry):
+            _copy_file(path, tmp_entry)
+        os.replace(tmp_entry, entry)
+        usage = self._update_usage(delta=os.path.getsize(entry))
+        if usage is None or usage > self.max_size:
+            self.evict()
+
+    def _update_usage(self, delta=0, total=None):
+        """Update running total size of cache entries.
+
+        Total is overestimated if entries are replaced or removed other way than by eviction,
+        which only makes the next eviction happen sooner, and it is set to exact value by eviction.
+
+        :params delta: size change to be added to current total
+        :type delta: int
+        :params total: new exact total, overrides delta
+        :type total: int
+        :returns: updated total or None if it is not known yet
+        :rtype: Optional[int]
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, self.USAGE_FILE), "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            if total is None:
+                f.seek(0)
+                try:
+                    total = int(f.read()) + delta
+                except ValueError:
+                    return None
+            f.seek(0)
+            f.truncate()
+            f.write(str(total))
+        return total
+
+    def _remove_entry(self, path):
+        """Remove cache entry file, returns whether it was removed"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def evict(self):
+        """Remove least recently used entries to fit cache budget.
+
+        :returns: number of removed entries and freed disk space
+        :rtype: Tuple[int, int]
+        """
+        entries = []
+        total_size = 0
+        for root, dirs, files in os.walk(self.root):
+            for file in files:
+                if root == self.root and file == self.USAGE_FILE:
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    entry_stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, path))
+                total_size += entry_stat.st_size
+            sleep(0)
+
+        removed = freed = 0
+        for mtime, size, path in sorted(entries):
+            if total_size - freed <= self.max_size:
+                break
+            if not self._remove_entry(path):
+                continue
+            removed += 1
+            freed += size
+        self._update_usage(total=total_size - freed)
+        return removed, freed
+
+    def remove(self, prefix):
+        """Remove all cache entries with key prefix (e.g. project)"""
+        path = self.entry_path(prefix)
+        if os.path.exists(path):
+            move_to_tmp(path)
+
+
 def move_to_tmp(src, dest=None):
     """Custom handling of file/directory removal by moving it to regularly cleaned tmp folder.
     This is mainly to avoid using standard tools which could cause blocking gevent hub for large files.
@@ -125,7 +639,10 @@ class DiskStorage(ProjectStorage):
         super(DiskStorage, self).__init__(project)
         self.projects_dir = current_app.config["LOCAL_PROJECTS"]
         self.project_dir = self._project_dir()
-        self.geodiff = GeoDiff()
+        self._init_geodiff()
+
+    def _init_geodiff(self):
+        self.geodiff = GeoDiffService()
         self.gediff_log = io.StringIO()
         self.geodiff_working_dir = os.path.abspath(
             os.path.join(
@@ -146,6 +663,14 @@ class DiskStorage(ProjectStorage):
 
         self.geodiff.set_logger_callback(_logger_callback)
 
+    def clone(self) -> "DiskStorage":
+        """Copy of storage with its own geodiff instance, log and working directory,
+        so that geodiff actions on different files can run concurrently.
+        """
+        storage = copy.copy(self)
+        storage._init_geodiff()
+        return storage
+
     @contextmanager
     def geodiff_copy(self, file):
         """Copy project file from live storage to geodiff temp storage for further actions.
@@ -194,6 +719,7 @@ class DiskStorage(ProjectStorage):
                 self.delete()
                 raise InitializationError("Disk quota reached")
 
+            files = []
             for file in template_project.files:
                 src = os.path.join(template_project.storage.project_dir, file.location)
                 dest = os.path.join(
@@ -202,16 +728,24 @@ class DiskStorage(ProjectStorage):
                 )
                 if not os.path.isfile(src):
                     self.restore_versioned_file(file, template_project.latest_version)
-                try:
-                    copy_file(src, dest)
-                except (FileNotFoundError, IOError):
-                    self.delete()
-                    raise InitializationError(
-                        "IOError: failed to copy '{}' to '{}'", src, dest
-                    )
-                except Exception as e:
-                    self.delete()
-                    raise InitializationError(str(e))
+                files.append((src, dest))
+            try:
+                start = time.time()
+                methods = clone_files(files)
+                logging.info(
+                    f"Cloned {len(files)} files from {template_project.storage.project_dir} in "
+                    f"{time.time() - start} s (methods: {set(methods)})"
+                )
+            except (FileNotFoundError, IOError) as e:
+                self.delete()
+                raise InitializationError(f"IOError: failed to clone files: {str(e)}")
+            except Exception as e:
+                self.delete()
+                raise InitializationError(str(e))
+
+    def commit_files(self, files):
+        # files are already stored in project directory
+        pass
 
     def file_size(self, file):
         file_path = os.path.join(self.project_dir, file)
@@ -225,7 +759,14 @@ class DiskStorage(ProjectStorage):
             raise FileNotFound("File {} not found.".format(file))
         return path
 
-    def read_file(self, path, block_size=4096):
+    def file_mimetype(self, file):
+        """Mime type of file sent to client, text files are sent as plain text"""
+        path = self.file_path(file)
+        if not is_binary(path):
+            return "text/plain"
+        return get_mimetype(path)
+
+    def read_file(self, path, block_size=4096, offset=0, length=None):
         file_path = os.path.join(self.project_dir, path)
 
         # do input validation outside generator to execute immediately
@@ -233,11 +774,18 @@ class DiskStorage(ProjectStorage):
             raise FileNotFound("File {} not found.".format(path))
 
         def _generator():
+            remaining = length
             with open(file_path, "rb") as f:
-                while True:
-                    data = f.read(block_size)
+                f.seek(offset)
+                while remaining is None or remaining > 0:
+                    size = (
+                        block_size if remaining is None else min(block_size, remaining)
+                    )
+                    data = f.read(size)
                     sleep(0)
                     if data:
+                        if remaining is not None:
+                            remaining -= len(data)
                         yield data
                     else:
                         break
@@ -248,7 +796,8 @@ class DiskStorage(ProjectStorage):
         self, current_file: ProjectFile, upload_file: UploadFile, version: int
     ) -> Result:
         """Apply geodiff diff file on current gpkg basefile. Creates GeodiffActionHistory record of the action.
-        Returns checksum and size of generated file. If action fails it returns geodiff error message.
+        Returns checksum and size of generated file together with action record, which is left to caller to persist.
+        If action fails it returns geodiff error message.
         """
         from ..models import GeodiffActionHistory, ProjectVersion
 
@@ -284,6 +833,7 @@ class DiskStorage(ProjectStorage):
                     v_name,
                     "apply_changes",
                     changeset,
+                    geodiff=self.geodiff,
                 )
                 gh.copy_time = copy_time
                 gh.geodiff_time = geodiff_apply_time
@@ -301,11 +851,11 @@ class DiskStorage(ProjectStorage):
                 checksumming_time = time.time() - start
                 gh.checksum_time = checksumming_time
                 logging.info(f"Checksum calculated in {checksumming_time} s")
-                db.session.add(gh)
                 return Ok(
                     (
                         checksum,
                         os.path.getsize(patchedfile_tmp),
+                        gh,
                     )
                 )
             except (GeoDiffLibError, GeoDiffLibConflictError):
@@ -360,8 +910,43 @@ class DiskStorage(ProjectStorage):
             finally:
                 move_to_tmp(changeset_tmp)
 
+    def create_delta(self, diffs: List[File], cache_key: str, dest: str) -> Result:
+        """Concatenate sequence of diff files into single changeset, e.g. to update file over multiple
+        versions at once. Changeset is kept in restore cache, so the same delta is built only once.
+
+        :param diffs: diff files ordered from the oldest one
+        :param cache_key: key of changeset in restore cache
+        :param dest: abs path where to create changeset
+        :returns: path to created changeset or geodiff error message
+        """
+        restore_cache = RestoreCache()
+        if restore_cache.get(cache_key, dest):
+            logging.info(f"Delta changeset {cache_key} found in cache")
+            return Ok(dest)
+
+        try:
+            partials = [self.file_path(d.location) for d in diffs]
+        except FileNotFound as e:
+            return Err(str(e))
+        try:
+            self.flush_geodiff_logger()
+            start = time.time()
+            if len(partials) > 1:
+                self.geodiff.concat_changes(partials, dest)
+            else:
+                copy_file(partials[0], dest)
+            logging.info(
+                f"Delta changeset {cache_key} of {len(partials)} diffs created in {time.time() - start} s"
+            )
+        except (GeoDiffLibError, GeoDiffLibConflictError):
+            move_to_tmp(dest)
+            return Err(self.gediff_log.getvalue())
+        restore_cache.put(cache_key, dest)
+        return Ok(dest)
+
     def delete(self):
         move_to_tmp(self.project_dir)
+        RestoreCache().remove(self.project.storage_params["location"])
 
     def restore_versioned_file(self, file: str, version: int):
         """
@@ -392,6 +977,30 @@ class DiskStorage(ProjectStorage):
         ):
             return
 
+        # file might have been reconstructed already
+        restore_cache = RestoreCache()
+        cache_key = os.path.join(
+            self.project.storage_params["location"], file_found.location
+        )
+        dest = os.path.join(self.project_dir, file_found.location)
+        start = time.time()
+        if restore_cache.get(cache_key, dest):
+            v_name = ProjectVersion.to_v_name(project_version.name)
+            gh = GeodiffActionHistory(
+                self.project.id,
+                v_name,
+                file,
+                file_found.size,
+                v_name,
+                "restore_file_cached",
+                "",
+            )
+            gh.copy_time = time.time() - start
+            db.session.add(gh)
+            db.session.commit()
+            logging.info(f"Restore file: {dest} found in cache")
+            return
+
         base_meta, diffs = FileHistory.diffs_chain(self.project, file, version)
         if not (base_meta and diffs):
             return
@@ -445,6 +1054,7 @@ class DiskStorage(ProjectStorage):
                     ProjectVersion.to_v_name(project_version.name),
                     "restore_file",
                     changes,
+                    geodiff=self.geodiff,
                 )
                 apply_time = time.time() - start
                 gh.geodiff_time = apply_time
@@ -471,3 +1081,4 @@ class DiskStorage(ProjectStorage):
             gh.copy_time = copy_time
             db.session.add(gh)
             db.session.commit()
+            restore_cache.put(cache_key, dest)
@@ -0,0 +1,123 @@
+# Copyright (C) Lutra Consulting Limited
+#
+# SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+import multiprocessing
+import time
+
+from flask import current_app
+from gevent import get_hub
+from gevent.lock import BoundedSemaphore
+from pygeodiff import GeoDiff, GeoDiffLibError
+
+# limit of concurrent geodiff processes per (gevent) worker, created lazily based on config
+_semaphore = None
+# geodiff processes are forked from clean server process rather than from app worker
+_context = multiprocessing.get_context("forkserver")
+_context.set_forkserver_preload([__name__])
+
+
+class GeoDiffTimeoutError(GeoDiffLibError):
+    pass
+
+
+def _get_semaphore(workers):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = BoundedSemaphore(workers)
+    return _semaphore
+
+
+def _execute(conn, method, args):
+    """Run geodiff method in child process and send back result with captured log messages"""
+    messages = []
+    geodiff = GeoDiff()
+    geodiff.set_logger_callback(lambda level, text: messages.append((level, text)))
+    try:
+        result = getattr(geodiff, method)(*args)
+        conn.send((result, None, messages))
+    except Exception as e:
+        conn.send((None, e, messages))
+    finally:
+        conn.close()
+
+
+class GeoDiffService:
+    """Drop-in replacement of GeoDiff which runs library calls in dedicated worker processes.
+
+    Calls into geodiff C library hold the gevent hub for the whole operation, which stalls all other
+    requests on the same worker. Here each call is executed in a separate process (at most GEODIFF_WORKERS
+    at the time) while the caller greenlet waits cooperatively. Operation exceeding GEODIFF_TIMEOUT
+    is killed and GeoDiffTimeoutError is raised. Exceptions and log messages from geodiff are passed
+    to the caller as if library was called directly. With GEODIFF_WORKERS=0 geodiff runs in-process.
+
+    Processes are forked from forkserver, a single threaded process started (from scratch) on first use,
+    which has only this module and geodiff library loaded. Forking the app worker itself would copy its
+    threads, db connection pool, sockets and locks (e.g. held logging locks) in undefined state.
+    Arguments and results need to be picklable.
+    """
+
+    def __init__(self):
+        self.workers = current_app.config["GEODIFF_WORKERS"]
+        self.timeout = current_app.config["GEODIFF_TIMEOUT"] or None
+        self.logger_callback = None
+        self._geodiff = None
+
+    def set_logger_callback(self, callback):
+        self.logger_callback = callback
+        if self._geodiff:
+            self._geodiff.set_logger_callback(callback)
+
+    @property
+    def geodiff(self):
+        """In-process geodiff instance"""
+        if not self._geodiff:
+            self._geodiff = GeoDiff()
+            if self.logger_callback:
+                self._geodiff.set_logger_callback(self.logger_callback)
+        return self._geodiff
+
+    def __getattr__(self, method):
+        if method.startswith("_") or not callable(getattr(GeoDiff, method, None)):
+            raise AttributeError(method)
+
+        def _method(*args):
+            if self.workers <= 0:
+                return getattr(self.geodiff, method)(*args)
+            return self.run(method, *args)
+
+        return _method
+
+    def run(self, method, *args):
+        """Execute geodiff method in worker process and wait for result without blocking gevent hub"""
+        with _get_semaphore(self.workers):
+            reader, writer = _context.Pipe(duplex=False)
+            process = _context.Process(
+                target=_execute, args=(writer, method, args), daemon=True
+            )
+            start = time.time()
+            process.start()
+            writer.close()
+            try:
+                # blocking poll is done in native thread
+                ready = get_hub().threadpool.apply(reader.poll, (self.timeout,))
+                if not ready:
+                    process.kill()
+                    raise GeoDiffTimeoutError(
+                        f"Geodiff {method} timed out after {time.time() - start} s"
+                    )
+                try:
+                    result, error, messages = reader.recv()
+                except EOFError:
+                    raise GeoDiffLibError(
+                        f"Geodiff {method} worker exited unexpectedly"
+                    )
+            finally:
+                reader.close()
+                get_hub().threadpool.apply(process.join)
+
+        if self.logger_callback:
+            for level, text in messages:
+                self.logger_callback(level, text)
+        if error:
+            raise error
+        return result
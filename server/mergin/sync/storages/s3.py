@@ -0,0 +1,306 @@
+# Copyright (C) Lutra Consulting Limited
+#
+# SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+import os
+import uuid
+import logging
+from functools import lru_cache
+
+from binaryornot.helpers import is_binary_string
+from flask import current_app
+from gevent import sleep
+from result import Err
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:  # pragma: no cover
+    boto3 = None
+    BotoCoreError = ClientError = Exception
+
+from .disk import DiskStorage, RestoreCache
+from .storage import FileNotFound, InitializationError, DataSyncError
+from ..files import mergin_secure_filename
+from ..utils import is_versioned_file, get_buffer_mimetype
+
+# minimal size of multipart upload part (except the last one) and max number of parts
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# number of leading bytes of file used to detect its type
+MIME_SNIFF_SIZE = 64 * 1024
+
+
+@lru_cache()
+def get_client(endpoint_url, access_key_id, secret_access_key, region):
+    """Clients are thread safe and expensive to create, hence shared between storages"""
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key_id,
+        aws_secret_access_key=secret_access_key,
+        region_name=region,
+    )
+
+
+class S3Cache(RestoreCache):
+    """Node local size bounded read-through cache of bucket objects.
+
+    Entries are keyed by object key and hardlinked to project directory, where disk storage operations
+    (e.g. geodiff) expect them. Evicted entries are removed from project directory as well, unless the project
+    file was replaced in the meantime. Cache needs to be on the same filesystem as LOCAL_PROJECTS.
+    """
+
+    def __init__(self):
+        super().__init__(
+            current_app.config["S3_CACHE_DIR"], current_app.config["S3_CACHE_SIZE"]
+        )
+        self.projects_dir = current_app.config["LOCAL_PROJECTS"]
+
+    def _remove_entry(self, path):
+        project_file = os.path.join(self.projects_dir, os.path.relpath(path, self.root))
+        try:
+            if os.path.samefile(path, project_file):
+                os.remove(project_file)
+        except FileNotFoundError:
+            pass
+        return super()._remove_entry(path)
+
+
+class S3Storage(DiskStorage):
+    """Project storage backed by S3 compatible object storage (AWS S3, MinIO, ...).
+
+    Bucket is the source of truth for project files. Files are streamed from bucket with ranged requests,
+    local project directory is used as a size bounded read-through cache (see S3Cache) for operations which need
+    files on filesystem (geodiff).
+    Pushes (uploaded chunks and upload lockfile) are still staged in project directory, therefore
+    LOCAL_PROJECTS needs to be shared by all app nodes which handle push requests.
+    """
+
+    def __init__(self, project):
+        if boto3 is None:
+            raise InitializationError("boto3 package is required for s3 storage")
+        super(S3Storage, self).__init__(project)
+        self.bucket = current_app.config["S3_BUCKET"]
+        self.range_size = current_app.config["S3_RANGE_SIZE"]
+        self.client = get_client(
+            current_app.config["S3_ENDPOINT_URL"],
+            current_app.config["S3_ACCESS_KEY_ID"],
+            current_app.config["S3_SECRET_ACCESS_KEY"],
+            current_app.config["S3_REGION"],
+        )
+        self.cache = S3Cache()
+
+    def _key(self, location):
+        return f"{self.project.storage_params['location']}/{location}"
+
+    def _head(self, location):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(location))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFound("File {} not found.".format(location))
+            raise
+
+    def _cache(self, location):
+        """Make sure file is present in local cache, returns its path"""
+        path = os.path.join(self.project_dir, location)
+        if os.path.exists(path):
+            # mark cache entry (hardlink of project file) as recently used
+            os.utime(path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}-{uuid.uuid4()}"
+        try:
+            self.client.download_file(self.bucket, self._key(location), tmp_path)
+        except ClientError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFound("File {} not found.".format(location))
+            raise
+        os.replace(tmp_path, path)
+        self.cache.put(self._key(location), path)
+        return path
+
+    def initialize(self, template_project=None):
+        if template_project and isinstance(template_project.storage, S3Storage):
+            for file in template_project.files:
+                try:
+                    template_project.storage._cache(file.location)
+                except FileNotFound:
+                    # it might be recreated from diffs history
+                    pass
+        super().initialize(template_project)
+        if template_project:
+            try:
+                self.commit_files(
+                    [
+                        (os.path.join("v1", mergin_secure_filename(f.path)), None)
+                        for f in template_project.files
+                    ]
+                )
+            except DataSyncError as e:
+                self.delete()
+                raise InitializationError(str(e))
+
+    def file_size(self, file):
+        if os.path.exists(os.path.join(self.project_dir, file)):
+            return super().file_size(file)
+        return self._head(file)["ContentLength"]
+
+    def file_path(self, file):
+        return self._cache(file)
+
+    def file_mimetype(self, file):
+        if os.path.exists(os.path.join(self.project_dir, file)):
+            return super().file_mimetype(file)
+        # only leading bytes of file are fetched from bucket
+        head = b"".join(self.read_file(file, length=MIME_SNIFF_SIZE))
+        if not is_binary_string(head[:1024]):
+            return "text/plain"
+        return get_buffer_mimetype(head)
+
+    def read_file(self, path, block_size=4096, offset=0, length=None):
+        if os.path.exists(os.path.join(self.project_dir, path)):
+            return super().read_file(path, block_size, offset, length)
+
+        # do input validation outside generator to execute immediately
+        size = self.file_size(path)
+        stop = size if length is None else min(offset + length, size)
+
+        def _generator():
+            start = offset
+            while start < stop:
+                end = min(start + self.range_size, stop) - 1
+                obj = self.client.get_object(
+                    Bucket=self.bucket,
+                    Key=self._key(path),
+                    Range=f"bytes={start}-{end}",
+                )
+                for data in obj["Body"].iter_chunks(block_size):
+                    sleep(0)
+                    yield data
+                start = end + 1
+
+        return _generator()
+
+    def upload_file(self, location, parts=None):
+        """Upload file from local project directory to bucket.
+
+        :param location: file location within project
+        :type location: str
+        :param parts: ordered local files (e.g. push chunks) which concatenated give the file content,
+            those are used directly as multipart upload parts if they meet S3 limits
+        :type parts: List[str]
+        """
+        key = self._key(location)
+        if (
+            parts
+            and 1 < len(parts) <= MAX_PARTS
+            and all(os.path.getsize(p) >= MIN_PART_SIZE for p in parts[:-1])
+        ):
+            upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=key
+            )["UploadId"]
+            try:
+                uploaded = []
+                for number, part in enumerate(parts, start=1):
+                    with open(part, "rb") as f:
+                        resp = self.client.upload_part(
+                            Bucket=self.bucket,
+                            Key=key,
+                            UploadId=upload_id,
+                            PartNumber=number,
+                            Body=f,
+                        )
+                    uploaded.append({"ETag": resp["ETag"], "PartNumber": number})
+                    sleep(0)
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": uploaded},
+                )
+            except Exception:
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id
+                )
+                raise
+        else:
+            self.client.upload_file(
+                os.path.join(self.project_dir, location), self.bucket, key
+            )
+
+    def commit_files(self, files):
+        for location, parts in files:
+            try:
+                self.upload_file(location, parts)
+            except (ClientError, BotoCoreError, OSError) as e:
+                raise DataSyncError(f"Failed to upload {location} to storage: {e}")
+            # file is stored in bucket, local copy can be evicted when not used
+            self.cache.put(
+                self._key(location), os.path.join(self.project_dir, location)
+            )
+
+    def apply_diff(self, current_file, upload_file, version):
+        try:
+            self._cache(current_file.location)
+        except FileNotFound as e:
+            return Err(str(e))
+        return super().apply_diff(current_file, upload_file, version)
+
+    def construct_diff(self, current_file, upload_file, version):
+        try:
+            self._cache(current_file.location)
+        except FileNotFound as e:
+            return Err(str(e))
+        return super().construct_diff(current_file, upload_file, version)
+
+    def delete(self):
+        super().delete()
+        self.cache.remove(self.project.storage_params["location"])
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key("")):
+            objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if objects:
+                self.client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": objects}
+                )
+
+    def restore_versioned_file(self, file: str, version: int):
+        """Check file is stored in bucket, or if it was not stored, fetch its history
+        to local cache and reconstruct it from diffs.
+        """
+        from ..models import ProjectVersion, FileHistory
+
+        if not is_versioned_file(file):
+            return
+
+        project_version = ProjectVersion.query.filter_by(
+            project_id=self.project.id, name=version
+        ).first()
+        if not project_version:
+            return
+
+        file_found = next((i for i in project_version.files if i.path == file), None)
+        if not file_found:
+            return
+
+        if os.path.exists(os.path.join(self.project_dir, file_found.location)):
+            return
+        try:
+            self._head(file_found.location)
+            return
+        except FileNotFound:
+            pass
+
+        base_meta, diffs = FileHistory.diffs_chain(self.project, file, version)
+        if not (base_meta and diffs):
+            return
+        try:
+            for item in [base_meta, *diffs]:
+                self._cache(item.location)
+        except FileNotFound as e:
+            logging.error(f"Unable to restore file {file}: {str(e)}")
+            return
+        super().restore_versioned_file(file, version)
@@ -2,8 +2,9 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
+import hashlib
 from urllib.parse import quote
-from flask import Response
+from flask import Response, request
 from requests_toolbelt import MultipartEncoder
 from gevent import sleep
 import zipfly
@@ -25,6 +26,70 @@ class InitializationError(Exception):
     pass
 
 
+def files_manifest(files):
+    """Describe files as consecutive parts of single stream (ordered by path).
+
+    :param files: project files
+    :type files: List[File]
+    :returns: total size, etag identifying content and list of files with their offsets
+    :rtype: Dict
+    """
+    offset = 0
+    items = []
+    digest = hashlib.sha1()
+    for f in sorted(files, key=lambda f: f.path):
+        items.append(
+            {"path": f.path, "checksum": f.checksum, "size": f.size, "offset": offset}
+        )
+        offset += f.size
+        digest.update(f"{f.path}:{f.checksum}\n".encode("utf-8"))
+    return {"size": offset, "etag": digest.hexdigest(), "files": items}
+
+
+def ranged_response(reader, size, etag=None, mimetype="application/octet-stream"):
+    """Create streamed response with support of single range requests (including If-Range) as of RFC 7233.
+    Other range requests (e.g. multiple ranges) are ignored and full content is returned.
+
+    :param reader: function returning data generator for given offset and length
+    :type reader: Callable[[int, int], Iterator[bytes]]
+    :param size: total size of content
+    :type size: int
+    :param etag: strong etag of content
+    :type etag: str
+    """
+    start, stop = 0, size
+    status = 200
+    byte_range = request.range
+    if_range = request.if_range
+    if (
+        byte_range
+        and byte_range.units == "bytes"
+        and len(byte_range.ranges) == 1
+        and (not (if_range.etag or if_range.date) or (etag and if_range.etag == etag))
+    ):
+        requested = byte_range.range_for_length(size)
+        if requested is None:
+            resp = Response(status=416)
+            resp.headers["Content-Range"] = f"bytes */{size}"
+            return resp
+        start, stop = requested
+        status = 206
+
+    resp = Response(
+        reader(start, stop - start),
+        status=status,
+        mimetype=mimetype,
+        direct_passthrough=True,
+    )
+    resp.headers["Accept-Ranges"] = "bytes"
+    resp.headers["Content-Length"] = stop - start
+    if status == 206:
+        resp.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    if etag:
+        resp.set_etag(etag)
+    return resp
+
+
 class StorageFile(object):
     def __init__(self, storage, file):
         self.storage = storage
@@ -65,7 +130,7 @@ class ProjectStorage:
     def __init__(self, project):
         self.project = project
 
-    def read_file(self, path, block_size=4096):
+    def read_file(self, path, block_size=4096, offset=0, length=None):
         raise NotImplementedError
 
     def file_size(self, file):
@@ -74,15 +139,45 @@ class ProjectStorage:
     def file_path(self, file):
         raise NotImplementedError
 
+    def file_mimetype(self, file):
+        raise NotImplementedError
+
     def restore_versioned_file(self, file, version):
         raise NotImplementedError
 
+    def commit_files(self, files):
+        """Persist new files placed in project directory (e.g. with push).
+
+        :param files: list of file location and optional list of local files (parts) composing its content
+        :type files: List[Tuple[str, Optional[List[str]]]]
+        """
+        raise NotImplementedError
+
     def download_files(self, files, files_format: str = None, version: int = None):
         """Download files"""
         if version:
             for f in files:
                 sleep(0)
                 self.restore_versioned_file(f.path, version)
+        if files_format == "raw":
+            # concatenated files as described by manifest, download can be resumed with range requests
+            manifest = files_manifest(files)
+            locations = {f.path: f.location for f in files}
+
+            def _reader(offset, length):
+                stop = offset + length
+                for item in manifest["files"]:
+                    item_stop = item["offset"] + item["size"]
+                    if item_stop <= offset or item["offset"] >= stop:
+                        continue
+                    start = max(offset, item["offset"]) - item["offset"]
+                    yield from self.read_file(
+                        locations[item["path"]],
+                        offset=start,
+                        length=min(stop, item_stop) - item["offset"] - start,
+                    )
+
+            return ranged_response(_reader, manifest["size"], manifest["etag"])
         if files_format == "zip":
             paths = [{"fs": self.file_path(f.location), "n": f.path} for f in files]
             z = zipfly.ZipFly(mode="w", paths=paths)
@@ -2,15 +2,31 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
+import json
 import logging
 import shutil
 import os
 import time
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from flask import current_app
+from pygeodiff import GeoDiffLibError
+from werkzeug.exceptions import HTTPException
 
-from .models import Project, ProjectVersion, FileHistory
-from .storages.disk import move_to_tmp
+from .models import (
+    Project,
+    ProjectVersion,
+    FileHistory,
+    FileDiffSquash,
+    ProjectFilePath,
+    PushChangeType,
+    PushJob,
+    PushJobStatus,
+    Upload,
+)
+from .storages.storage import FileNotFound, DataSyncError
+from .storages.disk import move_to_tmp, BlobStore
+from .utils import Toucher, generate_checksum, is_versioned_file
 from .config import Configuration
 from ..celery import celery
 from ..app import db
@@ -64,6 +80,226 @@ def remove_projects_backups():
         for p in projects:
             p.delete()
 
+    # files of removed projects might have been the last references to shared blobs
+    removed, freed = BlobStore().remove_unreferenced()
+    logging.info(f"Removed {removed} unreferenced blobs of total size {freed} bytes")
+
+
+@celery.task
+def finish_push(job_id, ip, user_agent, device_id):
+    """Finalize upload transaction in background and record progress to push job"""
+    from .public_api_controller import finish_upload
+
+    db.session.info = {"msg": "finish_push"}
+    job = PushJob.query.filter_by(id=job_id, status=PushJobStatus.QUEUED.value).first()
+    if not job:
+        return
+
+    upload = Upload.query.get(job.upload_id)
+    if not upload or not os.path.exists(upload.upload_dir):
+        job.update(
+            status=PushJobStatus.FAILED.value,
+            error="Upload transaction not found",
+            finished=datetime.utcnow(),
+        )
+        return
+
+    job.update(status=PushJobStatus.RUNNING.value)
+    project = upload.project
+    try:
+        # keep upload locked until new version is committed
+        with Toucher(upload.lockfile, 30):
+            pv = finish_upload(
+                upload, job.user_id, ip, user_agent, device_id, job.set_progress
+            )
+    except HTTPException as e:
+        db.session.rollback()
+        error = (
+            e.description
+            if isinstance(e.description, str)
+            else json.dumps(e.description)
+        )
+        job.update(
+            status=PushJobStatus.FAILED.value, error=error, finished=datetime.utcnow()
+        )
+        project.sync_failed(user_agent, "push_finish", error, job.user_id)
+        # do not leave upload blocking other pushes
+        upload = Upload.query.get(job.upload_id)
+        if upload:
+            upload.clear()
+        return
+    except Exception:
+        db.session.rollback()
+        job.update(
+            status=PushJobStatus.FAILED.value,
+            error="Failed to finish push",
+            finished=datetime.utcnow(),
+        )
+        upload = Upload.query.get(job.upload_id)
+        if upload:
+            upload.clear()
+        raise
+
+    job.update(
+        status=PushJobStatus.FINISHED.value,
+        version=pv.name,
+        finished=datetime.utcnow(),
+    )
+
+
+@celery.task
+def create_diff_summaries(version_id):
+    """Precompute geodiff summaries of diff updates in project version"""
+    db.session.info = {"msg": "create_diff_summaries"}
+    pv = ProjectVersion.query.get(version_id)
+    if not pv:
+        return
+
+    for item in pv.changes.filter(
+        FileHistory.change == PushChangeType.UPDATE_DIFF.value,
+        FileHistory.diff_summary.is_(None),
+    ):
+        item.diff_summary = item.calculate_diff_summary()
+    db.session.commit()
+
+
+@celery.task
+def create_keyframes(project_id):
+    """Apply keyframe policy on versioned files of project.
+
+    Full file is kept (or restored) for diff update if the number or the total size of diffs
+    since the last full file exceeds configured limits. Such keyframes are not removed by storage optimization
+    and diffs chain needed to restore any file version is bounded.
+    """
+    db.session.info = {"msg": "create_keyframes"}
+    max_count = Configuration.KEYFRAME_DIFFS_COUNT
+    max_size = Configuration.KEYFRAME_DIFFS_SIZE
+    if not (max_count or max_size):
+        return
+
+    project = (
+        Project.query.filter_by(id=project_id)
+        .filter(Project.storage_params.isnot(None))
+        .first()
+    )
+    if not project:
+        return
+
+    history = FileHistory.files_changes(
+        project.id,
+        [f.path for f in project.files],
+        1,
+        project.latest_version,
+        diffable=True,
+    )
+    for f in project.files:
+        f_history = history.get(f.path, [])
+        count = size = 0
+        for item in reversed(f_history):
+            # start of chain or full file already kept
+            if not item.diff or item.keyframe:
+                count = size = 0
+                continue
+
+            # the latest file version is always kept
+            if item.location == f.location:
+                break
+
+            count += 1
+            size += item.diff_file.size
+            if not (
+                (max_count and count >= max_count) or (max_size and size >= max_size)
+            ):
+                continue
+
+            # file might have been already removed by storage optimization
+            project.storage.restore_versioned_file(f.path, item.project_version_name)
+            if not os.path.exists(item.abs_path):
+                logging.error(
+                    f"Unable to create keyframe for {f.path} in project {project.id} "
+                    f"version {item.project_version_name}"
+                )
+                break
+
+            item.keyframe = True
+            db.session.commit()
+            count = size = 0
+
+
+@celery.task
+def create_diff_squashes(project_id):
+    """Build skip index of squashed diffs for versioned files of project.
+
+    Diffs are concatenated over aligned power-of-two ranges of project versions which are already complete
+    and contain only diff updates of file. Larger ranges are composed from smaller squashes.
+    """
+    db.session.info = {"msg": "create_diff_squashes"}
+    project = (
+        Project.query.filter_by(id=project_id)
+        .filter(Project.storage_params.isnot(None))
+        .first()
+    )
+    if not project:
+        return
+
+    # history of removed files can be restored as well
+    for file_path in ProjectFilePath.query.filter_by(project_id=project.id).all():
+        if not is_versioned_file(file_path.path):
+            continue
+
+        history = (
+            FileHistory.query.filter(
+                FileHistory.file_path_id == file_path.id,
+                FileHistory.project_version_name <= project.latest_version,
+            )
+            .order_by(FileHistory.project_version_name)
+            .all()
+        )
+        squashes = {
+            (squash.start, squash.end): squash
+            for squash in FileDiffSquash.query.filter_by(file_path_id=file_path.id)
+        }
+        versions = [item.project_version_name for item in history]
+        size = 2
+        while size <= project.latest_version:
+            for start in range(1, project.latest_version - size + 2, size):
+                end = start + size - 1
+                if (start, end) in squashes:
+                    continue
+                items = history[
+                    bisect_left(versions, start) : bisect_right(versions, end)
+                ]
+                if len(items) < 2 or any(not item.diff for item in items):
+                    continue
+
+                diffs = FileDiffSquash.compact_chain(items, squashes, start - 1, end)
+                location = FileDiffSquash.generate_location(file_path.path, start, end)
+                dest = os.path.join(project.storage.project_dir, location)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                try:
+                    partials = [project.storage.file_path(d.location) for d in diffs]
+                    project.storage.geodiff.concat_changes(partials, dest)
+                    project.storage.commit_files([(location, None)])
+                except (FileNotFound, GeoDiffLibError, DataSyncError) as e:
+                    logging.error(
+                        f"Unable to squash diffs of {file_path.path} in project {project.id} "
+                        f"versions {start}-{end}: {str(e)}"
+                    )
+                    continue
+
+                squash = FileDiffSquash(
+                    file_path,
+                    start,
+                    end,
+                    location,
+                    os.path.getsize(dest),
+                    generate_checksum(dest),
+                )
+                db.session.add(squash)
+                squashes[(start, end)] = squash
+            size *= 2
+        db.session.commit()
+
 
 @celery.task
 def optimize_storage(project_id):
@@ -71,6 +307,7 @@ def optimize_storage(project_id):
 
     Clean up for recently updated versioned files. Removes expired file versions.
     It applies only on files that can be recreated when needed.
+    Latest files are shared through blob store with other files of identical content.
     """
     db.session.info = {"msg": "optimize_storage"}
     project = (
@@ -81,14 +318,19 @@ def optimize_storage(project_id):
     if not project:
         return
 
+    # promote files to keyframes before they expire
+    create_keyframes(project_id)
+    history = FileHistory.files_changes(
+        project.id, [f.path for f in project.files], 1, project.latest_version
+    )
     for f in project.files:
-        f_history = FileHistory.changes(project.id, f.path, 1, project.latest_version)
+        f_history = history.get(f.path, [])
         if not f_history:
             continue
 
         for item in f_history:
-            # no diffs, it is a basefile for geodiff
-            if not item.diff:
+            # no diffs or keyframe, it is a basefile for geodiff
+            if not item.diff or item.keyframe:
                 continue
 
             # skip the latest file version (high chance of being used)
@@ -102,3 +344,9 @@ def optimize_storage(project_id):
             age = time.time() - os.path.getmtime(item.abs_path)
             if age > Configuration.FILE_EXPIRATION:
                 move_to_tmp(item.abs_path)
+
+    blob_store = BlobStore()
+    for f in project.files:
+        blob_store.add(
+            os.path.join(project.storage.project_dir, f.location), f.checksum
+        )
@@ -95,6 +95,28 @@ def is_qgis(path: str) -> bool:
     return ext.lower() in [".qgs", ".qgz"]
 
 
+def qgis_files_count(files) -> int:
+    """
+    Count QGIS project files in list of project files.
+    """
+    return sum(1 for f in files if is_qgis(f.path))
+
+
+# conflict files generated by client, the same pattern is used in database queries (POSIX regex)
+CONFLICT_FILE_REGEX = r"(\.gpkg|\.qgs|.qgz)(.*conflict.*)|( \(.*conflict.*)"
+
+
+def is_conflict_file(path: str) -> bool:
+    """Check if file is a conflict file generated by client
+    Patterns to check:
+    - file.[gpkg|qgs|qgz]_conflict_copy (older convention)
+    - file.gpkg_rebase_conflicts (older convention)
+    - file (conflicted copy, user vx).*
+    - file (edit conflict, user vx).json
+    """
+    return re.search(CONFLICT_FILE_REGEX, path) is not None
+
+
 def int_version(version):
     """Convert v<n> format of version to integer representation."""
     return int(version.lstrip("v")) if re.match(r"v\d", version) else None
@@ -332,30 +354,7 @@ def files_size():
     from mergin.app import db
 
     files_size = text(
-        f"""
-        WITH partials AS (
-            WITH latest_files AS (
-                SELECT distinct unnest(file_history_ids) AS file_id
-                FROM latest_project_files pf
-            )
-            SELECT
-                SUM(size)
-            FROM file_history
-            WHERE change = 'create'::push_change_type OR change = 'update'::push_change_type
-            UNION
-            SELECT
-                SUM(COALESCE((diff ->> 'size')::bigint, 0))
-            FROM file_history
-            WHERE change = 'update_diff'::push_change_type
-            UNION
-            SELECT
-                SUM(size)
-            FROM latest_files lf
-            LEFT OUTER JOIN file_history fh ON fh.id = lf.file_id
-            WHERE fh.change = 'update_diff'::push_change_type
-        )
-        SELECT COALESCE(SUM(sum), 0) FROM partials;
-        """
+        "SELECT COALESCE(SUM(files_size), 0) FROM workspace_storage_usage;"
     )
     return db.session.execute(files_size).scalar()
 
@@ -546,3 +545,8 @@ def is_supported_type(filepath) -> bool:
 def get_mimetype(filepath: str) -> str:
     """Identifies file types by checking their headers"""
     return magic.from_file(filepath, mime=True)
+
+
+def get_buffer_mimetype(data: bytes) -> str:
+    """Identifies file types by checking headers in leading bytes of file"""
+    return magic.from_buffer(data, mime=True)
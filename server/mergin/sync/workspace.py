@@ -6,6 +6,7 @@ from datetime import datetime, timedelta, timezone
 from typing import Dict, Tuple, Optional, Set, List
 from flask_login import current_user
 from sqlalchemy import Column, literal, extract
+from sqlalchemy.sql.elements import UnaryExpression
 from sqlalchemy.sql.operators import is_
 
 from .errors import UpdateProjectAccessError
@@ -16,6 +17,7 @@ from .models import (
     ProjectRole,
     ProjectVersion,
     ProjectUser,
+    WorkspaceStorageUsage,
 )
 from .permissions import projects_query, ProjectPermissions
 from ..app import db
@@ -24,6 +26,48 @@ from ..config import Configuration
 from .interfaces import AbstractWorkspace, WorkspaceHandler, WorkspaceRole
 
 
+def projects_order_by(
+    order_params: str = None, order_by: str = None, descending: bool = False
+) -> List[UnaryExpression]:
+    """Parse sorting parameters of projects list to order by clauses on project table columns
+
+    :param order_params: sorting fields e.g. name_asc,updated_desc
+    :param order_by: order by field (legacy option)
+    :param descending: order of sorting (legacy option)
+    """
+    order_by_params = []
+    if order_params:
+        for p in order_params.split(","):
+            string_param = p.strip()
+            if "_asc" in string_param:
+                ascending = True
+                string_param = string_param.replace("_asc", "")
+            else:
+                ascending = False
+                string_param = string_param.replace("_desc", "")
+
+            if string_param in ["workspace", "namespace"]:
+                continue  # legacy sort by namespace name
+            else:
+                attr = string_param
+
+            order_attr = Project.__table__.c.get(attr, None)
+            # make sure attribute is a valid table column
+            if not isinstance(order_attr, Column):
+                continue
+
+            order_attr = order_attr.asc() if ascending else order_attr.desc()
+            order_by_params.append(order_attr)
+    elif order_by and order_by != "namespace":
+        # ensure backward compatibility for clients using old api
+        order_attr = Project.__table__.c.get(order_by, None)
+        # make sure attribute is a valid table column
+        if isinstance(order_attr, Column):
+            order_attr = order_attr.desc() if descending else order_attr.asc()
+            order_by_params.append(order_attr)
+    return order_by_params
+
+
 class GlobalWorkspace(AbstractWorkspace):
     """Implements single workspace based on global settings"""
 
@@ -61,15 +105,8 @@ class GlobalWorkspace(AbstractWorkspace):
         return True
 
     def disk_usage(self):
-        # get only what is necessary from db to calculate final usage
-        from .models import Project
-
-        projects_usage_list = (
-            db.session.query(Project.disk_usage)
-            .filter(Project.removed_at.is_(None))
-            .all()
-        )
-        return sum(p.disk_usage for p in projects_usage_list)
+        usage = WorkspaceStorageUsage.query.get(self.id)
+        return usage.disk_usage if usage else 0
 
     def user_has_permissions(self, user, permissions):
         role = self.get_user_role(user)
@@ -221,37 +258,9 @@ class GlobalWorkspaceHandler(WorkspaceHandler):
                 Project.updated >= datetime.utcnow() - timedelta(days=last_updated_in)
             )
 
-        if order_params:
-            order_by_params = []
-            for p in order_params.split(","):
-                string_param = p.strip()
-                if "_asc" in string_param:
-                    ascending = True
-                    string_param = string_param.replace("_asc", "")
-                else:
-                    ascending = False
-                    string_param = string_param.replace("_desc", "")
-
-                if string_param in ["workspace", "namespace"]:
-                    continue  # legacy sort by namespace name
-                else:
-                    attr = string_param
-
-                order_attr = Project.__table__.c.get(attr, None)
-                # make sure attribute is a valid table column
-                if not isinstance(order_attr, Column):
-                    continue
-
-                order_attr = order_attr.asc() if ascending else order_attr.desc()
-                order_by_params.append(order_attr)
+        order_by_params = projects_order_by(order_params, order_by, descending)
+        if order_by_params:
             projects = projects.order_by(*order_by_params)
-        elif order_by and order_by != "namespace":
-            # ensure backward compatibility for clients using old api
-            order_attr = Project.__table__.c.get(order_by, None)
-            # make sure attribute is a valid table column
-            if isinstance(order_attr, Column):
-                order_attr = order_attr.desc() if descending else order_attr.asc()
-                projects = projects.order_by(order_attr)
         return projects
 
     @staticmethod
@@ -42,6 +42,8 @@ def flask_app(request):
     application.config["SERVER_NAME"] = "localhost.localdomain"
     application.config["SERVER_TYPE"] = "ce"
     application.config["SERVICE_ID"] = str(uuid.uuid4())
+    # tests of file restore expect reconstruction from diffs, cache is enabled explicitly
+    application.config["RESTORE_CACHE_SIZE"] = 0
     app_context = application.app_context()
     app_context.push()
 
@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
 import os
+import shutil
 from datetime import datetime, timedelta
 from flask import current_app
 from flask_mail import Mail
@@ -13,7 +14,7 @@ from ..config import Configuration
 from ..sync.models import Project, AccessRequest, ProjectVersion
 from ..celery import send_email_async
 from ..sync.tasks import remove_temp_files, remove_projects_backups
-from ..sync.storages.disk import move_to_tmp
+from ..sync.storages.disk import move_to_tmp, BlobStore
 from . import test_project, test_workspace_name, test_workspace_id
 from .utils import add_user, create_workspace, create_project, login
 from ..auth.models import User
@@ -115,7 +116,18 @@ def test_remove_deleted_project_backups(client):
     rp_dir = rp.storage.project_dir
     assert os.path.exists(rp_dir)
     db.session.commit()
-    remove_projects_backups()
+    # project file shared through blob store
+    blob_store = BlobStore()
+    f = rp.files[0]
+    assert blob_store.add(os.path.join(rp_dir, f.location), f.checksum)
+    # make sure project files are gone for good
+    with patch(
+        "mergin.sync.storages.disk.move_to_tmp",
+        side_effect=lambda src: shutil.rmtree(src),
+    ):
+        remove_projects_backups()
+    assert blob_store.refcount(f.checksum) == 0
+    assert not os.path.exists(blob_store.blob_path(f.checksum))
     assert not Project.query.filter_by(
         workspace_id=test_workspace_id, name=test_project
     ).count()
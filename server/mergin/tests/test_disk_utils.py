@@ -2,11 +2,26 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
+import errno
 import os
 import tempfile
 import shutil
+import time
+import uuid
+from unittest.mock import patch
 import pytest
-from ..sync.storages.disk import copy_file, copy_dir, move_to_tmp
+from pygeodiff import GeoDiffLibError
+from ..sync.storages.disk import (
+    copy_file,
+    copy_dir,
+    move_to_tmp,
+    assemble_chunks,
+    BlobStore,
+    RestoreCache,
+    clone_files,
+)
+from ..sync.storages.geodiff_service import GeoDiffService, GeoDiffTimeoutError
+from ..sync.models import GeodiffActionHistory
 from ..sync.utils import generate_checksum
 from . import test_project_dir
 
@@ -85,3 +100,246 @@ def test_failures():
             os.path.join(test_project_dir, "not_found"),
             os.path.join(tempfile.gettempdir(), "new_dir"),
         )
+
+
+def _split_to_chunks(src, chunk_dir, chunk_size=1024):
+    """Split file into chunks mimicking client upload, return ordered list of chunks paths"""
+    os.makedirs(chunk_dir, exist_ok=True)
+    chunks = []
+    with open(src, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            chunk = os.path.join(chunk_dir, str(uuid.uuid4()))
+            with open(chunk, "wb") as out:
+                out.write(data)
+            chunks.append(chunk)
+    return chunks
+
+
+def test_assemble_chunks(app):
+    src = os.path.join(test_project_dir, "base.gpkg")
+    chunk_dir = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
+    chunks = _split_to_chunks(src, chunk_dir)
+    dest = os.path.join(chunk_dir, "assembled", "base.gpkg")
+
+    assert assemble_chunks(chunks, dest) == os.path.getsize(src)
+    assert generate_checksum(dest) == generate_checksum(src)
+
+    # kernel copy is not supported (e.g. cross-device), use sendfile
+    def copy_file_range(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    with patch("os.copy_file_range", side_effect=copy_file_range):
+        assert assemble_chunks(chunks, dest) == os.path.getsize(src)
+        assert generate_checksum(dest) == generate_checksum(src)
+
+        # none of zero-copy methods is available, use buffered copy
+        with patch("os.sendfile", side_effect=OSError(errno.EINVAL, "Invalid")):
+            assert assemble_chunks(chunks, dest) == os.path.getsize(src)
+            assert generate_checksum(dest) == generate_checksum(src)
+
+    # missing chunk
+    os.remove(chunks[-1])
+    with pytest.raises(FileNotFoundError):
+        assemble_chunks(chunks, dest)
+    shutil.rmtree(chunk_dir)
+
+
+def test_blob_store(app):
+    root = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
+    store = BlobStore(os.path.join(root, "blobs"))
+    src = os.path.join(test_project_dir, "base.gpkg")
+    checksum = generate_checksum(src)
+    f1 = os.path.join(root, "p1", "v1", "base.gpkg")
+    f2 = os.path.join(root, "p2", "v1", "base.gpkg")
+    copy_file(src, f1)
+    copy_file(src, f2)
+
+    # first file becomes a blob, second one is replaced by link to it
+    assert store.add(f1, checksum)
+    assert store.refcount(checksum) == 1
+    assert store.add(f2, checksum)
+    assert store.refcount(checksum) == 2
+    assert os.path.samefile(f1, f2)
+    assert generate_checksum(f2) == checksum
+    # adding file again is no-op
+    assert store.add(f2, checksum)
+    assert store.refcount(checksum) == 2
+
+    # files not matching their checksum are not shared
+    f3 = os.path.join(root, "p3", "v1", "base.gpkg")
+    copy_file(src, f3)
+    with open(f3, "r+b") as f:
+        f.write(b"x")
+    assert not store.add(f3, checksum)
+    assert not store.add(
+        f3, generate_checksum(os.path.join(test_project_dir, "test.txt"))
+    )
+    assert not store.add(os.path.join(root, "missing"), checksum)
+    assert store.refcount(checksum) == 2
+    # files already verified are not read again unless they are modified
+    with patch("mergin.sync.storages.disk.generate_checksum") as mock:
+        assert not store.add(f3, checksum)
+        assert not mock.called
+    with open(f3, "r+b") as f:
+        f.write(b"y")
+    os.utime(f3, ns=(0, 0))
+    assert not store.add(f3, checksum)
+
+    # files which cannot be linked to blob are skipped after verification
+    f4 = os.path.join(root, "p4", "v1", "base.gpkg")
+    copy_file(src, f4)
+    with patch("mergin.sync.storages.disk.link_file", return_value=False):
+        assert not store.add(f4, checksum)
+    with patch("mergin.sync.storages.disk.generate_checksum") as mock:
+        assert not store.add(f4, checksum)
+        assert not mock.called
+    assert store.refcount(checksum) == 2
+
+    # blobs are removed only when not referenced from projects
+    os.remove(f1)
+    assert store.remove_unreferenced() == (0, 0)
+    os.remove(f2)
+    assert store.remove_unreferenced() == (1, os.path.getsize(src))
+    assert store.refcount(checksum) == 0
+    # markers of files modified or removed since are dropped as well
+    assert len(os.listdir(os.path.join(store.root, store.UNSHARED_DIR))) == 2
+    os.remove(f4)
+    store.remove_unreferenced()
+    assert len(os.listdir(os.path.join(store.root, store.UNSHARED_DIR))) == 1
+    shutil.rmtree(root)
+
+
+def test_restore_cache(app):
+    root = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
+    src = os.path.join(test_project_dir, "base.gpkg")
+    size = os.path.getsize(src)
+    cache = RestoreCache(os.path.join(root, "cache"), max_size=2 * size)
+    dest = os.path.join(root, "p1", "v1", "base.gpkg")
+    assert not cache.get("p1/v1/base.gpkg", dest)
+
+    for version in ("v1", "v2", "v3"):
+        f = os.path.join(root, "p1", version, "base.gpkg")
+        copy_file(src, f)
+        if version == "v3":
+            # pretend v2 was not used for long time
+            os.utime(cache.entry_path("p1/v2/base.gpkg"), (0, 0))
+        cache.put(f"p1/{version}/base.gpkg", f)
+        os.remove(f)
+
+    # v2 as least recently used entry was evicted to fit the budget
+    assert cache.get("p1/v1/base.gpkg", dest)
+    assert generate_checksum(dest) == generate_checksum(src)
+    assert not cache.get("p1/v2/base.gpkg", os.path.join(root, "p1", "v2", "x"))
+    assert cache.get("p1/v3/base.gpkg", os.path.join(root, "p1", "v3", "base.gpkg"))
+    assert cache.evict() == (0, 0)
+
+    # cache is not walked as long as it fits the budget
+    cache = RestoreCache(os.path.join(root, "cache"), max_size=3 * size)
+    with patch("mergin.sync.storages.disk.os.walk", wraps=os.walk) as mock:
+        cache.put("p1/v2/base.gpkg", dest)
+        assert not mock.called
+        # usage is overestimated when entry is replaced, eviction sets it to exact value
+        cache.put("p1/v2/base.gpkg", dest)
+        assert mock.called
+    with open(os.path.join(cache.root, cache.USAGE_FILE)) as f:
+        assert int(f.read()) == 3 * size
+
+    # files larger than budget are not cached
+    disabled = RestoreCache(os.path.join(root, "cache"), max_size=size - 1)
+    disabled.put("p1/v4/base.gpkg", dest)
+    assert not os.path.exists(disabled.entry_path("p1/v4/base.gpkg"))
+
+    cache.remove("p1")
+    assert not cache.get("p1/v1/base.gpkg", os.path.join(root, "p2", "base.gpkg"))
+    shutil.rmtree(root)
+
+
+def test_clone_files(app):
+    root = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
+    src_dir = os.path.join(root, "src")
+    copy_dir(test_project_dir, src_dir)
+    files = [
+        (os.path.join(src_dir, f), os.path.join(root, "v1", f))
+        for f in ("base.gpkg", "test.txt", os.path.join("test_dir", "test2.txt"))
+    ]
+
+    def assert_cloned():
+        for src, dest in files:
+            assert generate_checksum(src) == generate_checksum(dest)
+        shutil.rmtree(os.path.join(root, "v1"))
+
+    # copy-on-write clone is not supported by filesystem, hardlink is used
+    with patch("fcntl.ioctl", side_effect=OSError(errno.EOPNOTSUPP, "Unsupported")):
+        assert clone_files(files) == ["hardlink"] * 3
+        assert all(os.path.samefile(src, dest) for src, dest in files)
+        assert_cloned()
+
+        # cross-device link, file is copied
+        with patch("os.link", side_effect=OSError(errno.EXDEV, "Cross-device link")):
+            assert clone_files(files) == ["copy"] * 3
+            assert not any(os.path.samefile(src, dest) for src, dest in files)
+            assert_cloned()
+
+    with patch("fcntl.ioctl"):
+        assert clone_files(files[:1]) == ["reflink"]
+
+    with pytest.raises(FileNotFoundError):
+        clone_files([(os.path.join(root, "missing"), os.path.join(root, "v1", "x"))])
+    shutil.rmtree(root)
+
+
+def _sleep(*args):
+    time.sleep(10)
+
+
+def test_geodiff_service(app):
+    root = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
+    os.makedirs(root)
+    base = os.path.join(test_project_dir, "base.gpkg")
+    modified = os.path.join(test_project_dir, "inserted_1_A.gpkg")
+    changeset = os.path.join(root, "changeset")
+    messages = []
+    service = GeoDiffService()
+    service.set_logger_callback(lambda level, text: messages.append(text))
+    assert service.workers
+
+    # geodiff is executed in worker process with the same results
+    service.create_changeset(base, modified, changeset)
+    assert service.has_changes(changeset)
+    assert service.changes_count(changeset) == 1
+
+    # errors and log messages are passed from worker
+    with pytest.raises(GeoDiffLibError):
+        service.apply_changeset(os.path.join(root, "missing.gpkg"), changeset)
+    assert messages
+
+    # geodiff action history counts changes with storage geodiff service
+    with patch.object(service, "run", wraps=service.run) as mock:
+        gh = GeodiffActionHistory(
+            uuid.uuid4(),
+            "v1",
+            "base.gpkg",
+            0,
+            "v2",
+            "apply_changes",
+            changeset,
+            service,
+        )
+        assert gh.changes == 1
+        mock.assert_called_with("changes_count", changeset)
+
+    # long running operation is killed
+    service.timeout = 1
+    with patch("mergin.sync.storages.geodiff_service._execute", _sleep):
+        with pytest.raises(GeoDiffTimeoutError):
+            service.changes_count(changeset)
+
+    # in-process execution
+    service.workers = 0
+    assert service.changes_count(changeset) == 1
+    with pytest.raises(AttributeError):
+        service.unknown_method()
+    shutil.rmtree(root)
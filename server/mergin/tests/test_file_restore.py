@@ -8,7 +8,13 @@ from sqlalchemy.orm.attributes import flag_modified
 
 from ..app import db
 from ..auth.models import User
-from ..sync.models import ProjectVersion, Project, GeodiffActionHistory
+from ..sync.models import (
+    ProjectVersion,
+    Project,
+    GeodiffActionHistory,
+    FileHistory,
+    FileDiffSquash,
+)
 from . import test_project_dir, TMP_DIR
 from .utils import (
     create_project,
@@ -220,3 +226,49 @@ def test_version_file_restore(diff_project):
     diff_project.storage.restore_versioned_file("test.txt", 1)
     assert not os.path.exists(test_file)
     assert not os.path.exists(diff_project.storage.geodiff_working_dir)
+
+
+def test_restore_with_squashed_diffs(app):
+    """Test to restore gpkg file from squashed diffs (skip index)"""
+    from ..sync.tasks import create_diff_squashes
+
+    working_dir = os.path.join(TMP_DIR, "restore_with_squashed_diffs")
+    basefile = os.path.join(working_dir, "base.gpkg")
+    p = _prepare_restore_project(working_dir)
+    sources = ["inserted_1_A.gpkg", "modified_1_geom.gpkg", "inserted_1_B.gpkg"]
+    for i in range(8):
+        shutil.copy(os.path.join(test_project_dir, sources[i % 3]), basefile)
+        push_change(p, "updated", "base.gpkg", working_dir)
+    # break the history so that file can be restored only forward from v1
+    push_change(p, "removed", "base.gpkg", working_dir)
+    assert p.latest_version == 10
+
+    create_diff_squashes(p.id)
+    squashes = FileDiffSquash.query.all()
+    # ranges starting with v1 contain its creation
+    assert {(s.start, s.end) for s in squashes} == {(3, 4), (5, 6), (7, 8), (5, 8)}
+    assert all(
+        os.path.exists(os.path.join(p.storage.project_dir, s.location))
+        for s in squashes
+    )
+    # nothing to do
+    create_diff_squashes(p.id)
+    assert FileDiffSquash.query.count() == 4
+
+    basefile_meta, diffs = FileHistory.diffs_chain(p, "base.gpkg", 8)
+    assert basefile_meta.project_version_name == 1
+    assert [d.location for d in diffs] == [
+        os.path.join("v2", diffs[0].path),
+        os.path.join("squashed", "v3-v4", "base.gpkg-diff"),
+        os.path.join("squashed", "v5-v8", "base.gpkg-diff"),
+    ]
+    basefile_meta, diffs = FileHistory.diffs_chain(p, "base.gpkg", 7)
+    assert len(diffs) == 4
+
+    for version in (6, 8):
+        test_file = os.path.join(
+            p.storage.project_dir, ProjectVersion.to_v_name(version), "base.gpkg"
+        )
+        os.rename(test_file, test_file + "_backup")
+        p.storage.restore_versioned_file("base.gpkg", version)
+        assert gpkgs_are_equal(test_file, test_file + "_backup")
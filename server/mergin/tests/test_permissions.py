@@ -5,7 +5,11 @@
 import datetime
 from flask_login import AnonymousUserMixin
 
-from ..sync.permissions import require_project, ProjectPermissions
+from ..sync.permissions import (
+    require_project,
+    ProjectPermissions,
+    resolve_projects_access,
+)
 from ..sync.models import ProjectRole
 from ..auth.models import User
 from ..app import db
@@ -116,3 +120,51 @@ def test_project_permissions(client):
     assert ProjectPermissions.All.check(project, user)
     assert ProjectPermissions.Edit.check(project, user)
     assert ProjectPermissions.get_user_project_role(project, user) == ProjectRole.OWNER
+
+
+def test_resolve_projects_access(client):
+    owner = add_user("owner", "pwd")
+    user = add_user("user", "pwd")
+    test_workspace = create_workspace()
+    projects = [create_project(f"access_{i}", test_workspace, owner) for i in range(5)]
+    projects[1].set_role(user.id, ProjectRole.READER)
+    projects[2].set_role(user.id, ProjectRole.EDITOR)
+    projects[3].set_role(user.id, ProjectRole.WRITER)
+    projects[4].set_role(user.id, ProjectRole.OWNER)
+    projects[0].public = True
+    projects[2].removed_at = datetime.datetime.utcnow()
+    db.session.commit()
+
+    def assert_matches_permissions(projects, user):
+        ctx = resolve_projects_access(projects, user)
+        for project in projects:
+            assert ctx["roles_map"][
+                project.id
+            ] == ProjectPermissions.get_user_project_role(project, user)
+            assert ctx["permissions_map"][project.id] == {
+                "upload": ProjectPermissions.Edit.check(project, user),
+                "update": ProjectPermissions.Update.check(project, user),
+                "delete": ProjectPermissions.Delete.check(project, user),
+            }
+        return ctx
+
+    admin = User.query.filter_by(username="mergin", is_admin=True).first()
+    for u in (owner, user, admin, AnonymousUserMixin()):
+        assert_matches_permissions(projects, u)
+
+    ctx = assert_matches_permissions(projects, user)
+    assert ctx["members_map"][projects[3].id] == {
+        owner.id: ProjectRole.OWNER,
+        user.id: ProjectRole.WRITER,
+    }
+    assert ctx["users_map"] == {owner.id: "owner", user.id: "user"}
+    assert ctx["workspaces_map"] == {test_workspace.id: test_workspace.name}
+
+    Configuration.GLOBAL_WRITE = True
+    assert_matches_permissions(projects, user)
+    Configuration.GLOBAL_ADMIN = True
+    assert_matches_permissions(projects, user)
+    user.active = False
+    db.session.commit()
+    ctx = assert_matches_permissions(projects, user)
+    assert user.id not in ctx["users_map"]
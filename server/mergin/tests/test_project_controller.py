@@ -2,6 +2,7 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
 
+import base64
 import datetime
 import os
 from dataclasses import asdict
@@ -22,7 +23,7 @@ from pygeodiff import GeoDiff
 from flask import url_for, current_app
 import tempfile
 
-from sqlalchemy import desc
+from sqlalchemy import desc, inspect
 from ..app import db
 from ..sync.models import (
     Project,
@@ -34,10 +35,18 @@ from ..sync.models import (
     FileHistory,
     PushChangeType,
     ProjectFilePath,
+    PushJob,
+    ProjectVersionManifest,
 )
 from ..sync.files import ChangesSchema
 from ..sync.schemas import ProjectListSchema
 from ..sync.utils import generate_checksum, is_versioned_file
+from ..sync.storages.disk import (
+    read_chunk_digest,
+    save_chunk_digest,
+    RestoreCache,
+    DiskStorage,
+)
 from ..auth.models import User, UserProfile
 
 from . import (
@@ -56,6 +65,7 @@ from .utils import (
     DateTimeEncoder,
     login,
     file_info,
+    gpkgs_are_equal,
     login_as_admin,
     upload_file_to_project,
 )
@@ -67,6 +77,8 @@ CHUNK_SIZE = 1024
 
 
 def test_file_history(client, diff_project):
+    from ..sync.tasks import create_diff_summaries
+
     resp = client.get(
         f"/v1/resource/history/{test_workspace_name}/{test_project}?path=test.gpkg"
     )
@@ -99,6 +111,9 @@ def test_file_history(client, diff_project):
     assert test_gpkg_history["v9"]["change"] == "added"
 
     # check geodiff changeset in project version object
+    create_diff_summaries(
+        ProjectVersion.query.filter_by(project_id=diff_project.id, name=7).first().id
+    )
     resp = client.get(f"/v1/project/version/{diff_project.id}/v7")
     version_info = resp.json
     assert "changesets" in version_info
@@ -164,6 +179,81 @@ def test_file_history(client, diff_project):
     assert "expiration" in history["v7"]
 
 
+@pytest.mark.parametrize("diffable", [True, False])
+@pytest.mark.parametrize("since", [1, 4, 8])
+def test_files_changes(diff_project, since, diffable):
+    """Bulk history of files matches history of single files"""
+    paths = [
+        fp.path
+        for fp in ProjectFilePath.query.filter_by(project_id=diff_project.id).all()
+    ]
+    to = diff_project.latest_version
+    history = FileHistory.files_changes(diff_project.id, paths, since, to, diffable)
+    assert history
+    for path in paths:
+        expected = FileHistory.changes(diff_project.id, path, since, to, diffable)
+        assert [item.id for item in history.get(path, [])] == [
+            item.id for item in expected
+        ]
+    # history of non versioned files is not returned
+    assert "test_dir/test2.txt" not in history
+    assert FileHistory.files_changes(diff_project.id, [], since, to) == {}
+    # related rows are loaded eagerly
+    for items in history.values():
+        for item in items:
+            assert not {"file", "version"} & inspect(item).unloaded
+    for item in FileHistory.changes(diff_project.id, "base.gpkg", since, to):
+        assert not {"file", "version"} & inspect(item).unloaded
+
+
+def test_diff_summaries(client, diff_project):
+    from ..sync.tasks import create_diff_summaries
+
+    pv = ProjectVersion.query.filter_by(project_id=diff_project.id, name=7).first()
+    create_diff_summaries(pv.id)
+    fh = pv.changes.filter_by(change=PushChangeType.UPDATE_DIFF.value).first()
+    assert fh.diff_summary["size"] == fh.diff_file.size
+    assert {
+        "table": "simple",
+        "insert": 1,
+        "update": 0,
+        "delete": 0,
+    } in fh.diff_summary["summary"]
+
+    # precomputed summaries are only read from db
+    with patch.object(FileHistory, "calculate_diff_summary") as summary_mock:
+        resp = client.get(f"/v1/project/version/{diff_project.id}/v7")
+        assert resp.status_code == 200
+        assert resp.json["changesets"] == {"base.gpkg": fh.diff_summary}
+        assert not summary_mock.called
+
+    # missing summary is not calculated on demand
+    pv = ProjectVersion.query.filter_by(project_id=diff_project.id, name=6).first()
+    fh = pv.changes.filter_by(change=PushChangeType.UPDATE_DIFF.value).first()
+    assert fh.diff_summary is None
+    with patch.object(FileHistory, "calculate_diff_summary") as summary_mock:
+        resp = client.get(f"/v1/project/version/{diff_project.id}/v6")
+        assert resp.json["changesets"] == {}
+        assert not summary_mock.called
+    assert fh.diff_summary is None
+
+    # missing diff file is not recorded as error, summary is calculated when file is available
+    diff_file = os.path.join(diff_project.storage.project_dir, fh.diff_file.location)
+    os.rename(diff_file, diff_file + "-backup")
+    create_diff_summaries(pv.id)
+    assert fh.diff_summary is None
+    os.rename(diff_file + "-backup", diff_file)
+    create_diff_summaries(pv.id)
+    assert fh.diff_summary["summary"]
+    resp = client.get(f"/v1/project/version/{diff_project.id}/v6")
+    assert fh.diff_summary == resp.json["changesets"]["base.gpkg"]
+
+    # broken diff file
+    with open(diff_file, "wb") as f:
+        f.write(b"broken")
+    assert "error" in fh.calculate_diff_summary()
+
+
 def test_get_paginated_projects(client):
     user = User.query.filter_by(username="mergin").first()
     test_workspace = create_workspace()
@@ -357,6 +447,53 @@ def test_get_paginated_projects(client):
     assert resp.json.get("count") == 0
 
 
+@pytest.mark.parametrize(
+    "order_params", ["", "&order_params=name_desc", "&order_params=disk_usage_asc"]
+)
+def test_get_paginated_projects_cursor(client, order_params):
+    user = User.query.filter_by(username="mergin").first()
+    test_workspace = create_workspace()
+    for i in range(11):
+        create_project("foo" + str(i), test_workspace, user)
+
+    names = []
+    cursors = []
+    cursor = ""
+    while cursor is not None:
+        resp = client.get(
+            f"/v1/project/paginated?per_page=5&cursor={cursor}{order_params}"
+        )
+        assert resp.status_code == 200
+        assert resp.json["count"] is None
+        assert len(resp.json["projects"]) <= 5
+        names.extend(p["name"] for p in resp.json["projects"])
+        cursor = resp.json["next_cursor"]
+        cursors.append(cursor)
+    assert len(names) == len(set(names)) == 12
+    if order_params:
+        resp = client.get(f"/v1/project/paginated?page=1&per_page=12{order_params}")
+        assert resp.json["count"] == 12
+        assert resp.json["next_cursor"] is None
+        if "name" in order_params:
+            assert names == [p["name"] for p in resp.json["projects"]]
+
+    resp = client.get("/v1/project/paginated?per_page=5&cursor=foo")
+    assert resp.status_code == 400
+
+    # well-formed cursor with values of wrong type
+    values = json.loads(base64.urlsafe_b64decode(cursors[0]))
+    for tampered in (
+        [1 if isinstance(values[0], str) else "1"] + values[1:],
+        values[:-1] + [True],
+    ):
+        cursor = base64.urlsafe_b64encode(json.dumps(tampered).encode()).decode()
+        resp = client.get(
+            f"/v1/project/paginated?per_page=5&cursor={cursor}{order_params}"
+        )
+        assert resp.status_code == 400
+        assert resp.json["detail"] == "Invalid cursor"
+
+
 def test_get_projects_by_names(client):
     user = User.query.filter_by(username="mergin").first()
     test_workspace = create_workspace()
@@ -646,6 +783,105 @@ def test_get_project_at_version(client, diff_project):
     assert resp5.status_code == 400
 
 
+def test_version_files_manifest(app, diff_project):
+    """Files of project versions are read from materialized manifests"""
+
+    def _files(rows):
+        return sorted((row.path, row.location, row.checksum) for row in rows)
+
+    versions = (
+        ProjectVersion.query.filter_by(project_id=diff_project.id)
+        .order_by(ProjectVersion.name)
+        .all()
+    )
+    expected = {pv.name: _files(pv._files_from_start()) for pv in versions}
+    for pv in versions:
+        assert pv.manifest
+        assert _files(pv._files_from_manifest()) == expected[pv.name]
+        assert _files(pv.files) == expected[pv.name]
+    # file removed in v2 and added again in v3
+    assert "base.gpkg" not in [f[0] for f in expected[2]]
+    assert "base.gpkg" in [f[0] for f in expected[3]]
+
+    # versions without manifest fallback to history lookup and can be backfilled
+    ProjectVersionManifest.query.delete()
+    db.session.commit()
+    db.session.expire_all()
+    for pv in versions:
+        assert not pv.manifest
+        assert _files(pv.files) == expected[pv.name]
+
+    result = app.test_cli_runner().invoke(args=["project", "backfill-manifests"])
+    assert f"{len(versions)} manifests created" in result.output
+    db.session.expire_all()
+    for pv in versions:
+        assert _files(pv._files_from_manifest()) == expected[pv.name]
+
+
+def test_project_version_bulk_files(diff_project):
+    """File history of push is inserted in bulk and latest files are updated from returned ids"""
+    files = [
+        {"path": f"photos/img_{i}.jpg", "checksum": f"{i:040x}", "size": i}
+        for i in range(10)
+    ]
+    pv = add_project_version(diff_project, {"added": files})
+    assert pv.changes.count() == 10
+    assert {f["path"] for f in files}.issubset({f.path for f in pv.files})
+    assert all(fh.diff is None for fh in pv.changes)
+
+    # existing paths are reused, removed path is added again
+    add_project_version(
+        diff_project,
+        {
+            "updated": [{**files[0], "checksum": "0" * 40}],
+            "removed": files[1:5],
+            "added": [{"path": "base.gpkg", "checksum": "1" * 40, "size": 1}],
+        },
+    )
+    assert ProjectFilePath.query.filter(
+        ProjectFilePath.project_id == diff_project.id,
+        ProjectFilePath.path.like("photos/%"),
+    ).count() == len(files)
+    latest_files = {f.path: f for f in diff_project.files}
+    assert latest_files["photos/img_0.jpg"].checksum == "0" * 40
+    assert latest_files["base.gpkg"].checksum == "1" * 40
+    assert not any(f["path"] in latest_files for f in files[1:5])
+    assert len(diff_project.latest_project_files.file_history_ids) == len(latest_files)
+    assert diff_project.disk_usage == sum(f.size for f in latest_files.values())
+
+
+def test_project_files_cache(diff_project):
+    """Latest project files are queried once per transaction unless they change"""
+    with patch.object(
+        Project, "_query_files", autospec=True, side_effect=Project._query_files
+    ) as mock:
+        files = diff_project.files
+        assert diff_project.get_file("test.txt") == next(
+            f for f in files if f.path == "test.txt"
+        )
+        assert not diff_project.get_file("not-existing.txt")
+        assert diff_project.files == files
+        assert mock.call_count == 1
+
+        # cache is dropped at the end of transaction
+        db.session.commit()
+        assert diff_project.files == files
+        assert mock.call_count == 2
+
+        # and when latest files are modified
+        pv = add_project_version(
+            diff_project,
+            {"added": [{"path": "new.txt", "checksum": "1" * 40, "size": 1}]},
+        )
+        assert diff_project.get_file("new.txt")
+        assert len(pv.files) == len(files) + 1
+        diff_project.latest_project_files.file_history_ids = []
+        db.session.flush()
+        assert diff_project.files == []
+        db.session.rollback()
+        assert len(diff_project.files) == len(files) + 1
+
+
 def test_update_project(client):
     project = Project.query.filter_by(
         name=test_project, workspace_id=test_workspace_id
@@ -822,6 +1058,86 @@ def test_download_file(client, proj_name, file_path, mimetype, expected):
         assert resp.headers["content-type"] == mimetype
 
 
+def test_download_file_range(client):
+    url = f"/v1/project/raw/{test_workspace_name}/{test_project}?file=base.gpkg"
+    with open(os.path.join(test_project_dir, "base.gpkg"), "rb") as f:
+        data = f.read()
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.data == data
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    etag = resp.headers["ETag"]
+    assert etag == f'"{generate_checksum(os.path.join(test_project_dir, "base.gpkg"))}"'
+
+    # resume download
+    resp = client.get(url, headers={"Range": "bytes=1000-"})
+    assert resp.status_code == 206
+    assert resp.data == data[1000:]
+    assert resp.headers["Content-Range"] == f"bytes 1000-{len(data) - 1}/{len(data)}"
+    resp = client.get(url, headers={"Range": "bytes=10-19", "If-Range": etag})
+    assert resp.status_code == 206
+    assert resp.data == data[10:20]
+    assert resp.headers["Content-Length"] == "10"
+    resp = client.get(url, headers={"Range": "bytes=-10"})
+    assert resp.status_code == 206
+    assert resp.data == data[-10:]
+
+    # file has changed in the meantime, full content is returned
+    resp = client.get(url, headers={"Range": "bytes=10-19", "If-Range": '"foo"'})
+    assert resp.status_code == 200
+    assert resp.data == data
+    # multiple ranges are not supported
+    resp = client.get(url, headers={"Range": "bytes=0-1,5-6"})
+    assert resp.status_code == 200
+    assert resp.data == data
+    resp = client.get(url, headers={"Range": f"bytes={len(data)}-"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == f"bytes */{len(data)}"
+
+
+def test_download_project_raw(client, diff_project):
+    resp = client.get(
+        f"/v1/project/manifest/{test_workspace_name}/{diff_project.name}?version=v9"
+    )
+    assert resp.status_code == 200
+    manifest = resp.json
+    assert manifest["version"] == "v9"
+    pv = ProjectVersion.query.filter_by(project_id=diff_project.id, name=9).first()
+    assert [f["path"] for f in manifest["files"]] == sorted(f.path for f in pv.files)
+    assert manifest["size"] == sum(f.size for f in pv.files)
+    assert manifest["files"][1]["offset"] == manifest["files"][0]["size"]
+    assert (
+        client.get(
+            f"/v1/project/manifest/{test_workspace_name}/{diff_project.name}?version=v100"
+        ).status_code
+        == 404
+    )
+
+    # raw stream is not limited by archive size
+    client.application.config["MAX_DOWNLOAD_ARCHIVE_SIZE"] = 10
+    url = f"/v1/project/download/{test_workspace_name}/{diff_project.name}?version=v9&format=raw"
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] == f'"{manifest["etag"]}"'
+    data = resp.data
+    assert len(data) == manifest["size"]
+    for f in manifest["files"]:
+        chunk = data[f["offset"] : f["offset"] + f["size"]]
+        assert hashlib.sha1(chunk).hexdigest() == f["checksum"]
+
+    # resume interrupted download in the middle of file
+    offset = manifest["files"][1]["offset"] + 5
+    resp = client.get(
+        url,
+        headers={"Range": f"bytes={offset}-", "If-Range": resp.headers["ETag"]},
+    )
+    assert resp.status_code == 206
+    assert resp.data == data[offset:]
+    resp = client.get(url, headers={"Range": f"bytes=3-{offset}"})
+    assert resp.status_code == 206
+    assert resp.data == data[3 : offset + 1]
+
+
 test_download_file_version_data = [
     (
         test_project,
@@ -873,6 +1189,32 @@ def test_download_file_by_version(
     assert resp.status_code == expected
 
 
+def test_download_file_restore_cache(client, diff_project):
+    """Reconstructed file versions are served from cache when removed from project directory"""
+    client.application.config["RESTORE_CACHE_SIZE"] = 1024 * 1024 * 1024
+    file_location = os.path.join(diff_project.storage.project_dir, "v6", "base.gpkg")
+    url = f"/v1/project/raw/{test_workspace_name}/{test_project}?file=base.gpkg&version=v6"
+    for _ in range(3):
+        os.remove(file_location)
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert os.path.exists(file_location)
+
+    actions = [
+        gh.action
+        for gh in GeodiffActionHistory.query.filter_by(
+            project_id=diff_project.id, target_version="v6"
+        ).order_by(GeodiffActionHistory.id)
+    ]
+    assert actions == ["restore_file", "restore_file_cached", "restore_file_cached"]
+    # cache entry is removed with project
+    diff_project.storage.delete()
+    assert not RestoreCache().get(
+        os.path.join(diff_project.storage_params["location"], "v6", "base.gpkg"),
+        file_location,
+    )
+
+
 test_download_file_diffs_data = [
     (test_project, "", "base.gpkg", 400),  # no version specified
     (test_project, "v3", "base.gpkg", 404),  # upload
@@ -954,6 +1296,68 @@ def test_download_diff_file(client, diff_project):
         assert resp.status_code == 404
 
 
+test_download_file_delta_data = [
+    ("base.gpkg", "v5", "v8", 200),  # two diffs concatenated
+    ("base.gpkg", "v3", "v4", 200),  # single diff
+    ("base.gpkg", "v7", "v8", 204),  # no changes
+    ("base.gpkg", "v4", "v6", 422),  # forced update in between
+    ("base.gpkg", "v8", "", 422),  # file removed in between
+    ("base.gpkg", "v6", "v5", 400),  # invalid range
+    ("base.gpkg", "v5", "v11", 400),  # version does not exist
+    ("test.txt", "v1", "v2", 400),  # not versioned file
+]
+
+
+@pytest.mark.parametrize("file,since,to,expected", test_download_file_delta_data)
+def test_download_file_delta(client, diff_project, file, since, to, expected):
+    url = f"/v1/project/delta/{test_workspace_name}/{test_project}?file={file}&since={since}&to={to}"
+    resp = client.get(url)
+    assert resp.status_code == expected
+    if expected != 200:
+        return
+
+    # changeset updates file from one version to another
+    changeset = os.path.join(TMP_DIR, "delta" + str(uuid.uuid4()))
+    with open(changeset, "wb") as f:
+        f.write(resp.data)
+    patched_file = os.path.join(TMP_DIR, "patched" + str(uuid.uuid4()))
+    base = FileHistory.changes(
+        diff_project.id, file, 1, ProjectVersion.from_v_name(since)
+    )[0]
+    shutil.copy(base.abs_path, patched_file)
+    GeoDiff().apply_changeset(patched_file, changeset)
+    target = FileHistory.changes(
+        diff_project.id, file, 1, ProjectVersion.from_v_name(to)
+    )[0]
+    assert gpkgs_are_equal(patched_file, target.abs_path)
+
+    # the same changeset is served from cache
+    client.application.config["RESTORE_CACHE_SIZE"] = 1024 * 1024 * 1024
+    resp = client.get(url)
+    cache_dir = RestoreCache().entry_path(
+        os.path.join(diff_project.storage_params["location"], "delta")
+    )
+    entry = f"{since}-{to}-{resp.get_etag()[0]}"
+    assert any(entry in files for _, _, files in os.walk(cache_dir))
+    with patch.object(DiskStorage, "file_path") as file_path_mock:
+        resp2 = client.get(url)
+        assert not file_path_mock.called
+    assert resp2.data == resp.data
+    assert resp2.headers["ETag"] == resp.headers["ETag"]
+    resp = client.get(url, headers={"Range": "bytes=0-9"})
+    assert resp.status_code == 206
+    assert resp.data == resp2.data[:10]
+
+    # unsatisfiable range, temporary changeset is removed even though it was not read
+    working_dir = diff_project.storage.geodiff_working_dir
+    tmp_files = set(os.listdir(working_dir))
+    resp = client.get(url, headers={"Range": f"bytes={len(resp2.data)}-"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == f"bytes */{len(resp2.data)}"
+    resp.close()
+    assert set(os.listdir(working_dir)) == tmp_files
+
+
 def test_download_fail(app, client):
     # remove project files to mimic mismatch with db
     os.remove(
@@ -1368,6 +1772,11 @@ def test_chunk_upload(client, app):
     resp = client.post(url, data=data, headers=headers)
     assert resp.status_code == 200
     assert resp.json["checksum"] == checksum.hexdigest()
+    # digest is stored next to chunk for push finish
+    assert read_chunk_digest(os.path.join(upload_dir, "chunks", chunk_id)) == {
+        "checksum": checksum.hexdigest(),
+        "size": len(data),
+    }
 
     # tests to send bigger chunk than allowed
     app.config["MAX_CHUNK_SIZE"] = 10 * CHUNK_SIZE
@@ -1467,6 +1876,133 @@ def test_push_finish(client):
     assert SyncFailuresHistory.query.count() == 1
 
 
+def test_push_finish_chunk_digest(client):
+    """Test chunks digests recorded on upload are used for integrity check"""
+    changes = _get_changes(test_project_dir)
+    upload, upload_dir = create_transaction("mergin", changes)
+    url = "/v1/project/push/finish/{}".format(upload.id)
+    f = upload.changes["added"][0]
+    chunk = os.path.join(upload_dir, "chunks", f["chunks"][0])
+
+    # recorded size does not match the declared one, file is rejected before being assembled
+    upload_chunks(upload_dir, upload.changes)
+    save_chunk_digest(chunk, generate_checksum(chunk), f["size"] + 1)
+    resp = client.post(url, headers=json_headers)
+    assert resp.status_code == 422
+    assert resp.json["detail"]["corrupted_files"] == [f["path"]]
+
+    # chunk on disk does not match its digest
+    upload_chunks(upload_dir, upload.changes)
+    save_chunk_digest(chunk, generate_checksum(chunk), os.path.getsize(chunk))
+    with open(chunk, "ab") as out_file:
+        out_file.write(b"x")
+    resp = client.post(url, headers=json_headers)
+    assert resp.status_code == 422
+    assert resp.json["detail"]["corrupted_files"] == [f["path"]]
+
+    # checksum of single chunk file does not match the declared one
+    upload_chunks(upload_dir, upload.changes)
+    single = upload.changes["updated"][0]
+    chunk = os.path.join(upload_dir, "chunks", single["chunks"][0])
+    save_chunk_digest(chunk, hashlib.sha1(b"x").hexdigest(), os.path.getsize(chunk))
+    resp = client.post(url, headers=json_headers)
+    assert resp.status_code == 422
+    assert resp.json["detail"]["corrupted_files"] == [single["path"]]
+
+    upload_chunks(upload_dir, upload.changes)
+    save_chunk_digest(chunk, generate_checksum(chunk), os.path.getsize(chunk))
+    resp = client.post(url, headers=json_headers)
+    assert resp.status_code == 200
+
+
+def test_push_finish_background(client):
+    """Test upload finalization done by asynchronous job"""
+    from ..sync.tasks import finish_push
+
+    changes = _get_changes(test_project_dir)
+    upload, upload_dir = create_transaction("mergin", changes)
+    project = upload.project
+    upload_chunks(upload_dir, upload.changes)
+    uploaded = upload.changes["added"] + upload.changes["updated"]
+    for f in uploaded:
+        for chunk_id in f["chunks"]:
+            chunk = os.path.join(upload_dir, "chunks", chunk_id)
+            save_chunk_digest(chunk, generate_checksum(chunk), os.path.getsize(chunk))
+    url = f"/v1/project/push/finish/{upload.id}?background=true"
+
+    resp = client.post(url, headers=json_headers)
+    assert resp.status_code == 202
+    job_id = resp.json["id"]
+    assert resp.json["status"] == "queued"
+    assert resp.json["transaction"] == upload.id
+    assert set(resp.json["files"].keys()) == {f["path"] for f in uploaded}
+    assert project.latest_version == 1
+    # the same transaction cannot be finalized twice
+    assert client.post(url, headers=json_headers).status_code == 400
+    # nor canceled while waiting for job
+    resp = client.post(f"/v1/project/push/cancel/{upload.id}")
+    assert resp.status_code == 400
+    # upload is still locked, even when lock expires while job waits in queue
+    assert upload.is_active()
+    os.utime(upload.lockfile, (0, 0))
+    assert upload.is_active()
+
+    finish_push(job_id, "127.0.0.1", "Werkzeug", json_headers["X-Device-Id"])
+    resp = client.get(f"/v1/project/push/job/{job_id}")
+    assert resp.status_code == 200
+    assert resp.json["status"] == "finished"
+    assert resp.json["version"] == "v2"
+    assert resp.json["finished"]
+    assert all(state == "assembled" for state in resp.json["files"].values())
+    assert project.latest_version == 2
+    assert not Upload.query.get(upload.id)
+    assert not os.path.exists(upload_dir)
+    version = project.get_latest_version()
+    assert version.device_id == json_headers["X-Device-Id"]
+    assert len(version.changes.all()) == len(
+        changes["added"] + changes["updated"] + changes["removed"]
+    )
+
+    # job failure is reported and upload is released
+    upload, upload_dir = create_transaction("mergin", changes, 2)
+    resp = client.post(
+        f"/v1/project/push/finish/{upload.id}?background=true", headers=json_headers
+    )
+    assert resp.status_code == 202
+    job_id = resp.json["id"]
+    finish_push(job_id, "127.0.0.1", "Werkzeug", json_headers["X-Device-Id"])
+    job = PushJob.query.get(job_id)
+    assert job.status == "failed"
+    assert "corrupted_files" in job.error
+    assert not job.version
+    assert not Upload.query.get(upload.id)
+    failure = SyncFailuresHistory.query.filter_by(project_id=project.id).first()
+    assert failure.error_type == "push_finish"
+    assert project.latest_version == 2
+
+    # upload is released on unexpected error as well
+    upload, upload_dir = create_transaction("mergin", changes, 2)
+    upload_chunks(upload_dir, upload.changes)
+    resp = client.post(
+        f"/v1/project/push/finish/{upload.id}?background=true", headers=json_headers
+    )
+    job_id = resp.json["id"]
+    with patch(
+        "mergin.sync.public_api_controller.finish_upload", side_effect=RuntimeError
+    ):
+        with pytest.raises(RuntimeError):
+            finish_push(job_id, "127.0.0.1", "Werkzeug", json_headers["X-Device-Id"])
+    assert PushJob.query.get(job_id).status == "failed"
+    assert not Upload.query.get(upload.id)
+    assert not os.path.exists(upload_dir)
+
+    # job status is available only to push author
+    user = add_user("tester", "tester")
+    login(client, user.username, "tester")
+    assert client.get(f"/v1/project/push/job/{job_id}").status_code == 403
+    assert client.get("/v1/project/push/job/not-existing").status_code == 404
+
+
 def test_push_close(client):
     changes = _get_changes(test_project_dir)
     upload, upload_dir = create_transaction("mergin", changes)
@@ -1617,6 +2153,59 @@ def test_push_diff_finish(client):
     assert resp.status_code == 422
 
 
+def test_push_finish_concurrent_geodiff(client, app):
+    """Test updated geopackages are processed concurrently, each in separate geodiff working dir"""
+    app.config["PUSH_GEODIFF_CONCURRENCY"] = 2
+    working_dir = os.path.join(TMP_DIR, "test_push_finish_concurrent_geodiff")
+    if os.path.exists(working_dir):
+        shutil.rmtree(working_dir)
+    os.makedirs(working_dir)
+    # base.gpkg is updated with diff, modified_1_geom.gpkg is uploaded whole and diff is constructed on server
+    shutil.copy(
+        os.path.join(test_project_dir, "base.gpkg"),
+        os.path.join(working_dir, "modified_1_geom.gpkg"),
+    )
+    changes = {
+        "added": [],
+        "removed": [],
+        "updated": [
+            create_diff_meta("base.gpkg", "inserted_1_A.gpkg", test_project_dir),
+            file_info(working_dir, "modified_1_geom.gpkg", chunk_size=CHUNK_SIZE),
+        ],
+    }
+    upload, upload_dir = create_transaction("mergin", changes)
+    upload_chunks(upload_dir, upload.changes, src_dir=working_dir)
+    clones = []
+    clone = DiskStorage.clone
+
+    def _clone(storage):
+        clones.append(clone(storage))
+        return clones[-1]
+
+    with patch.object(DiskStorage, "clone", _clone):
+        resp = client.post(f"/v1/project/push/finish/{upload.id}")
+    assert resp.status_code == 200
+    assert len({c.geodiff_working_dir for c in clones}) == 2
+    assert not any(os.path.exists(c.geodiff_working_dir) for c in clones)
+
+    project = upload.project
+    assert gpkgs_are_equal(
+        os.path.join(project.storage.project_dir, "v2", "base.gpkg"),
+        os.path.join(test_project_dir, "inserted_1_A.gpkg"),
+    )
+    gh = GeodiffActionHistory.query.filter_by(
+        project_id=project.id, target_version="v2"
+    ).one()
+    assert gh.file_name == "base.gpkg"
+    latest_version = project.get_latest_version()
+    assert (
+        latest_version.changes.filter(
+            FileHistory.change == PushChangeType.UPDATE_DIFF.value
+        ).count()
+        == 2
+    )
+
+
 def test_push_no_diff_finish(client):
     working_dir = os.path.join(TMP_DIR, "test_push_no_diff_finish")
     # cleanup
@@ -1972,6 +2561,50 @@ def test_file_diffs_chain(diff_project):
     assert not diffs
 
 
+def test_file_keyframes(diff_project):
+    """Test keyframe policy on diff_project history of base.gpkg
+    v5 update basefile, v6 update_diff, v7 update_diff - latest basefile, v8 no change
+    """
+    from ..sync.tasks import create_keyframes, optimize_storage
+
+    # remove v9 and v10 to mimic that project history end with existing file
+    for name in (9, 10):
+        ProjectVersion.query.filter_by(project_id=diff_project.id, name=name).delete()
+    diff_project.latest_version = 8
+    db.session.commit()
+    diff_project.cache_latest_files()
+    v6 = os.path.join(diff_project.storage.project_dir, "v6", "base.gpkg")
+    backup = os.path.join(tempfile.gettempdir(), "base.gpkg")
+    shutil.copy(v6, backup)
+    os.remove(v6)
+
+    # limits not reached
+    create_keyframes(diff_project.id)
+    assert not FileHistory.query.filter_by(keyframe=True).count()
+
+    with patch.object(SyncConfiguration, "KEYFRAME_DIFFS_COUNT", 1), patch.object(
+        SyncConfiguration, "FILE_EXPIRATION", 0
+    ):
+        optimize_storage(diff_project.id)
+    # v6 was restored and kept as keyframe, the latest file is not needed as keyframe
+    keyframes = FileHistory.query.filter_by(keyframe=True).all()
+    assert len(keyframes) == 1
+    assert keyframes[0].project_version_name == 6
+    assert keyframes[0].expiration is None
+    assert gpkgs_are_equal(v6, backup)
+    assert not os.path.exists(
+        os.path.join(diff_project.storage.project_dir, "v4", "base.gpkg")
+    )
+
+    # keyframe is used as the closest basefile
+    basefile, diffs = FileHistory.diffs_chain(diff_project, "base.gpkg", 6)
+    assert basefile.version.name == 6
+    assert not diffs
+    basefile, diffs = FileHistory.diffs_chain(diff_project, "base.gpkg", 8)
+    assert basefile.version.name == 7
+    assert not diffs
+
+
 changeset_data = [
     ("v1", "test.gpkg", 404),
     ("v1", "test.txt", 404),
@@ -2126,6 +2759,34 @@ def test_project_conflict_files(diff_project, file):
     assert project_info["has_conflict"]
 
 
+def test_project_files_summary(diff_project):
+    assert not diff_project.has_conflict
+    assert diff_project.qgis_count == 1
+    assert diff_project.tags == ["valid_qgis", "input_use"]
+    changes = {
+        "added": [
+            {
+                "checksum": "89469a6482267de394c7c7270cb7ffafe694ea76",
+                "path": path,
+                "size": 1024,
+            }
+            for path in ["project.qgs", "other.QGZ", "base.gpkg_rebase_conflicts"]
+        ]
+    }
+    add_project_version(diff_project, changes)
+    assert diff_project.has_conflict
+    assert diff_project.qgis_count == 3
+    assert diff_project.tags == []
+
+    # summary is recalculated together with cached files
+    diff_project.has_conflict = False
+    diff_project.qgis_count = 0
+    db.session.commit()
+    diff_project.cache_latest_files()
+    assert diff_project.has_conflict
+    assert diff_project.qgis_count == 3
+
+
 def test_orphan_project(client):
     """Test project whose creator was removed"""
     user = add_user("tests", "tests")
@@ -0,0 +1,185 @@
+# Copyright (C) Lutra Consulting Limited
+#
+# SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+
+import os
+import uuid
+import pytest
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from ..app import db
+from ..auth.models import User, UserProfile
+from ..sync.models import Project, PushJob
+from ..sync.storages.disk import save_chunk_digest
+from ..sync.tasks import finish_push
+from ..sync.utils import generate_checksum
+from ..replicas import REPLICA_KEY, LSN_COOKIE, LSN_HEADER, use_replica
+from . import json_headers, test_project, test_project_dir, test_workspace_name
+from .test_project_controller import _get_changes, create_transaction, upload_chunks
+
+
+@pytest.fixture(scope="function")
+def replica(client):
+    """Database with the same schema and users (but no projects) configured as replica.
+
+    It is not a streaming replica of primary, so it never reports replayed WAL position,
+    and its content tells whether query was routed to replica.
+    """
+    url = make_url(current_app.config["SQLALCHEMY_DATABASE_URI"])
+    name = f"{url.database}_replica"
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {name}"))
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    current_app.config["SQLALCHEMY_BINDS"] = {"replica_0": str(url.set(database=name))}
+    engine = db.get_engine(bind="replica_0")
+    db.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table in (User.__table__, UserProfile.__table__):
+            rows = db.session.execute(table.select()).mappings().all()
+            conn.execute(table.insert(), [dict(row) for row in rows])
+    yield engine
+
+    db.session.remove()
+    current_app.config["SQLALCHEMY_BINDS"] = {}
+    engine.dispose()
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP DATABASE IF EXISTS {name}"))
+
+
+def test_replica_session(replica):
+    users_count = User.query.count()
+    projects_count = Project.query.count()
+    assert projects_count
+    assert use_replica()
+    assert db.session.info[REPLICA_KEY] == "replica_0"
+    assert Project.query.count() == 0
+    assert User.query.count() == users_count
+    # statements other than plain select switch session to primary
+    db.session.execute(text("SELECT 1"))
+    assert REPLICA_KEY not in db.session.info
+    assert Project.query.count() == projects_count
+
+    db.session.remove()
+    assert use_replica()
+    assert len(Project.query.with_for_update().all()) == projects_count
+    assert REPLICA_KEY not in db.session.info
+
+    # replica does not catch up with primary, or invalid watermark
+    db.session.remove()
+    assert not use_replica("0/0")
+    assert not use_replica("foo")
+    assert REPLICA_KEY not in db.session.info
+
+
+def test_replica_routing(client, replica):
+    # read only request from replica (there are no projects)
+    resp = client.get("/v1/project/paginated?page=1&per_page=10")
+    assert resp.status_code == 200
+    assert resp.json["count"] == 0
+    assert LSN_HEADER not in resp.headers
+
+    # client with write watermark reads from primary
+    resp = client.get(
+        "/v1/project/paginated?page=1&per_page=10", headers={LSN_HEADER: "0/0"}
+    )
+    assert resp.json["count"] == 1
+
+    # views polling state changed by other processes always read from primary
+    adapter = current_app.url_map.bind("localhost.localdomain")
+    endpoint, _ = adapter.match(f"/v1/project/push/job/{uuid.uuid4()}")
+    assert current_app.view_functions[endpoint].primary_only
+
+    # write is done on primary and watermark is passed to client
+    resp = client.post(f"/v1/project/{test_workspace_name}", json={"name": "foo"})
+    assert resp.status_code == 200
+    lsn = resp.headers[LSN_HEADER]
+    assert f"{LSN_COOKIE}={lsn}" in resp.headers["Set-Cookie"]
+    resp = client.get("/v1/project/paginated?page=1&per_page=10")
+    assert resp.json["count"] == 2
+
+    client.delete_cookie(LSN_COOKIE, domain="localhost.localdomain")
+    resp = client.get("/v1/project/paginated?page=1&per_page=10")
+    assert resp.json["count"] == 0
+
+    # request which did not write does not pass watermark
+    resp = client.post(
+        "/v1/project/by_names", json={"projects": [f"{test_workspace_name}/foo"]}
+    )
+    assert resp.status_code == 200
+    assert LSN_HEADER not in resp.headers
+    assert "Set-Cookie" not in resp.headers
+
+
+def set_replay_lsn(replica, lsn):
+    """Mock WAL position replayed by replica, pg_last_wal_replay_lsn is shadowed by function in public schema"""
+    with replica.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE OR REPLACE FUNCTION public.pg_last_wal_replay_lsn() RETURNS pg_lsn "
+                f"AS $$ SELECT CAST('{lsn}' AS pg_lsn) $$ LANGUAGE SQL"
+            )
+        )
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(
+            text(
+                f"ALTER DATABASE {replica.url.database} SET search_path = public, pg_catalog"
+            )
+        )
+    replica.dispose()
+
+
+def test_replica_caught_up(client, replica):
+    """Replica which replayed WAL up to client's watermark is used"""
+    set_replay_lsn(replica, "0/1000")
+
+    resp = client.get(
+        "/v1/project/paginated?page=1&per_page=10", headers={LSN_HEADER: "0/FFF"}
+    )
+    assert resp.json["count"] == 0
+    resp = client.get(
+        "/v1/project/paginated?page=1&per_page=10", headers={LSN_HEADER: "0/1001"}
+    )
+    assert resp.json["count"] == 1
+
+    assert use_replica("0/1000")
+    assert db.session.info[REPLICA_KEY] == "replica_0"
+    assert Project.query.count() == 0
+    assert not use_replica("0/1001")
+    assert REPLICA_KEY not in db.session.info
+
+
+def test_replica_background_push(client, replica):
+    """Client reads version committed by push job from primary until replica replays it"""
+    changes = _get_changes(test_project_dir)
+    upload, upload_dir = create_transaction("mergin", changes)
+    upload_chunks(upload_dir, upload.changes)
+    for f in upload.changes["added"] + upload.changes["updated"]:
+        for chunk_id in f["chunks"]:
+            chunk = os.path.join(upload_dir, "chunks", chunk_id)
+            save_chunk_digest(chunk, generate_checksum(chunk), os.path.getsize(chunk))
+    resp = client.post(
+        f"/v1/project/push/finish/{upload.id}?background=true", headers=json_headers
+    )
+    assert resp.status_code == 202
+    job_id = resp.json["id"]
+    push_lsn = resp.headers[LSN_HEADER]
+
+    # replica replayed WAL only up to the push request
+    set_replay_lsn(replica, push_lsn)
+    finish_push(job_id, "127.0.0.1", "Werkzeug", json_headers["X-Device-Id"])
+    resp = client.get(f"/v1/project/push/job/{job_id}")
+    assert resp.json["status"] == "finished"
+    job_lsn = resp.headers[LSN_HEADER]
+    assert job_lsn == PushJob.query.get(job_id).lsn
+    assert f"{LSN_COOKIE}={job_lsn}" in resp.headers["Set-Cookie"]
+
+    # project is read from primary (replica does not have it at all)
+    url = f"/v1/project/{test_workspace_name}/{test_project}"
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.json["version"] == "v2"
+    # watermark of push request would let client read from replica
+    resp = client.get(url, headers={LSN_HEADER: push_lsn})
+    assert resp.status_code == 404
@@ -0,0 +1,125 @@
+# Copyright (C) Lutra Consulting Limited
+#
+# SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+
+import os
+import shutil
+import pytest
+
+from ..app import db
+from ..auth.models import User
+from ..sync.storages import FileNotFound
+from ..sync.storages.s3 import S3Storage, MIN_PART_SIZE
+from ..sync.storages.storage import StorageFile
+from ..sync.utils import generate_checksum, generate_location
+from . import test_project_dir, test_workspace_name
+from .utils import create_project, create_workspace, upload_file_to_project
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+BUCKET = "mergin-test"
+
+
+@pytest.fixture(scope="function")
+def s3_project(app):
+    with moto.mock_aws():
+        app.config["S3_BUCKET"] = BUCKET
+        app.config["S3_REGION"] = "us-east-1"
+        app.config["S3_RANGE_SIZE"] = 4
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        user = User.query.filter_by(username="mergin").first()
+        project = create_project("s3", create_workspace(), user)
+        project.storage_params = {"type": "s3", "location": generate_location()}
+        db.session.commit()
+        del project._storage
+        assert isinstance(project.storage, S3Storage)
+        yield project
+
+
+def test_s3_push_and_read(client, s3_project):
+    storage = s3_project.storage
+    upload_file_to_project(s3_project, "test.txt", client)
+    location = s3_project.files[0].location
+    assert storage.client.head_object(Bucket=BUCKET, Key=storage._key(location))
+    size = s3_project.files[0].size
+
+    # remove local cache, data are fetched from bucket (with ranged requests)
+    shutil.rmtree(storage.project_dir)
+    assert storage.file_size(location) == size
+    data = b"".join(storage.read_file(location, 3))
+    assert len(data) == size
+    assert b"".join(storage.read_file(location, 2, offset=3, length=7)) == data[3:10]
+    assert not os.path.exists(os.path.join(storage.project_dir, location))
+    assert StorageFile(storage, location).read(size) == data
+    with pytest.raises(FileNotFound):
+        storage.file_size("v1/missing.txt")
+
+    # file is streamed on download without being cached
+    resp = client.get(f"/v1/project/raw/{test_workspace_name}/s3?file=test.txt")
+    assert resp.status_code == 200
+    assert resp.data == data
+    assert resp.headers["Content-Type"] == "text/plain"
+    assert not os.path.exists(os.path.join(storage.project_dir, location))
+    resp = client.get(f"/v1/project/raw/{test_workspace_name}/s3?file=missing.txt")
+    assert resp.status_code == 404
+
+
+def test_s3_cache(client, s3_project):
+    storage = s3_project.storage
+    upload_file_to_project(s3_project, "test.txt", client)
+    upload_file_to_project(s3_project, "test3.txt", client)
+    locations = [f.location for f in s3_project.files]
+    size = sum(f.size for f in s3_project.files)
+    shutil.rmtree(storage.project_dir)
+
+    # files fetched for geodiff operations are kept locally within cache budget
+    storage.cache.max_size = size - 1
+    paths = [storage.file_path(location) for location in locations]
+    # the least recently used file was evicted from project directory
+    assert not os.path.exists(paths[0])
+    assert os.path.exists(paths[1])
+    assert os.path.samefile(
+        paths[1], storage.cache.entry_path(storage._key(locations[1]))
+    )
+    assert generate_checksum(storage.file_path(locations[0])) == generate_checksum(
+        os.path.join(test_project_dir, "test.txt")
+    )
+    assert not os.path.exists(paths[1])
+
+    storage.delete()
+    assert not os.path.exists(
+        storage.cache.entry_path(s3_project.storage_params["location"])
+    )
+
+
+def test_s3_multipart_upload(s3_project, tmp_path):
+    storage = s3_project.storage
+    parts = []
+    for i, size in enumerate([MIN_PART_SIZE, MIN_PART_SIZE, 10]):
+        part = tmp_path / f"chunk-{i}"
+        part.write_bytes(os.urandom(size))
+        parts.append(str(part))
+    location = "v1/raster.tif"
+    dest = os.path.join(storage.project_dir, location)
+    os.makedirs(os.path.dirname(dest))
+    with open(dest, "wb") as f:
+        for part in parts:
+            with open(part, "rb") as p:
+                f.write(p.read())
+
+    storage.upload_file(location, parts)
+    obj = storage.client.head_object(Bucket=BUCKET, Key=storage._key(location))
+    # etag of multipart upload contains number of parts
+    assert obj["ETag"].strip('"').endswith("-3")
+    checksum = generate_checksum(dest)
+    os.remove(dest)
+    assert generate_checksum(storage.file_path(location)) == checksum
+
+    # parts not meeting s3 limits, local file is uploaded instead
+    storage.upload_file(location, list(reversed(parts)))
+    os.remove(dest)
+    assert generate_checksum(storage.file_path(location)) == checksum
+
+    storage.delete()
+    assert "Contents" not in storage.client.list_objects_v2(Bucket=BUCKET)
@@ -20,6 +20,12 @@ from ..sync.utils import (
     check_filename,
     is_valid_path,
 )
+from ..sync.files import (
+    ChangesSchema,
+    ProjectFile,
+    PushPlan,
+    InvalidChangesError,
+)
 from ..auth.models import LoginHistory, User
 from . import json_headers
 from .utils import login
@@ -253,3 +259,68 @@ filepaths = [
 @pytest.mark.parametrize("filepath,allow", filepaths)
 def test_is_valid_path(client, filepath, allow):
     assert is_valid_path(filepath) == allow
+
+
+def test_push_plan():
+    def _file(path, size=1):
+        return {"path": path, "checksum": "1" * 40, "size": size}
+
+    project_files = {
+        path: ProjectFile(
+            path=path,
+            checksum="0" * 40,
+            size=10,
+            location=f"v1/{path}",
+            diff=None,
+            mtime=None,
+        )
+        for path in ["base.gpkg", "test.txt", "photo.jpg", ".DS_Store"]
+    }
+
+    def _plan(changes):
+        return PushPlan(
+            ChangesSchema(context={"version": 2}).load(changes), project_files
+        )
+
+    for changes, error in [
+        ({"added": [_file("test.txt")]}, "File test.txt has been already uploaded"),
+        ({"added": [_file("../test.txt")]}, "Unsupported file name detected"),
+        ({"added": [_file("run.exe")]}, "Unsupported file type detected"),
+        (
+            {"added": [_file("new.txt")], "removed": [_file("new.txt")]},
+            "Not unique changes",
+        ),
+        ({"updated": [_file("base.gpkg", 0)]}, "File base.gpkg is not valid"),
+    ]:
+        with pytest.raises(InvalidChangesError, match=error):
+            _plan(changes).validate()
+
+    plan = _plan(
+        {
+            "added": [
+                _file("new.txt", 5),
+                _file("new2.txt", 5),
+                _file(".mergin/log.txt"),
+            ],
+            "updated": [
+                _file("base.gpkg", 20),
+                _file("test.txt", 3),
+                _file("missing.gpkg"),
+            ],
+            "removed": [_file("photo.jpg", 10)],
+        }
+    )
+    plan.validate()
+    # locations of different files might be the same after their names were sanitized
+    plan.changes.added[1].location = plan.changes.added[0].location
+    plan.sanitize_locations()
+    assert len({f.location for f in plan.all_changes}) == len(plan.all_changes)
+    assert plan.remove_blacklisted([".mergin/", ".DS_Store"]) == [".mergin/log.txt"]
+    assert [f.path for f in plan.changes.added] == ["new.txt", "new2.txt"]
+    # added 10 + updated (24 - 20) - removed 10
+    assert plan.disk_usage_delta() == 4
+    assert plan.current_file("test.txt") == project_files["test.txt"]
+    assert not plan.current_file("photo.jpg")
+    updates, missing = plan.geodiff_updates()
+    assert [(u.path, c.path) for u, c in updates] == [("base.gpkg", "base.gpkg")]
+    assert missing == ["missing.gpkg"]
@@ -9,7 +9,15 @@ from sqlalchemy import null
 from ..app import db
 from ..config import Configuration
 from ..sync.interfaces import WorkspaceRole
-from ..sync.models import FileHistory, ProjectVersion, PushChangeType, ProjectFilePath
+from ..sync.models import (
+    FileHistory,
+    ProjectVersion,
+    PushChangeType,
+    ProjectFilePath,
+    Project,
+    WorkspaceStorageUsage,
+)
+from ..sync.utils import files_size
 from ..sync.workspace import GlobalWorkspaceHandler
 from .utils import add_user, login, create_project
 
@@ -115,3 +123,50 @@ def test_workspace(client):
     resp = client.get("/v1/workspace/1")
     assert resp.json["name"] == Configuration.GLOBAL_WORKSPACE
     assert resp.json["role"] == "guest"
+
+
+def test_workspace_storage_usage(app, diff_project):
+    """Workspace usage counters are maintained along with project changes"""
+    ws = diff_project.workspace
+    # counters after series of pushes incl. diff updates are in sync
+    assert WorkspaceStorageUsage.reconcile() == []
+    usage = WorkspaceStorageUsage.query.get(ws.id)
+    assert usage.disk_usage == ws.disk_usage() > 0
+    assert usage.files_size == files_size()
+    assert files_size() == WorkspaceStorageUsage.project_files_size(
+        diff_project.id
+    ) + sum(
+        WorkspaceStorageUsage.project_files_size(p.id)
+        for p in Project.query.filter(Project.id != diff_project.id)
+    )
+
+    project_usage = diff_project.disk_usage
+    project_size = WorkspaceStorageUsage.project_files_size(diff_project.id)
+    disk_usage = ws.disk_usage()
+    size = files_size()
+    diff_project.removed_at = datetime.datetime.utcnow()
+    db.session.commit()
+    assert ws.disk_usage() == disk_usage - project_usage
+    assert files_size() == size
+    diff_project.removed_at = None
+    db.session.commit()
+    assert ws.disk_usage() == disk_usage
+    # counters are updated only on commit, changes are discarded with rollback
+    diff_project.removed_at = datetime.datetime.utcnow()
+    db.session.flush()
+    assert db.session.info["workspace_usage"] == {ws.id: [-project_usage, 0]}
+    db.session.rollback()
+    assert not db.session.info["workspace_usage"]
+    db.session.commit()
+    assert ws.disk_usage() == disk_usage
+    diff_project.delete()
+    assert ws.disk_usage() == disk_usage - project_usage
+    assert files_size() == size - project_size
+    assert WorkspaceStorageUsage.reconcile() == []
+
+    # counters out of sync are fixed with reconciliation
+    usage.disk_usage += 1
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=["server", "reconcile-usage"])
+    assert f"Usage of workspaces {ws.id} was out of sync" in result.output
+    assert ws.disk_usage() == disk_usage - project_usage
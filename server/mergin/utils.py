@@ -1,14 +1,20 @@
 # Copyright (C) Lutra Consulting Limited
 #
 # SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+import base64
+import json
 import math
+import uuid
 from collections import namedtuple
-from datetime import timedelta
+from datetime import datetime, timedelta
 from enum import Enum
+from flask import abort
 from flask_sqlalchemy import Model
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, JSON, and_, or_, func, false
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import operators
 from sqlalchemy.sql.elements import UnaryExpression
-from typing import Optional
+from typing import Optional, List, Tuple, Any
 
 
 OrderParam = namedtuple("OrderParam", "name direction")
@@ -100,6 +106,120 @@ def parse_order_params(cls: Model, order_params: str, json_sort: dict = None):
     return order_by_params
 
 
+def paginate(query: Query, page: int, per_page: int) -> Tuple[List[Any], int]:
+    """Get page of query results together with total count of results in a single query.
+
+    Total is calculated with window function over the whole result set, like in flask-sqlalchemy
+    pagination page out of range aborts with 404.
+
+    :param query: query to paginate
+    :param page: page number (starting from 1)
+    :param per_page: number of items per page
+    :returns: items on page and total count
+    """
+    if page < 1:
+        abort(404)
+    rows = (
+        query.add_columns(func.count().over().label("total"))
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+        .all()
+    )
+    if not rows:
+        if page != 1:
+            abort(404)
+        return [], 0
+    total = rows[0].total
+    if len(query.column_descriptions) == 1:
+        return [row[0] for row in rows], total
+    return rows, total
+
+
+def _cursor_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _parse_cursor_value(column: Column, value):
+    """Coerce value from cursor to python type of column, so that tampered cursor is not passed to SQL"""
+    if value is None:
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type in (datetime, uuid.UUID):
+        if not isinstance(value, str):
+            raise ValueError("Invalid cursor")
+        return (
+            datetime.fromisoformat(value)
+            if python_type is datetime
+            else uuid.UUID(value)
+        )
+    # bool is subclass of int in python but not interchangeable in SQL
+    if isinstance(value, bool) != (python_type is bool):
+        raise ValueError("Invalid cursor")
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, python_type):
+        raise ValueError("Invalid cursor")
+    return value
+
+
+def encode_cursor(order_by: List[UnaryExpression], item) -> str:
+    """Encode values of order by columns of item as opaque cursor for keyset pagination"""
+    values = [_cursor_value(getattr(item, clause.element.key)) for clause in order_by]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def keyset_filter(query: Query, order_by: List[UnaryExpression], cursor: str) -> Query:
+    """Filter query for results which follow the cursor in order given by order by clauses.
+
+    Order by clauses need to identify result uniquely (e.g. to contain primary key as the last one).
+    Null values are expected in PostgreSQL default order, last in ascending and first in descending order.
+
+    :param query: query to filter
+    :param order_by: order by clauses on table columns, e.g. from get_order_param
+    :param cursor: cursor created by encode_cursor from the last item of previous page
+    :returns: filtered query
+    :raises ValueError: for invalid cursor
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(order_by):
+        raise ValueError("Invalid cursor")
+
+    conditions = []
+    ties = []
+    for clause, value in zip(order_by, values):
+        column = clause.element
+        try:
+            value = _parse_cursor_value(column, value)
+        except ValueError as e:
+            raise ValueError("Invalid cursor") from e
+        descending = clause.modifier is operators.desc_op
+        if value is None:
+            # nulls are last in ascending order and first in descending
+            after = column.isnot(None) if descending else None
+            tie = column.is_(None)
+        else:
+            after = (
+                column < value if descending else or_(column > value, column.is_(None))
+            )
+            tie = column == value
+        if after is not None:
+            conditions.append(and_(*ties, after))
+        ties.append(tie)
+    if not conditions:
+        return query.filter(false())
+    return query.filter(or_(*conditions))
+
+
 def format_time_delta(delta: timedelta) -> str:
     """Format timedelta difference approximately in days or hours"""
     days = round(delta.total_seconds() / (24 * 3600))
@@ -0,0 +1,56 @@
+"""Add file diff squash table
+
+Revision ID: 3e8a61c0d52f
+Revises: 7f2d3c1a9b4e
+Create Date: 2026-10-17 11:03:48.207115
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3e8a61c0d52f"
+down_revision = "7f2d3c1a9b4e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "file_diff_squash",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("file_path_id", sa.BigInteger(), nullable=False),
+        sa.Column("start", sa.Integer(), nullable=False),
+        sa.Column("end", sa.Integer(), nullable=False),
+        sa.Column("location", sa.String(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("checksum", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["file_path_id"],
+            ["project_file_path.id"],
+            name=op.f("fk_file_diff_squash_file_path_id_project_file_path"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_file_diff_squash")),
+        sa.UniqueConstraint(
+            "file_path_id",
+            "start",
+            "end",
+            name=op.f("uq_file_diff_squash_file_path_id"),
+        ),
+    )
+    op.create_index(
+        op.f("ix_file_diff_squash_file_path_id"),
+        "file_diff_squash",
+        ["file_path_id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_file_diff_squash_file_path_id"), table_name="file_diff_squash"
+    )
+    op.drop_table("file_diff_squash")
@@ -0,0 +1,29 @@
+"""Add file history keyframe
+
+Revision ID: 7f2d3c1a9b4e
+Revises: 5ad13be6f7ef
+Create Date: 2026-10-17 09:12:31.418203
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7f2d3c1a9b4e"
+down_revision = "5ad13be6f7ef"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "file_history",
+        sa.Column("keyframe", sa.Boolean(), server_default=sa.false(), nullable=False),
+    )
+    op.alter_column("file_history", "keyframe", server_default=None)
+
+
+def downgrade():
+    op.drop_column("file_history", "keyframe")
@@ -0,0 +1,64 @@
+"""Add push job table
+
+Revision ID: b6e2f4a81c93
+Revises: 3e8a61c0d52f
+Create Date: 2026-10-17 13:21:05.482913
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "b6e2f4a81c93"
+down_revision = "3e8a61c0d52f"
+branch_labels = None
+depends_on = None
+
+push_job_status_type = postgresql.ENUM(
+    "queued", "running", "finished", "failed", name="push_job_status"
+)
+
+
+def upgrade():
+    op.create_table(
+        "push_job",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("upload_id", sa.String(), nullable=False),
+        sa.Column("project_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("status", push_job_status_type, nullable=False),
+        sa.Column("files", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created", sa.DateTime(), nullable=True),
+        sa.Column("finished", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["project_id"],
+            ["project.id"],
+            name=op.f("fk_push_job_project_id_project"),
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+            name=op.f("fk_push_job_user_id_user"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_push_job")),
+    )
+    op.create_index(
+        op.f("ix_push_job_project_id"), "push_job", ["project_id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_push_job_upload_id"), "push_job", ["upload_id"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_push_job_upload_id"), table_name="push_job")
+    op.drop_index(op.f("ix_push_job_project_id"), table_name="push_job")
+    op.drop_table("push_job")
+    push_job_status_type.drop(op.get_bind())
@@ -0,0 +1,31 @@
+"""Add file history diff summary
+
+Revision ID: c4d9a2e7f310
+Revises: b6e2f4a81c93
+Create Date: 2026-10-17 14:02:44.913560
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "c4d9a2e7f310"
+down_revision = "b6e2f4a81c93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "file_history",
+        sa.Column(
+            "diff_summary", postgresql.JSONB(astext_type=sa.Text()), nullable=True
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("file_history", "diff_summary")
@@ -0,0 +1,25 @@
+"""Add WAL position of finished push job
+
+Revision ID: c7d9e3f52a16
+Revises: f3b8d6a41c95
+Create Date: 2026-10-17 22:04:51.118236
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c7d9e3f52a16"
+down_revision = "f3b8d6a41c95"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("push_job", sa.Column("lsn", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("push_job", "lsn")
@@ -0,0 +1,37 @@
+"""Add project version manifest table
+
+Revision ID: d81f5b3c6a27
+Revises: c4d9a2e7f310
+Create Date: 2026-10-17 15:26:12.604382
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "d81f5b3c6a27"
+down_revision = "c4d9a2e7f310"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "project_version_manifest",
+        sa.Column("version_id", sa.Integer(), nullable=False),
+        sa.Column("file_history_ids", postgresql.ARRAY(sa.BIGINT()), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["version_id"],
+            ["project_version.id"],
+            name=op.f("fk_project_version_manifest_version_id_project_version"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("version_id", name=op.f("pk_project_version_manifest")),
+    )
+
+
+def downgrade():
+    op.drop_table("project_version_manifest")
@@ -0,0 +1,79 @@
+"""Add workspace storage usage table
+
+Revision ID: e5a7c19b2d48
+Revises: d81f5b3c6a27
+Create Date: 2026-10-17 18:02:41.118273
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "e5a7c19b2d48"
+down_revision = "d81f5b3c6a27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "workspace_storage_usage",
+        sa.Column("workspace_id", sa.Integer(), nullable=False),
+        sa.Column("disk_usage", postgresql.BIGINT(), nullable=False),
+        sa.Column("files_size", postgresql.BIGINT(), nullable=False),
+        sa.PrimaryKeyConstraint(
+            "workspace_id", name=op.f("pk_workspace_storage_usage")
+        ),
+    )
+
+    conn = op.get_bind()
+    conn.execute(
+        """
+        WITH history AS (
+            SELECT
+                p.workspace_id,
+                SUM(
+                    CASE fh.change
+                        WHEN 'update_diff' THEN COALESCE((fh.diff ->> 'size')::bigint, 0)
+                        WHEN 'delete' THEN 0
+                        ELSE fh.size
+                    END
+                ) AS size
+            FROM file_history fh
+            INNER JOIN project_file_path fp ON fp.id = fh.file_path_id
+            INNER JOIN project p ON p.id = fp.project_id
+            GROUP BY p.workspace_id
+        ), latest AS (
+            SELECT
+                p.workspace_id,
+                SUM(fh.size) AS size
+            FROM latest_project_files lpf
+            INNER JOIN project p ON p.id = lpf.project_id
+            CROSS JOIN unnest(lpf.file_history_ids) AS files_ids(fh_id)
+            INNER JOIN file_history fh ON fh.id = files_ids.fh_id
+            WHERE fh.change = 'update_diff'
+            GROUP BY p.workspace_id
+        ), projects AS (
+            SELECT
+                workspace_id,
+                COALESCE(SUM(disk_usage) FILTER (WHERE removed_at IS NULL), 0) AS disk_usage
+            FROM project
+            GROUP BY workspace_id
+        )
+        INSERT INTO workspace_storage_usage (workspace_id, disk_usage, files_size)
+        SELECT
+            p.workspace_id,
+            p.disk_usage,
+            COALESCE(h.size, 0) + COALESCE(l.size, 0)
+        FROM projects p
+        LEFT OUTER JOIN history h USING (workspace_id)
+        LEFT OUTER JOIN latest l USING (workspace_id);
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("workspace_storage_usage")
@@ -0,0 +1,59 @@
+"""Add project files summary
+
+Revision ID: f3b8d6a41c95
+Revises: e5a7c19b2d48
+Create Date: 2026-10-17 20:11:37.402851
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f3b8d6a41c95"
+down_revision = "e5a7c19b2d48"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "project",
+        sa.Column("has_conflict", sa.Boolean(), nullable=False, server_default="false"),
+    )
+    op.add_column(
+        "project",
+        sa.Column("qgis_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+    conn = op.get_bind()
+    conn.execute(
+        sa.text(
+            """
+        WITH summary AS (
+            SELECT
+                lpf.project_id,
+                COALESCE(bool_or(fp.path ~ :conflict_regex), FALSE) AS has_conflict,
+                count(fp.id) FILTER (WHERE lower(fp.path) LIKE '%.qgs' OR lower(fp.path) LIKE '%.qgz') AS qgis_count
+            FROM latest_project_files lpf
+            CROSS JOIN unnest(lpf.file_history_ids) AS files_ids(fh_id)
+            INNER JOIN file_history fh ON fh.id = files_ids.fh_id
+            INNER JOIN project_file_path fp ON fp.id = fh.file_path_id
+            GROUP BY lpf.project_id
+        )
+        UPDATE project p
+        SET
+            has_conflict = s.has_conflict,
+            qgis_count = s.qgis_count
+        FROM summary s
+        WHERE s.project_id = p.id;
+        """
+        ),
+        conflict_regex=r"(\.gpkg|\.qgs|.qgz)(.*conflict.*)|( \(.*conflict.*)",
+    )
+
+
+def downgrade():
+    op.drop_column("project", "qgis_count")
+    op.drop_column("project", "has_conflict")
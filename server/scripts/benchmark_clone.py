@@ -0,0 +1,103 @@
+# Copyright (C) Lutra Consulting Limited
+#
+# SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+
+"""
+Benchmark of methods used to clone project files on synthetic project.
+
+Usage (from server directory):
+    python scripts/benchmark_clone.py --dir /data/benchmark --files 1000 --size 512
+
+Directory should be on the same filesystem as LOCAL_PROJECTS to get relevant results.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gevent import get_hub  # noqa: E402
+from mergin.sync.storages.disk import (  # noqa: E402
+    copy_file,
+    reflink_file,
+    link_file,
+    _copy_file,
+)
+
+
+def create_project(directory, files, size):
+    """Create synthetic project with files of random content and size up to `size` kB"""
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"dir_{i % 10}", f"file_{i}.bin")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(os.urandom(1024 * (1 + i % size)))
+        paths.append(path)
+    return paths
+
+
+def legacy_copy(src, dest):
+    copy_file(src, dest)
+    return True
+
+
+def threaded(method):
+    def _clone(files):
+        pool = get_hub().threadpool
+        jobs = [pool.spawn(method, src, dest) for src, dest in files]
+        return all(job.get() for job in jobs)
+
+    return _clone
+
+
+def threaded_copy(src, dest):
+    _copy_file(src, dest)
+    return True
+
+
+METHODS = {
+    "copy_file (sequential)": lambda files: all(legacy_copy(*f) for f in files),
+    "copy (threaded)": threaded(threaded_copy),
+    "hardlink": threaded(link_file),
+    "reflink": threaded(reflink_file),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dir", required=True, help="working directory")
+    parser.add_argument("--files", type=int, default=1000, help="number of files")
+    parser.add_argument("--size", type=int, default=512, help="max file size in kB")
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.abspath(args.dir), str(uuid.uuid4()))
+    src_dir = os.path.join(root, "src")
+    sources = create_project(src_dir, args.files, args.size)
+    total_size = sum(os.path.getsize(f) for f in sources)
+    print(f"Project with {len(sources)} files of total size {total_size} bytes")
+    try:
+        for name, method in METHODS.items():
+            dest_dir = os.path.join(root, "dest")
+            files = [
+                (src, os.path.join(dest_dir, os.path.relpath(src, src_dir)))
+                for src in sources
+            ]
+            start = time.time()
+            supported = method(files)
+            duration = time.time() - start
+            if supported:
+                print(f"{name}: {duration:.3f} s")
+            else:
+                print(f"{name}: not supported")
+            shutil.rmtree(dest_dir)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Copyright (C) Lutra Consulting Limited
+#
+# SPDX-License-Identifier: AGPL-3.0-only OR LicenseRef-MerginMaps-Commercial
+
+"""
+Benchmark of project version creation (database part of push finish) for pushes with many files.
+
+Usage (from server directory, with database configured in environment):
+    python scripts/benchmark_push.py --files 1000 10000 100000
+
+Synthetic projects are created in a transaction which is rolled back at the end, nothing is persisted.
+Only metadata is written to the database, no files are created on disk.
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flask import current_app  # noqa: E402
+from mergin.app import create_app, db  # noqa: E402
+from mergin.auth.models import User  # noqa: E402
+from mergin.sync.files import ChangesSchema  # noqa: E402
+from mergin.sync.models import Project, ProjectVersion, ProjectRole  # noqa: E402
+from mergin.sync.utils import generate_location  # noqa: E402
+
+
+def file_meta(i, version):
+    return {
+        "path": f"photos/dir_{i % 100}/img_{i}.jpg",
+        "checksum": uuid.uuid4().hex + "0" * 8,
+        "size": 1024 * (1 + i % 512),
+        "location": f"v{version}/photos/dir_{i % 100}/img_{i}.jpg",
+    }
+
+
+def create_version(project, author, changes):
+    version = project.next_version()
+    upload_changes = ChangesSchema(context={"version": version}).load(changes)
+    start = time.time()
+    pv = ProjectVersion(project, version, author.id, upload_changes, "127.0.0.1")
+    db.session.add(pv)
+    db.session.flush()
+    return time.time() - start
+
+
+def benchmark(files, author):
+    workspace = current_app.ws_handler.get_preferred(author)
+    project = Project(
+        name=f"benchmark-{uuid.uuid4()}",
+        storage_params={"type": "local", "location": generate_location()},
+        creator=author,
+        workspace=workspace,
+    )
+    project.set_role(author.id, ProjectRole.OWNER)
+    db.session.add(project)
+    db.session.flush()
+    create_version(project, author, {})
+
+    initial = create_version(
+        project, author, {"added": [file_meta(i, 1) for i in range(files)]}
+    )
+    # follow-up push touching every tenth file
+    changed = range(0, files, 10)
+    update = create_version(
+        project,
+        author,
+        {
+            "updated": [file_meta(i, 2) for i in changed],
+            "removed": [file_meta(i + 1, 1) for i in changed if i + 1 < files],
+            "added": [file_meta(files + i, 2) for i in changed],
+        },
+    )
+    return initial, update
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--files",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="number of files in pushes",
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        author = User.query.filter_by(active=True).first()
+        if not author:
+            sys.exit("At least one active user is needed to run benchmark")
+        try:
+            for files in args.files:
+                initial, update = benchmark(files, author)
+                print(
+                    f"{files} files: initial push {initial:.3f} s, "
+                    f"update of {len(range(0, files, 10))} files {update:.3f} s"
+                )
+        finally:
+            db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()